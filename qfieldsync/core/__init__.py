@@ -1,4 +1,7 @@
-from .layer import LayerSource  # NOQA
+from .layer_inventory import LayerInventory  # NOQA
+from .layer import LayerSource, apply_action_to_layers  # NOQA
+from .copy_planner import CopyPlanner  # NOQA
 from .project import ProjectConfiguration  # NOQA
 from .preferences import Preferences  # NOQA
 from .offline_converter import OfflineConverter  # NOQA
+from .sync_engine import SyncEngine  # NOQA
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+
+import qgis
+
+
+class BulkMutation(object):
+    """
+    Applies many changes to the layers of a project with as few signals as possible.
+
+    While the context is open, the map canvases are frozen, layers to remove are collected and
+    removed in a single `removeMapLayers()` call when the context is left, and custom properties
+    and editor widgets are changed with the signals of the layer blocked. The canvases are
+    refreshed once at the end.
+
+    Only meant for changes nobody needs to react to one by one, like the changes made to the
+    project while it is packaged.
+    """
+
+    def __init__(self, project, canvases=None):
+        """
+        :param project: The project to change
+        :param canvases: The map canvases to freeze, all the canvases of the QGIS interface if None
+        """
+        self.project = project
+        self.canvases = canvases if canvases is not None else self._interface_canvases()
+        self.removed_layer_ids = list()
+        self.seconds = 0.0
+        self._frozen_canvases = list()
+        self._start = None
+
+    @staticmethod
+    def _interface_canvases():
+        iface = getattr(getattr(qgis, 'utils', None), 'iface', None)
+        if iface is None:
+            return []
+        return list(iface.mapCanvases())
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        for canvas in self.canvases:
+            if not canvas.isFrozen():
+                canvas.freeze(True)
+                self._frozen_canvases.append(canvas)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            for canvas in self._frozen_canvases:
+                canvas.freeze(False)
+                canvas.refresh()
+            self._frozen_canvases = list()
+            self.seconds += time.monotonic() - self._start
+
+    def remove_layer(self, layer_id):
+        """
+        Remove a layer from the project when the context is left.
+        """
+        self.removed_layer_ids.append(layer_id)
+
+    def remove_layers(self, layer_ids):
+        self.removed_layer_ids.extend(layer_ids)
+
+    def set_custom_property(self, layer, key, value):
+        blocked = layer.blockSignals(True)
+        try:
+            layer.setCustomProperty(key, value)
+        finally:
+            layer.blockSignals(blocked)
+
+    def set_editor_widget_setup(self, layer, index, setup):
+        blocked = layer.blockSignals(True)
+        try:
+            layer.setEditorWidgetSetup(index, setup)
+        finally:
+            layer.blockSignals(blocked)
+
+    def flush(self):
+        """
+        Remove the collected layers now.
+        """
+        if self.removed_layer_ids:
+            self.project.removeMapLayers(self.removed_layer_ids)
+            self.removed_layer_ids = list()
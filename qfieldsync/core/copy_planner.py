@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from collections import OrderedDict
+
+from qgis.core import QgsMapLayer, QgsProject
+
+from qfieldsync.core.layer import value_relation_field_names
+from qfieldsync.utils.file_utils import DirectoryIndex
+
+
+class CopyPlanner(object):
+    """
+    Groups the layers to copy by the physical file they are read from and copies every file only once.
+
+    Layers are collected with `add()` and copied on `execute()`. All the layers of a group
+    are pointed to the single copy of their source file.
+    """
+
+    def __init__(self, target_path, extent=None, raster_exporter=None, directory_index=None, journal=None,
+                 deferred=False, target_crs=None, reproject_rasters=False):
+        """
+        :param target_path: A path to a folder into which the data will be copied
+        :param extent: if set, only the data within this extent (in project CRS) will be copied
+        :param raster_exporter: if set, rasters to optimize are written by this RasterExporter
+        :param directory_index: if set, the DirectoryIndex used to look up sidecar files
+        :param journal: if set, the PackageJournal recording the copied files
+        :param deferred: if True, the datasources of the copied layers are only changed by `apply()`, so
+                         `execute()` can run outside of the main thread
+        :param target_crs: if set, the QgsCoordinateReferenceSystem vector layers are reprojected to while copied
+        :param reproject_rasters: if True, rasters are reprojected to the target CRS as well
+        """
+        self.target_path = target_path
+        self.extent = extent
+        self.raster_exporter = raster_exporter
+        self.directory_index = directory_index or DirectoryIndex()
+        self.journal = journal
+        self.target_crs = target_crs
+        self.reproject_rasters = reproject_rasters
+        self.data_source_changes = list() if deferred else None
+        if raster_exporter is not None and deferred:
+            raster_exporter.data_source_changes = self.data_source_changes
+        self.copied_files = dict()
+        # the files written so far, layers of the same source may write into the same file in different modes
+        self.written_files = set()
+        # layer id -> names of the fields to keep, None if all of them are kept
+        self.kept_field_names = dict()
+        self._value_relation_fields = None
+        self._groups = OrderedDict()
+
+    def add(self, layer_source, keep_existent=False):
+        """
+        Schedule the copy of a layer.
+
+        :param layer_source: The LayerSource of the layer
+        :param keep_existent: if True and target file already exists, keep it as it is
+        """
+        # the project is read now, on the main thread
+        self.compute_kept_field_names(layer_source)
+
+        if layer_source.is_file:
+            path = os.path.normcase(os.path.realpath(layer_source.source_file_path))
+        else:
+            # not copied, still handed to copy() which ignores it
+            path = layer_source.layer.id()
+
+        self._groups.setdefault(path, list()).append((layer_source, keep_existent))
+
+    def compute_kept_field_names(self, layer_source):
+        """
+        The names of the fields of a layer to keep, None if all of them are kept.
+
+        Computed once per layer, the value relations of the project are looked up once for all the layers.
+        """
+        layer_id = layer_source.layer.id()
+        if layer_id not in self.kept_field_names:
+            if self._value_relation_fields is None and layer_source.prune_fields:
+                self._value_relation_fields = value_relation_field_names(QgsProject.instance())
+            self.kept_field_names[layer_id] = layer_source.kept_field_names(
+                value_relation_fields=self._value_relation_fields)
+        return self.kept_field_names[layer_id]
+
+    @property
+    def layer_count(self):
+        return sum(len(group) for group in self._groups.values())
+
+    @property
+    def file_count(self):
+        return len(self._groups)
+
+    def execute(self, progress_callback=None):
+        """
+        Copy the scheduled layers, file by file.
+
+        :param progress_callback: called with (done, total, layer_name) before a layer is copied
+        :return: The number of bytes which have not been copied because layers share files
+        """
+        done = 0
+        total = self.layer_count
+        for group in self._groups.values():
+            # if any layer asks for a fresh copy, the shared file is copied again
+            for layer_source, keep_existent in sorted(group, key=lambda item: item[1]):
+                if progress_callback:
+                    progress_callback(done, total, layer_source.name)
+
+                target_crs = self.target_crs
+                if layer_source.layer.type() == QgsMapLayer.RasterLayer and not self.reproject_rasters:
+                    target_crs = None
+                layer_source.copy(self.target_path, self.copied_files, keep_existent, self.extent,
+                                  self.raster_exporter, self.directory_index, self.journal,
+                                  self.data_source_changes, target_crs, self.written_files, self.kept_field_names)
+                done += 1
+
+        self._groups = OrderedDict()
+        return self.bytes_saved
+
+    def apply(self, mutation=None):
+        """
+        Change the datasources of the copied layers, if the planner is deferred. Must be called on the main thread.
+
+        Layers whose data has not been written are removed from the project.
+
+        :param mutation: if set, the BulkMutation the layers are removed with
+        :return: The ids of the removed layers
+        """
+        if not self.data_source_changes:
+            return []
+
+        removed_layer_ids = list()
+        for layer_source, new_source in self.data_source_changes:
+            if new_source is None:
+                removed_layer_ids.append(layer_source.layer.id())
+            else:
+                layer_source.change_data_source(new_source)
+        self.data_source_changes.clear()
+
+        if removed_layer_ids:
+            if mutation is not None:
+                mutation.remove_layers(removed_layer_ids)
+            else:
+                QgsProject.instance().removeMapLayers(removed_layer_ids)
+        return removed_layer_ids
+
+    @property
+    def bytes_saved(self):
+        """
+        The number of bytes which have not been copied because layers share files
+        """
+        return sum(copied['size'] * (copied['layer_count'] - 1) for copied in self.copied_files.values())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsFeatureRequest, QgsVectorLayer
+
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+
+class GeometryReducer(object):
+    """
+    Simplifies geometries and snaps their coordinates to a grid, to make packaged layers smaller and faster to render.
+
+    Simplification preserves the topology of every single geometry (GEOS topology preserving simplifier),
+    geometries which would collapse are kept as they are. The tolerance and the grid size are in the
+    units of the CRS of the packaged layer.
+    """
+
+    # The number of features read and written at once
+    BATCH_SIZE = 5000
+
+    def __init__(self, simplify_tolerance=0.0, coordinate_precision=0.0):
+        """
+        :param simplify_tolerance: The maximum distance a simplified geometry may deviate from the original, 0 to keep all vertices
+        :param coordinate_precision: The size of the grid coordinates are snapped to, 0 to keep the coordinates
+        """
+        self.simplify_tolerance = simplify_tolerance or 0.0
+        self.coordinate_precision = coordinate_precision or 0.0
+
+    @property
+    def is_active(self):
+        return self.simplify_tolerance > 0 or self.coordinate_precision > 0
+
+    def reduce(self, geometry):
+        """
+        :return: The reduced copy of a QgsGeometry
+        """
+        if geometry.isNull() or geometry.isEmpty():
+            return geometry
+
+        reduced = geometry
+        if self.simplify_tolerance > 0:
+            simplified = reduced.simplify(self.simplify_tolerance)
+            if not simplified.isNull() and not simplified.isEmpty():
+                reduced = simplified
+        if self.coordinate_precision > 0:
+            snapped = reduced.snappedToGrid(self.coordinate_precision, self.coordinate_precision)
+            if not snapped.isNull() and not snapped.isEmpty():
+                reduced = snapped
+        return reduced
+
+    @staticmethod
+    def sample(layer, sample_size=500):
+        """
+        Read the geometries of the first features of a layer, to estimate the effect of a reduction.
+
+        :param layer: The QgsVectorLayer
+        :param sample_size: The number of features to read
+        :return: A tuple with the list of sampled QgsGeometry and the number of features of the layer
+        """
+        request = QgsFeatureRequest().setNoAttributes().setLimit(sample_size)
+        geometries = [feature.geometry() for feature in layer.getFeatures(request)]
+        return geometries, max(layer.featureCount(), len(geometries))
+
+    def estimate(self, geometries, feature_count):
+        """
+        Estimate the size of the geometries of a layer before and after the reduction from a sample.
+
+        :param geometries: The sampled geometries, as returned by `sample()`
+        :param feature_count: The number of features of the layer
+        :return: A tuple with the estimated size in bytes of the geometries before and after the reduction
+        """
+        if not geometries:
+            return 0, 0
+
+        before = 0
+        after = 0
+        for geometry in geometries:
+            if geometry.isNull():
+                continue
+            before += len(geometry.asWkb())
+            after += len(self.reduce(geometry).asWkb())
+
+        factor = feature_count / len(geometries)
+        return int(before * factor), int(after * factor)
+
+    def apply(self, source, provider='ogr', progress_callback=None):
+        """
+        Reduce the geometries of a packaged layer in place, batch by batch.
+
+        The features are written through the data provider, the changes are not recorded by the offline editing.
+        Safe to call outside of the main thread.
+
+        :param source: The datasource of the layer
+        :param provider: The name of the data provider
+        :param progress_callback: called with (done, total) after every batch
+        :return: A tuple with the size in bytes of the geometries before and after the reduction
+        """
+        layer = QgsVectorLayer(source, 'reduced', provider)
+        if not layer.isValid():
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Could not open layer {} to reduce its geometries').format(source))
+
+        data_provider = layer.dataProvider()
+        # all the features of a batch are read before they are written, no iterator is open while writing
+        feature_ids = sorted(data_provider.allFeatureIds())
+        before = 0
+        after = 0
+        for start in range(0, len(feature_ids), self.BATCH_SIZE):
+            request = QgsFeatureRequest().setFilterFids(feature_ids[start:start + self.BATCH_SIZE]).setNoAttributes()
+            changes = dict()
+            for feature in data_provider.getFeatures(request):
+                geometry = feature.geometry()
+                if geometry.isNull():
+                    continue
+                reduced = self.reduce(geometry)
+                before += len(geometry.asWkb())
+                after += len(reduced.asWkb())
+                changes[feature.id()] = reduced
+
+            if changes and not data_provider.changeGeometryValues(changes):
+                raise QFieldSyncError(
+                    QCoreApplication.translate('QFieldSync', 'Could not write the reduced geometries of layer {}').format(source))
+
+            if progress_callback:
+                progress_callback(min(start + self.BATCH_SIZE, len(feature_ids)), len(feature_ids))
+
+        return before, after
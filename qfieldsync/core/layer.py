@@ -5,8 +5,13 @@ import json
 from qgis.PyQt.QtXml import QDomDocument
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.core import (
+    QgsAttributeEditorElement,
+    QgsCoordinateTransform,
     QgsDataSourceUri,
+    QgsEditFormConfig,
+    QgsExpression,
     QgsMapLayer,
+    QgsMessageLog,
     QgsReadWriteContext,
     QgsProject,
     QgsProviderRegistry,
@@ -14,7 +19,12 @@ from qgis.core import (
     Qgis
 )
 
-from qfieldsync.utils.file_utils import slugify
+from qfieldsync.core.geometry_reducer import GeometryReducer
+from qfieldsync.core.layer_inventory import LayerInventory
+from qfieldsync.core.project import ProjectConfiguration
+from qfieldsync.utils.file_utils import DirectoryIndex, slugify
+from qfieldsync.utils.gdal_utils import clip_raster, clip_vector, optimize_raster, vector_driver_name
+from qfieldsync.utils.gpkg_utils import extract_tables
 
 
 # When copying files, if any of the extension in any of the groups is found,
@@ -28,22 +38,41 @@ file_extension_groups = [
 ]
 
 
+# Extension to the group it belongs to. Extensions in several groups (.dbf) belong to the first one.
+file_extension_group_by_extension = {
+    extension: group for group in reversed(file_extension_groups) for extension in group
+}
+
+
 def get_file_extension_group(filename):
     """
     Return the basename and an extension group (if applicable)
 
+    The longest known extension wins, extensions are matched case insensitively.
+
     Examples:
          airports.shp -> 'airport', ['.shp', '.shx', '.dbf', '.sbx', '.sbn', '.shp.xml']
          forests.gpkg -> 'forests', ['.gpkg']
     """
-    for group in file_extension_groups:
-        for extension in group:
-            if filename.endswith(extension):
-                return filename[:-len(extension)], group
+    lower_filename = filename.lower()
+    position = lower_filename.find('.')
+    while position != -1:
+        group = file_extension_group_by_extension.get(lower_filename[position:])
+        if group is not None:
+            return filename[:position], group
+        position = lower_filename.find('.', position + 1)
+
     basename, ext = os.path.splitext(filename)
     return basename, [ext]
 
 
+def written_file_key(path):
+    """
+    Return the key of a written file in the written_files set of `LayerSource.copy()`
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
 class SyncAction(object):
     """
     Enumeration of sync actions
@@ -76,23 +105,24 @@ class LayerSource(object):
         self._action = None
         self._photo_naming = {}
         self._is_geometry_locked = None
+        self._optimize_raster = None
+        self._simplify_tolerance = None
+        self._coordinate_precision = None
+        self._prune_fields = None
+        # the CRS of the copied data, if it has been reprojected by `copy()`
+        self.copied_crs = None
         self.read_layer()
 
-        self.storedInlocalizedDataPath = False
-        if self.layer.dataProvider() is not None:
-            pathResolver = QgsProject.instance().pathResolver()
-            metadata = QgsProviderRegistry.instance().providerMetadata(self.layer.dataProvider().name())
-            if metadata is not None:
-                decoded = metadata.decodeUri(self.layer.source())
-                if "path" in decoded:
-                    path = pathResolver.writePath(decoded["path"])
-                    if path.startswith("localized:"):
-                        self.storedInlocalizedDataPath = True
+        self.storedInlocalizedDataPath = self.inventory_entry.is_localized
 
     def read_layer(self):
         self._action = self.layer.customProperty('QFieldSync/action')
         self._photo_naming = json.loads(self.layer.customProperty('QFieldSync/photo_naming') or '{}')
         self._is_geometry_locked = self.layer.customProperty('QFieldSync/is_geometry_locked', False)
+        self._optimize_raster = self.layer.customProperty('QFieldSync/optimize_raster', False)
+        self._simplify_tolerance = float(self.layer.customProperty('QFieldSync/simplify_tolerance', 0) or 0)
+        self._coordinate_precision = float(self.layer.customProperty('QFieldSync/coordinate_precision', 0) or 0)
+        self._prune_fields = self.layer.customProperty('QFieldSync/prune_fields', False)
 
     def apply(self):
         self.layer.setCustomProperty('QFieldSync/action', self.action)
@@ -104,6 +134,29 @@ class LayerSource(object):
         else:
             self.layer.removeCustomProperty('QFieldSync/is_geometry_locked')
 
+        if self.optimize_raster:
+            self.layer.setCustomProperty('QFieldSync/optimize_raster', True)
+        else:
+            self.layer.removeCustomProperty('QFieldSync/optimize_raster')
+
+        if self.simplify_tolerance > 0:
+            self.layer.setCustomProperty('QFieldSync/simplify_tolerance', self.simplify_tolerance)
+        else:
+            self.layer.removeCustomProperty('QFieldSync/simplify_tolerance')
+
+        if self.coordinate_precision > 0:
+            self.layer.setCustomProperty('QFieldSync/coordinate_precision', self.coordinate_precision)
+        else:
+            self.layer.removeCustomProperty('QFieldSync/coordinate_precision')
+
+        if self.prune_fields:
+            self.layer.setCustomProperty('QFieldSync/prune_fields', True)
+        else:
+            self.layer.removeCustomProperty('QFieldSync/prune_fields')
+
+        # layer properties do not mark the project dirty
+        ProjectConfiguration.mark_written(QgsProject.instance())
+
     @property
     def action(self):
         if self._action is None:
@@ -136,16 +189,13 @@ class LayerSource(object):
     def is_configured(self):
         return self._action is not None
 
+    @property
+    def inventory_entry(self):
+        return LayerInventory.instance().entry(self.layer)
+
     @property
     def is_file(self):
-        if self.layer.dataProvider() is not None:
-            metadata = QgsProviderRegistry.instance().providerMetadata(self.layer.dataProvider().name())
-            if metadata is not None:
-                decoded = metadata.decodeUri(self.layer.source())
-                if "path" in decoded:
-                    if os.path.isfile(decoded["path"]):
-                        return True
-        return False
+        return self.inventory_entry.is_file
 
     @property
     def available_actions(self):
@@ -184,6 +234,116 @@ class LayerSource(object):
     def is_geometry_locked(self, is_geometry_locked):
         self._is_geometry_locked = is_geometry_locked
 
+    @property
+    def can_optimize_raster(self):
+        """
+        Whether the layer is a GeoTIFF which can be rewritten as a cloud optimized GeoTIFF when copied
+        """
+        if self.layer.type() != QgsMapLayer.RasterLayer or not self.can_clip:
+            return False
+
+        return os.path.splitext(self.layer.source())[1].lower() in ('.tif', '.tiff')
+
+    @property
+    def optimize_raster(self):
+        return bool(self._optimize_raster)
+
+    @optimize_raster.setter
+    def optimize_raster(self, optimize_raster):
+        self._optimize_raster = optimize_raster
+
+    @property
+    def can_reduce_geometries(self):
+        """
+        Whether the geometries of the layer can be simplified and snapped to a grid when packaged
+        """
+        return self.layer.type() == QgsMapLayer.VectorLayer and self.layer.isSpatial()
+
+    @property
+    def simplify_tolerance(self):
+        return self._simplify_tolerance or 0.0
+
+    @simplify_tolerance.setter
+    def simplify_tolerance(self, simplify_tolerance):
+        self._simplify_tolerance = simplify_tolerance
+
+    @property
+    def coordinate_precision(self):
+        return self._coordinate_precision or 0.0
+
+    @coordinate_precision.setter
+    def coordinate_precision(self, coordinate_precision):
+        self._coordinate_precision = coordinate_precision
+
+    @property
+    def geometry_reducer(self):
+        """
+        The GeometryReducer applied to the packaged data of the layer, None if the geometries are kept as they are
+        """
+        if not self.can_reduce_geometries:
+            return None
+        reducer = GeometryReducer(self.simplify_tolerance, self.coordinate_precision)
+        return reducer if reducer.is_active else None
+
+    @property
+    def can_prune_fields(self):
+        return self.layer.type() == QgsMapLayer.VectorLayer
+
+    @property
+    def prune_fields(self):
+        return bool(self._prune_fields)
+
+    @prune_fields.setter
+    def prune_fields(self, prune_fields):
+        self._prune_fields = prune_fields
+
+    def kept_field_names(self, project=None, value_relation_fields=None):
+        """
+        Return the names of the fields packaged if the fields are pruned, None if all of them are packaged.
+
+        Kept are the fields of the attribute form, the fields of the display expression, the primary keys,
+        the fields of the relations of the layer and the keys and values other layers look up with value relations.
+
+        :param project: The project of the layer, the current project if None
+        :param value_relation_fields: The result of `value_relation_field_names()` for the project, looked up
+                                      if None. Pass it when computing the fields of many layers
+        """
+        if not self.prune_fields or not self.can_prune_fields:
+            return None
+
+        project = project or QgsProject.instance()
+        fields = self.layer.fields()
+        names = set()
+
+        form_config = self.layer.editFormConfig()
+        if form_config.layout() == QgsEditFormConfig.TabLayout:
+            containers = [form_config.invisibleRootContainer()]
+            while containers:
+                for element in containers.pop().children():
+                    if element.type() == QgsAttributeEditorElement.AeTypeField:
+                        names.add(element.name())
+                    elif element.type() == QgsAttributeEditorElement.AeTypeContainer:
+                        containers.append(element)
+        else:
+            names.update(field.name() for field in fields if field.editorWidgetSetup().type() != 'Hidden')
+
+        names.update(QgsExpression(self.layer.displayExpression()).referencedColumns())
+        names.update(fields[index].name() for index in self.layer.primaryKeyAttributes())
+        names.update(name for name in (self.layer.customProperty('QFieldSync/sourceDataPrimaryKeys') or '').split(',') if name)
+
+        relation_manager = project.relationManager()
+        for relation in relation_manager.referencingRelations(self.layer):
+            names.update(relation.fieldPairs().keys())
+        for relation in relation_manager.referencedRelations(self.layer):
+            names.update(relation.fieldPairs().values())
+
+        if value_relation_fields is None:
+            value_relation_fields = value_relation_field_names(project)
+        names.update(value_relation_fields.get(self.layer.id(), ()))
+
+        # in the order of the layer
+        return [field.name() for field in fields if field.name() in names]
+
     @property
     def warning(self):
         if self.layer.source().endswith('ecw'):
@@ -195,61 +355,342 @@ class LayerSource(object):
     def name(self):
         return self.layer.name()
 
-    def copy(self, target_path, copied_files, keep_existent=False):
+    # How the data of a layer is written to the target folder
+    COPY_MODE_FILES = 'files'
+    COPY_MODE_CLIP = 'clip'
+    COPY_MODE_OPTIMIZE_RASTER = 'optimize_raster'
+    COPY_MODE_GPKG_TABLES = 'gpkg_tables'
+
+    def copy(self, target_path, copied_files, keep_existent=False, extent=None, raster_exporter=None,
+             directory_index=None, journal=None, data_source_changes=None, target_crs=None, written_files=None,
+             kept_field_names=None):
         """
         Copy a layer to a new path and adjust its datasource.
 
+        Layers sharing the same source file are only copied once if the same copied_files dict is
+        passed for all of them, the datasources of the following layers are pointed to the first copy.
+
         :param layer: The layer to copy
         :param target_path: A path to a folder into which the data will be copied
+        :param copied_files: A dict of the data already copied, it is updated in place and returned
         :param keep_existent: if True and target file already exists, keep it as it is
+        :param extent: if set, only the data within this extent (in project CRS) will be copied
+        :param raster_exporter: if set, rasters to optimize are written by this RasterExporter
+                                and the datasource is adjusted once it has finished
+        :param directory_index: a DirectoryIndex to look up the files next to the layer source,
+                                share it between layers to list each source folder only once
+        :param journal: if set, the PackageJournal recording the written files, files it reports as
+                        written are kept as they are
+        :param data_source_changes: if set, a list the new datasources are appended to as (layer_source, datasource)
+                                    instead of being applied, to copy outside of the main thread
+        :param target_crs: if set, the QgsCoordinateReferenceSystem the data is reprojected to, if the layer
+                           can be reprojected while copied
+        :param written_files: if set, a set of the normalized paths written so far, it is updated in place.
+                              Layers copied in different modes may write into the same file, a file in
+                              it is never removed before it is written again
+        :param kept_field_names: if set, a dict of layer id -> the result of `kept_field_names()`, computed for
+                                 the layers which are not in it
         """
         if not self.is_file:
             # Copy will also be called on non-file layers like WMS. In this case, just do nothing.
-            return
+            return copied_files
 
-        file_path = ''
-        layer_name = ''
-        
-        if self.layer.dataProvider() is not None:
-            metadata = QgsProviderRegistry.instance().providerMetadata(self.layer.dataProvider().name())
-            if metadata is not None:
-                decoded = metadata.decodeUri(self.layer.source())
-                if "path" in decoded:
-                    file_path = decoded["path"]
-                if "layerName" in decoded:
-                    layer_name = decoded["layerName"]
-        if file_path == '':
-            file_path = self.layer.source()
+        file_path = self.source_file_path
+        layer_name = self.inventory_entry.layer_name
 
         if os.path.isfile(file_path):
             source_path, file_name = os.path.split(file_path)
-            basename, extensions = get_file_extension_group(file_name)
-            for ext in extensions:
-                dest_file = os.path.join(target_path, basename + ext)
-                if os.path.exists(os.path.join(source_path, basename + ext)) and \
-                        (keep_existent is False or not os.path.isfile(dest_file)):
-                    shutil.copy(os.path.join(source_path, basename + ext), dest_file)
-
-            new_source = ''
-            if Qgis.QGIS_VERSION_INT >= 31200 and self.layer.dataProvider() is not None:
-                metadata = QgsProviderRegistry.instance().providerMetadata(self.layer.dataProvider().name())
-                if metadata is not None:
-                    new_source = metadata.encodeUri({"path":os.path.join(target_path, file_name),"layerName":layer_name})
-            if new_source == '':
-                if self.layer.dataProvider() and self.layer.dataProvider().name == "spatialite":
-                    uri = QgsDataSourceUri()
-                    uri.setDatabase(os.path.join(target_path, file_name))
-                    uri.setTable(layer_name)
-                    new_source = uri.uri()
+            mode = self.copy_mode(extent, target_crs)
+            field_names = (kept_field_names or {}).get(self.layer.id())
+            copy_key = self.copy_key(extent, target_crs, field_names)
+            target_srs = None
+            if self.needs_reprojection(target_crs) and mode in (LayerSource.COPY_MODE_OPTIMIZE_RASTER,
+                                                                 LayerSource.COPY_MODE_CLIP):
+                target_srs = target_crs.authid() or target_crs.toWkt()
+                self.copied_crs = target_crs
+
+            copied = copied_files.get(copy_key)
+            if copied is not None:
+                copied['layer_count'] += 1
+                if copied['file_name'] is None:
+                    # the first layer has not been written, neither will this one
+                    self.exclude_from_package(data_source_changes)
+                    return copied_files
+
+                if mode == LayerSource.COPY_MODE_GPKG_TABLES:
+                    dest_file = os.path.join(target_path, copied['file_name'])
+                    extract_tables(file_path, dest_file, [layer_name])
+                    if journal is not None:
+                        journal.file_done(file_path, dest_file)
+
+                new_source = self._copied_data_source(target_path, copied['file_name'], layer_name)
+                if copied['pending'] and raster_exporter is not None:
+                    raster_exporter.submit(self, file_path, os.path.join(target_path, copied['file_name']), None, new_source,
+                                           target_srs)
                 else:
-                    new_source = os.path.join(target_path, file_name)
-                    if layer_name != '':
-                        new_source = "{}|{}".format(new_source, layer_name)
-
-            self._change_data_source(new_source)
+                    self._set_copied_data_source(new_source, data_source_changes)
+                return copied_files
+
+            copied = {'file_name': None, 'size': 0, 'layer_count': 1, 'pending': False}
+            copied_files[copy_key] = copied
+
+            if mode == LayerSource.COPY_MODE_OPTIMIZE_RASTER:
+                file_name = os.path.splitext(file_name)[0] + '.tif'
+                dest_file = os.path.join(target_path, file_name)
+                copied['size'] = os.path.getsize(file_path)
+                if not self._is_written(file_path, dest_file, keep_existent, journal):
+                    bbox = self._layer_extent(extent) if extent is not None else None
+                    new_source = self._copied_data_source(target_path, file_name, layer_name)
+                    if raster_exporter is not None:
+                        raster_exporter.submit(self, file_path, dest_file, bbox, new_source, target_srs)
+                        copied['file_name'] = file_name
+                        copied['pending'] = True
+                        self._record_written(dest_file, written_files)
+                        return copied_files
+
+                    sizes = optimize_raster(file_path, dest_file, bbox, target_srs)
+                    if sizes is None:
+                        self.log_not_intersecting()
+                        self.exclude_from_package(data_source_changes)
+                        return copied_files
+                    if journal is not None:
+                        journal.file_done(file_path, dest_file)
+            elif mode == LayerSource.COPY_MODE_CLIP:
+                copied['size'] = os.path.getsize(file_path)
+                file_name = self._clip(file_path, target_path, layer_name, extent, keep_existent, journal, target_srs,
+                                       field_names)
+                if file_name is None:
+                    self.exclude_from_package(data_source_changes)
+                    return copied_files
+            elif mode == LayerSource.COPY_MODE_GPKG_TABLES:
+                # only the tables used by layers are written, the size of the whole file is not shared
+                dest_file = os.path.join(target_path, file_name)
+                # another layer of the same source may have been clipped into the file during this run
+                written_before = written_files is not None and written_file_key(dest_file) in written_files
+                if not written_before and not self._is_written(file_path, dest_file, keep_existent, journal):
+                    for suffix in ('', '-wal', '-shm'):
+                        if os.path.isfile(dest_file + suffix):
+                            os.remove(dest_file + suffix)
+                extract_tables(file_path, dest_file, [layer_name])
+                if journal is not None:
+                    journal.file_done(file_path, dest_file)
+            else:
+                if directory_index is None:
+                    directory_index = DirectoryIndex()
+
+                basename, extensions = get_file_extension_group(file_name)
+                for sidecar_name in directory_index.find_files(source_path, basename, extensions):
+                    sidecar_path = os.path.join(source_path, sidecar_name)
+                    dest_file = os.path.join(target_path, sidecar_name)
+                    copied['size'] += os.path.getsize(sidecar_path)
+                    if not self._is_written(sidecar_path, dest_file, keep_existent, journal):
+                        shutil.copy(sidecar_path, dest_file)
+                        if journal is not None:
+                            journal.file_done(sidecar_path, dest_file)
+
+            copied['file_name'] = file_name
+            self._record_written(os.path.join(target_path, file_name), written_files)
+            self._set_copied_data_source(self._copied_data_source(target_path, file_name, layer_name), data_source_changes)
         return copied_files
 
-    def _change_data_source(self, new_data_source):
+    @staticmethod
+    def _record_written(dest_file, written_files):
+        if written_files is not None:
+            written_files.add(written_file_key(dest_file))
+
+    @staticmethod
+    def _is_written(source_path, dest_file, keep_existent, journal, part=None):
+        """
+        Whether a file written by `copy()` can be kept as it is
+        """
+        if keep_existent and os.path.isfile(dest_file):
+            return True
+        return journal is not None and journal.is_file_done(source_path, dest_file, part)
+
+    @property
+    def source_file_path(self):
+        """
+        The path to the file the layer data is read from
+        """
+        return self.inventory_entry.path or self.layer.source()
+
+    def copy_mode(self, extent=None, target_crs=None):
+        """
+        Return how the layer data will be written by `copy()`, one of the COPY_MODE_* constants
+        """
+        reproject = self.needs_reprojection(target_crs)
+        if (self.optimize_raster or reproject) and self.can_optimize_raster:
+            return LayerSource.COPY_MODE_OPTIMIZE_RASTER
+        elif self.layer.type() == QgsMapLayer.VectorLayer and self.can_clip and (
+                extent is not None or reproject or self.geometry_reducer is not None or self.prune_fields):
+            return LayerSource.COPY_MODE_CLIP
+        elif extent is not None and self.can_clip:
+            return LayerSource.COPY_MODE_CLIP
+        elif self.can_extract_tables:
+            return LayerSource.COPY_MODE_GPKG_TABLES
+        else:
+            return LayerSource.COPY_MODE_FILES
+
+    def copy_key(self, extent=None, target_crs=None, kept_field_names=None):
+        """
+        Return a key identifying the data written by `copy()`, layers with the same key share a single copy.
+
+        Whole files and GeoPackages are shared by all the layers reading from them, while clipping writes a single layer.
+
+        :param kept_field_names: if set, the result of `kept_field_names()`, computed if None
+        """
+        mode = self.copy_mode(extent, target_crs)
+        key = (os.path.normcase(os.path.realpath(self.source_file_path)), mode)
+        if mode == LayerSource.COPY_MODE_CLIP:
+            key += (self.inventory_entry.layer_name,)
+        if self.needs_reprojection(target_crs):
+            key += (target_crs.authid() or target_crs.toWkt(),)
+        if mode == LayerSource.COPY_MODE_CLIP and self.geometry_reducer is not None:
+            key += (self.simplify_tolerance, self.coordinate_precision)
+        if mode == LayerSource.COPY_MODE_CLIP and self.prune_fields:
+            key += (tuple(kept_field_names if kept_field_names is not None else self.kept_field_names()),)
+        return key
+
+    def needs_reprojection(self, target_crs):
+        """
+        Whether the data of the layer has to be transformed to be stored in the target CRS
+        """
+        if target_crs is None or not target_crs.isValid() or not self.layer.crs().isValid():
+            return False
+        return self.layer.crs() != target_crs
+
+    def _copied_data_source(self, target_path, file_name, layer_name):
+        """
+        Return the datasource string of the layer once copied to the target path
+        """
+        new_source = ''
+        if Qgis.QGIS_VERSION_INT >= 31200 and self.layer.dataProvider() is not None:
+            metadata = QgsProviderRegistry.instance().providerMetadata(self.layer.dataProvider().name())
+            if metadata is not None:
+                new_source = metadata.encodeUri({"path":os.path.join(target_path, file_name),"layerName":layer_name})
+        if new_source == '':
+            if self.layer.dataProvider() and self.layer.dataProvider().name == "spatialite":
+                uri = QgsDataSourceUri()
+                uri.setDatabase(os.path.join(target_path, file_name))
+                uri.setTable(layer_name)
+                new_source = uri.uri()
+            else:
+                new_source = os.path.join(target_path, file_name)
+                if layer_name != '':
+                    new_source = "{}|{}".format(new_source, layer_name)
+
+        return new_source
+
+    def _layer_extent(self, extent):
+        """
+        Return an extent in project CRS as (xmin, ymin, xmax, ymax) tuple in layer CRS
+        """
+        transform = QgsCoordinateTransform(QgsProject.instance().crs(), self.layer.crs(), QgsProject.instance())
+        layer_extent = transform.transformBoundingBox(extent)
+        return layer_extent.xMinimum(), layer_extent.yMinimum(), layer_extent.xMaximum(), layer_extent.yMaximum()
+
+    @property
+    def can_clip(self):
+        """
+        Whether the layer data can be clipped to an area of interest while being copied
+        """
+        if self.layer.dataProvider() is None:
+            return False
+
+        return self.layer.dataProvider().name() in ('gdal', 'ogr')
+
+    @property
+    def can_extract_tables(self):
+        """
+        Whether the layer is a table of a GeoPackage which can be copied on its own
+        """
+        if self.layer.dataProvider() is None or self.layer.dataProvider().name() != 'ogr':
+            return False
+
+        entry = self.inventory_entry
+        return bool(entry.layer_name) and entry.path.lower().endswith('.gpkg')
+
+    def _clip(self, file_path, target_path, layer_name, extent, keep_existent=False, journal=None, target_srs=None,
+              kept_field_names=None):
+        """
+        Write the data of the layer within an extent to the target path.
+
+        :param file_path: The source file of the layer
+        :param target_path: A path to a folder into which the clipped data will be written
+        :param layer_name: The layer within the source file, if any
+        :param extent: The area of interest in project CRS, None to write all the data of a vector layer
+        :param keep_existent: if True and target file already exists, keep it as it is
+        :param journal: if set, the PackageJournal recording the written files
+        :param target_srs: if set, the CRS (authority id or WKT) vector data is transformed to
+        :param kept_field_names: if set, the result of `kept_field_names()`, computed if None
+        :return: The name of the written file or None if nothing has been written
+        """
+        bbox = self._layer_extent(extent) if extent is not None else None
+
+        basename, ext = os.path.splitext(os.path.basename(file_path))
+
+        if self.layer.type() == QgsMapLayer.RasterLayer:
+            file_name = basename + '.tif'
+            dest_file = os.path.join(target_path, file_name)
+            if self._is_written(file_path, dest_file, keep_existent, journal):
+                return file_name
+
+            if not clip_raster(file_path, dest_file, bbox):
+                self.log_not_intersecting()
+                return None
+        else:
+            file_name = basename + ext if vector_driver_name(file_path) else basename + '.gpkg'
+            dest_file = os.path.join(target_path, file_name)
+            # layers of the same source are clipped into the same file, each of them is recorded
+            if self._is_written(file_path, dest_file, keep_existent, journal, layer_name):
+                return file_name
+
+            if kept_field_names is None:
+                kept_field_names = self.kept_field_names()
+            clip_vector(file_path, dest_file, bbox, layer_name, target_srs, kept_field_names)
+
+            reducer = self.geometry_reducer
+            if reducer is not None:
+                before, after = reducer.apply(self._copied_data_source(target_path, file_name, layer_name), 'ogr')
+                QgsMessageLog.logMessage(
+                    QCoreApplication.translate('QFieldSync',
+                                               'Reduced the geometries of "{name}": {before:.1f} MB -> {after:.1f} MB').format(
+                        name=self.name, before=before / 1024 ** 2, after=after / 1024 ** 2),
+                    'QFieldSync', Qgis.Info)
+
+        if journal is not None:
+            journal.file_done(file_path, dest_file, layer_name)
+
+        return file_name
+
+    def _set_copied_data_source(self, new_data_source, data_source_changes=None):
+        if data_source_changes is None:
+            self.change_data_source(new_data_source)
+        else:
+            data_source_changes.append((self, new_data_source))
+
+    def exclude_from_package(self, data_source_changes=None):
+        """
+        Remove a layer whose data has not been written from the packaged project.
+
+        Its datasource would still point to the original file, which is not part of the package.
+
+        :param data_source_changes: if set, (layer_source, None) is appended instead of removing the layer
+                                    right away, the layer is removed by `CopyPlanner.apply()`
+        """
+        if data_source_changes is None:
+            QgsProject.instance().removeMapLayer(self.layer.id())
+        else:
+            data_source_changes.append((self, None))
+
+    def log_not_intersecting(self, layer_names=None):
+        QgsMessageLog.logMessage(
+            QCoreApplication.translate('QFieldSync',
+                                       'Layer "{}" does not intersect the area of interest and has been removed from the package.').format(
+                layer_names or self.name),
+            'QFieldSync', Qgis.Warning)
+
+    def change_data_source(self, new_data_source):
         """
         Changes the datasource string of the layer
         """
@@ -266,4 +707,53 @@ class LayerSource(object):
 
         # reload layer definition
         self.layer.readLayerXml(map_layer_element, context)
+        if self.copied_crs is not None:
+            self.layer.setCrs(self.copied_crs)
         self.layer.reload()
+
+        LayerInventory.instance().invalidate([self.layer.id()])
+
+
+def value_relation_field_names(project):
+    """
+    Return the fields other layers look up with value relations, for all the layers at once.
+
+    :return: A dict of layer id -> set of the key and value field names looked up in the layer
+    """
+    field_names = dict()
+    for layer in project.mapLayers().values():
+        if layer.type() != QgsMapLayer.VectorLayer:
+            continue
+        for field in layer.fields():
+            setup = field.editorWidgetSetup()
+            if setup.type() == 'ValueRelation' and setup.config().get('Layer'):
+                field_names.setdefault(setup.config().get('Layer'), set()).update(
+                    name for name in (setup.config().get('Key'), setup.config().get('Value')) if name)
+    return field_names
+
+
+def apply_action_to_layers(layer_sources, action):
+    """
+    Set and apply an action on many layers in a single pass.
+
+    Layers which do not support the action are skipped, so are the layers which
+    are already explicitly configured with it.
+
+    :param layer_sources: The LayerSource instances to configure
+    :param action: The SyncAction to set
+    :return: The ids of the layers which have been changed
+    """
+    changed_layer_ids = list()
+
+    for layer_source in layer_sources:
+        if layer_source.is_configured and layer_source.action == action:
+            continue
+
+        if action not in dict(layer_source.available_actions):
+            continue
+
+        layer_source.action = action
+        layer_source.apply()
+        changed_layer_ids.append(layer_source.layer.id())
+
+    return changed_layer_ids
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from functools import partial
+
+from qgis.PyQt.QtCore import QObject
+from qgis.core import QgsProject, QgsProviderRegistry
+
+
+class LayerInventoryEntry(object):
+    """
+    The decoded datasource of a single layer.
+    """
+
+    def __init__(self, layer, path_resolver):
+        self.source = layer.source()
+        self.provider_name = None
+        self.decoded = {}
+        self.path = ''
+        self.layer_name = ''
+        self.is_file = False
+        self.localized_path = None
+
+        if layer.dataProvider() is not None:
+            self.provider_name = layer.dataProvider().name()
+            metadata = QgsProviderRegistry.instance().providerMetadata(self.provider_name)
+            if metadata is not None:
+                self.decoded = metadata.decodeUri(self.source)
+
+        if "path" in self.decoded:
+            self.path = self.decoded["path"]
+            self.is_file = os.path.isfile(self.path)
+
+            path = path_resolver.writePath(self.path)
+            if path.startswith("localized:"):
+                self.localized_path = path[len("localized:"):]
+
+        if "layerName" in self.decoded:
+            self.layer_name = self.decoded["layerName"]
+
+    @property
+    def is_localized(self):
+        """
+        Whether the layer is stored in a localized data path
+        """
+        return self.localized_path is not None
+
+
+class LayerInventory(QObject):
+    """
+    Project wide cache of decoded layer datasources.
+
+    Decoding a datasource and resolving its path is expensive and needed by many
+    places, this decodes it once per layer. Entries are invalidated whenever layers
+    are added or removed, or their datasource changes.
+    """
+
+    _instances = dict()
+
+    def __init__(self, project):
+        super(LayerInventory, self).__init__(parent=project)
+        self.project = project
+        self._entries = dict()
+
+        project.layersAdded.connect(self._on_layers_added)
+        project.layersRemoved.connect(self.invalidate)
+        project.cleared.connect(self.invalidate)
+        project.homePathChanged.connect(self.invalidate)
+
+        self._on_layers_added(project.mapLayers().values())
+
+    @classmethod
+    def instance(cls, project=None):
+        """
+        Return the inventory of a project, creates it if necessary.
+
+        :param project: The project, defaults to the current project instance
+        """
+        if project is None:
+            project = QgsProject.instance()
+
+        key = id(project)
+        if key not in cls._instances:
+            inventory = cls(project)
+            inventory.destroyed.connect(lambda _=None, key=key: cls._instances.pop(key, None))
+            cls._instances[key] = inventory
+
+        return cls._instances[key]
+
+    def entry(self, layer):
+        """
+        Return the LayerInventoryEntry of a layer.
+        """
+        entry = self._entries.get(layer.id())
+        if entry is None:
+            entry = LayerInventoryEntry(layer, self.project.pathResolver())
+            self._entries[layer.id()] = entry
+        return entry
+
+    def invalidate(self, layer_ids=None):
+        """
+        Discard cached entries.
+
+        :param layer_ids: The ids of the layers to discard, all of them if None
+        """
+        if layer_ids is None:
+            self._entries.clear()
+        else:
+            for layer_id in layer_ids:
+                self._entries.pop(layer_id, None)
+
+    def _on_layers_added(self, layers):
+        for layer in layers:
+            self._entries.pop(layer.id(), None)
+            layer.dataSourceChanged.connect(partial(self.invalidate, [layer.id()]))
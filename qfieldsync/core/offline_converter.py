@@ -20,11 +20,26 @@
 """
 
 import os
+import shutil
 import tempfile
+import time
 
+from functools import partial
+
+from qfieldsync.core.bulk_mutation import BulkMutation
+from qfieldsync.core.copy_planner import CopyPlanner
 from qfieldsync.core.layer import LayerSource, SyncAction
+from qfieldsync.core.layer_inventory import LayerInventory
+from qfieldsync.core.package_archive import PackageArchive
+from qfieldsync.core.package_journal import PackageJournal
+from qfieldsync.core.package_manifest import PackageManifest
+from qfieldsync.core.preferences import Preferences
 from qfieldsync.core.project import ProjectProperties, ProjectConfiguration
-from qfieldsync.utils.file_utils import copy_images
+from qfieldsync.core.raster_exporter import RasterExporter
+from qfieldsync.utils.file_utils import DirectoryIndex, copy_images, slugify
+from qfieldsync.utils.gdal_utils import delete_vector_layers, reproject_table
+from qfieldsync.utils.profiling import MemoryProfiler
+from qfieldsync.utils.task_utils import TaskGroup
 from qgis.PyQt.QtCore import (
     Qt,
     QObject,
@@ -37,27 +52,68 @@ from qgis.PyQt.QtWidgets import (
     QMessageBox
 )
 from qgis.core import (
+    QgsCoordinateReferenceSystem,
     QgsProject,
     QgsRasterLayer,
     QgsCubicRasterResampler,
     QgsBilinearRasterResampler,
     QgsApplication,
+    QgsProcessingAlgorithm,
+    QgsProcessingAlgRunnerTask,
     QgsProcessingFeedback,
     QgsProcessingContext,
     QgsMapLayer,
-    QgsProviderRegistry,
-    QgsProviderMetadata,
-    QgsEditorWidgetSetup
+    QgsEditorWidgetSetup,
+    QgsMessageLog,
+    Qgis
 )
 import qgis
 
 
+# Custom property with the id of the original layer, kept by the offline copy of the layer
+LAYER_ID_PROPERTY = 'QFieldSync/sourceLayerId'
+
+
+def build_layer_id_mapping(project, original_layer_sources):
+    """
+    Match the layers of a converted project to the layers of the original project, in a single pass.
+
+    Offline layers carry the id of their original layer in a custom property. Before QGIS 3.14 custom
+    properties are lost during the conversion, the offline layers are matched by their remote source
+    instead. All the other layers keep their ids.
+
+    :param project: The converted project
+    :param original_layer_sources: A dict of original layer id -> datasource
+    :return: A dict of original layer id -> layer id in the converted project
+    """
+    mapping = dict()
+    layer_ids_by_remote_source = dict()
+    for layer in project.mapLayers().values():
+        original_layer_id = layer.customProperty(LAYER_ID_PROPERTY)
+        if original_layer_id:
+            mapping[original_layer_id] = layer.id()
+        elif layer.customProperty('remoteSource'):
+            layer_ids_by_remote_source.setdefault(layer.customProperty('remoteSource'), layer.id())
+        elif layer.id() in original_layer_sources:
+            mapping[layer.id()] = layer.id()
+
+    for original_layer_id, source in original_layer_sources.items():
+        if original_layer_id not in mapping and source in layer_ids_by_remote_source:
+            mapping[original_layer_id] = layer_ids_by_remote_source[source]
+
+    return mapping
+
+
 class OfflineConverter(QObject):
     progressStopped = pyqtSignal()
     task_progress_updated = pyqtSignal(int, int)
     total_progress_updated = pyqtSignal(int, int, str)
 
-    def __init__(self, project, export_folder, extent, offline_editing):
+    def __init__(self, project, export_folder, extent, offline_editing, archive_path=None, archive_format='zip'):
+        """
+        :param archive_path: if set, the package is written into this archive instead of the export folder
+        :param archive_format: the format of the archive, one of the PackageArchive.FORMATS keys
+        """
         super(OfflineConverter, self).__init__(parent=None)
         self.__max_task_progress = 0
         self.__offline_layers = list()
@@ -68,9 +124,17 @@ class OfflineConverter(QObject):
         self.trUtf8 = self.tr
 
         self.export_folder = export_folder
+        self.archive_path = archive_path
+        self.archive_format = archive_format
         self.extent = extent
         self.offline_editing = offline_editing
-        self.project_configuration = ProjectConfiguration(project)
+        self.project_configuration = ProjectConfiguration(project, snapshot=True)
+        # the TaskGroup currently running, if any
+        self._task_group = None
+
+        preferences = Preferences()
+        self.memory_profiler = MemoryProfiler('packaging', preferences.value('logDirectory'),
+                                              enabled=bool(preferences.value('profileMemory')))
 
         offline_editing.layerProgressUpdated.connect(self.on_offline_editing_next_layer)
         offline_editing.progressModeSet.connect(self.on_offline_editing_max_changed)
@@ -85,33 +149,56 @@ class OfflineConverter(QObject):
         """
 
         project = QgsProject.instance()
-        original_project = project
+        self.memory_profiler.start()
 
         original_project_path = project.fileName()
         project_filename, _ = os.path.splitext(os.path.basename(original_project_path))
 
-        # Write a backup of the current project to a temporary file
-        project_backup_folder = tempfile.mkdtemp()
-        backup_project_path = os.path.join(project_backup_folder, project_filename + '.qgs')
-        QgsProject.instance().write(backup_project_path)
-
+        # The project is restored from its file when the conversion is done. Only a project with
+        # unsaved changes has to be written to a temporary backup file first. Changes QFieldSync has
+        # made since the project has been saved count as unsaved, they do not always mark it dirty.
+        self.project_configuration.commit()
+        if (project.isDirty() or ProjectConfiguration.was_written(project)
+                or not os.path.isfile(original_project_path)):
+            project_backup_folder = tempfile.mkdtemp()
+            restore_project_path = os.path.join(project_backup_folder, project_filename + '.qgs')
+            self.write_project(restore_project_path, self.tr('backup'))
+        else:
+            project_backup_folder = None
+            restore_project_path = original_project_path
+
+        archive = None
+        if self.archive_path:
+            # the stages write to a staging folder next to the archive, which is added to it stage by stage
+            archive_folder = os.path.dirname(os.path.abspath(self.archive_path))
+            os.makedirs(archive_folder, exist_ok=True)
+            self.export_folder = tempfile.mkdtemp(prefix='qfieldsync_', dir=archive_folder)
+            archive = PackageArchive(self.archive_path, self.export_folder, self.archive_format)
+
+        # the written files are hashed in the background, stage by stage
+        manifest = PackageManifest(self.export_folder)
+
+        succeeded = False
         try:
             if not os.path.exists(self.export_folder):
                 os.makedirs(self.export_folder)
 
+            # an archive is staged in a new folder every time, there is nothing to resume
+            journal = PackageJournal(self.export_folder, original_project_path) if archive is None else None
+
             QApplication.setOverrideCursor(Qt.WaitCursor)
 
             self.__offline_layers = list()
             self.__layers = list(project.mapLayers().values())
 
-            original_layer_info = {}
+            original_layer_sources = {}
             for layer in self.__layers:
-                original_layer_info[layer.id()] = (layer.source(), layer.name())
+                original_layer_sources[layer.id()] = layer.source()
 
             # We store the pks of the original vector layers
             # and we check that the primary key fields names don't
             # have a comma in the name
-            original_pk_fields_by_layer_name = {}
+            original_pk_fields_by_layer_id = {}
             for layer in self.__layers:
                 if layer.type() == QgsMapLayer.VectorLayer:
                     keys = []
@@ -119,79 +206,128 @@ class OfflineConverter(QObject):
                         key = layer.fields()[idx].name()
                         assert (',' not in key), 'Comma in field names not allowed'
                         keys.append(key)
-                    original_pk_fields_by_layer_name[layer.name()] = ','.join(keys)
+                    original_pk_fields_by_layer_id[layer.id()] = ','.join(keys)
+
+            # Decide what happens to every layer. The project is only modified once the background
+            # stages have finished, the basemap is rendered from the layers as they are now.
+            inventory = LayerInventory.instance(project)
+            copy_extent = self.extent if self.project_configuration.clip_copied_layers_to_aoi else None
+            target_crs = None
+            if self.project_configuration.target_crs:
+                target_crs = QgsCoordinateReferenceSystem(self.project_configuration.target_crs)
+            raster_exporter = RasterExporter(journal=journal)
+            copy_planner = CopyPlanner(self.export_folder, copy_extent, raster_exporter, DirectoryIndex(), journal,
+                                       deferred=True, target_crs=target_crs,
+                                       reproject_rasters=self.project_configuration.reproject_rasters)
+            # changes to the project are applied without the signals for every single change
+            mutations = list()
+            removed_layer_ids = list()
+            # original layer id -> GeometryReducer, for the offline layers with reduced geometries
+            geometry_reducers = dict()
+            # original layer id -> names of the fields to keep, for the offline layers with pruned fields
+            kept_field_names = dict()
+            with BulkMutation(project) as plan_mutation:
+                mutations.append(plan_mutation)
+                for layer in self.__layers:
+                    layer_source = LayerSource(layer)
+                    if not layer_source.is_supported:
+                        removed_layer_ids.append(layer.id())
+                        continue
+
+                    if inventory.entry(layer).is_localized:
+                        # Layer stored in localized data path, skip
+                        continue
+
+                    if layer_source.action == SyncAction.OFFLINE:
+                        if self.project_configuration.offline_copy_only_aoi and not self.project_configuration.offline_copy_only_selected_features:
+                            layer.selectByRect(self.extent)
+                        elif self.project_configuration.offline_copy_only_aoi and self.project_configuration.offline_copy_only_selected_features:
+                            # This option is only possible via API
+                            QgsApplication.instance().messageLog().logMessage(self.tr(
+                                'Both "Area of Interest" and "only selected features" options were enabled, tha latter takes precedence.'),
+                                'QFieldSync')
+                        self.__offline_layers.append(layer)
+                        if layer_source.geometry_reducer is not None:
+                            geometry_reducers[layer.id()] = layer_source.geometry_reducer
+                        if layer_source.prune_fields:
+                            kept_field_names[layer.id()] = copy_planner.compute_kept_field_names(layer_source)
+                        # identifies the offline copy of the layer after the conversion
+                        plan_mutation.set_custom_property(layer, LAYER_ID_PROPERTY, layer.id())
+
+                        # Store the primary key field name(s) as comma separated custom property
+                        if layer.type() == QgsMapLayer.VectorLayer:
+                            key_fields = ','.join([layer.fields()[x].name() for x in layer.primaryKeyAttributes()])
+                            plan_mutation.set_custom_property(layer, 'QFieldSync/sourceDataPrimaryKeys', key_fields)
+
+                    elif layer_source.action == SyncAction.NO_ACTION:
+                        copy_planner.add(layer_source)
+                    elif layer_source.action == SyncAction.KEEP_EXISTENT:
+                        copy_planner.add(layer_source, keep_existent=True)
+                    elif layer_source.action == SyncAction.REMOVE:
+                        removed_layer_ids.append(layer.id())
+            self.memory_profiler.mark('plan')
+
+            project_path = os.path.join(self.export_folder, project_filename + "_qfield.qgs")
+            dcim_folder = os.path.join(os.path.dirname(original_project_path), "DCIM")
 
-            self.total_progress_updated.emit(0, 1, self.trUtf8('Creating base map…'))
-            # Create the base map before layers are removed
+            # The basemap, the copied layers and the DCIM folder are written in parallel in the background
+            task_group = TaskGroup(self.tr('Packaging {}').format(project_filename))
+            base_map_path = None
             if self.project_configuration.create_base_map:
                 if 'processing' not in qgis.utils.plugins:
                     QMessageBox.warning(None, self.tr('QFieldSync requires processing'), self.tr('Creating a basemap with QFieldSync requires the processing plugin to be enabled. Processing is not enabled on your system. Please go to Plugins > Manage and Install Plugins and enable processing.'))
                     return
 
                 if self.project_configuration.base_map_type == ProjectProperties.BaseMapType.SINGLE_LAYER:
-                    self.createBaseMapLayer(None, self.project_configuration.base_map_layer,
-                                            self.project_configuration.base_map_tile_size,
-                                            self.project_configuration.base_map_mupp)
+                    map_theme, base_map_layer = None, self.project_configuration.base_map_layer
                 else:
-                    self.createBaseMapLayer(self.project_configuration.base_map_theme, None,
-                                            self.project_configuration.base_map_tile_size,
-                                            self.project_configuration.base_map_mupp)
-
-            # Loop through all layers and copy/remove/offline them
-            pathResolver = QgsProject.instance().pathResolver()
-            copied_files = list()
-            for current_layer_index, layer in enumerate(self.__layers):
-                self.total_progress_updated.emit(current_layer_index - len(self.__offline_layers), len(self.__layers),
-                                                 self.trUtf8('Copying layers…'))
-
-                layer_source = LayerSource(layer)
-                if not layer_source.is_supported:
-                     project.removeMapLayer(layer)
-                     continue
-
-                if layer.dataProvider() is not None:
-                    md = QgsProviderRegistry.instance().providerMetadata(layer.dataProvider().name())
-                    if md is not None:
-                        decoded = md.decodeUri(layer.source())
-                        if "path" in decoded:
-                            path = pathResolver.writePath(decoded["path"])
-                            if path.startswith("localized:"):
-                                # Layer stored in localized data path, skip
-                                continue
-
-                if layer_source.action == SyncAction.OFFLINE:
-                    if self.project_configuration.offline_copy_only_aoi and not self.project_configuration.offline_copy_only_selected_features:
-                        layer.selectByRect(self.extent)
-                    elif self.project_configuration.offline_copy_only_aoi and self.project_configuration.offline_copy_only_selected_features:
-                        # This option is only possible via API
-                        QgsApplication.instance().messageLog().logMessage(self.tr(
-                            'Both "Area of Interest" and "only selected features" options were enabled, tha latter takes precedence.'),
-                            'QFieldSync')
-                    self.__offline_layers.append(layer)
-
-                    # Store the primary key field name(s) as comma separated custom property
-                    if layer.type() == QgsMapLayer.VectorLayer:
-                        key_fields = ','.join([layer.fields()[x].name() for x in layer.primaryKeyAttributes()])
-                        layer.setCustomProperty('QFieldSync/sourceDataPrimaryKeys', key_fields)
-
-                elif layer_source.action == SyncAction.NO_ACTION:
-                    copied_files = layer_source.copy(self.export_folder, copied_files)
-                elif layer_source.action == SyncAction.KEEP_EXISTENT:
-                    layer_source.copy(self.export_folder, copied_files, True)
-                elif layer_source.action == SyncAction.REMOVE:
-                    project.removeMapLayer(layer)
-
-            project_path = os.path.join(self.export_folder, project_filename + "_qfield.qgs")
-
-            # save the original project path
-            ProjectConfiguration(project).original_project_path = original_project_path
-
-            # save the offline project twice so that the offline plugin can "know" that it's a relative path
-            QgsProject.instance().write(project_path)
+                    map_theme, base_map_layer = self.project_configuration.base_map_theme, None
+
+                base_map_path = os.path.join(self.export_folder, 'basemap.gpkg')
+                base_map_parameters = {
+                    'map_theme': map_theme,
+                    'layer': base_map_layer,
+                    'tile_size': self.project_configuration.base_map_tile_size,
+                    'mupp': self.project_configuration.base_map_mupp,
+                    'extent': [self.extent.xMinimum(), self.extent.yMinimum(), self.extent.xMaximum(), self.extent.yMaximum()],
+                }
+
+                if journal is None or not journal.is_stage_done(
+                        'basemap', dict(base_map_parameters, output=PackageJournal.fingerprint(base_map_path))):
+                    self.total_progress_updated.emit(0, 1, self.trUtf8('Creating base map…'))
+                    base_map_task = self.createBaseMapTask(map_theme, base_map_layer,
+                                                           self.project_configuration.base_map_tile_size,
+                                                           self.project_configuration.base_map_mupp)
+                    if base_map_task is not None:
+                        task_group.add_task(base_map_task)
+
+            task_group.add_function(self.tr('Copying layers'), self.copy_layers, copy_planner, raster_exporter,
+                                    archive, journal, manifest)
+            task_group.add_function(self.tr('Copying DCIM'), self.copy_dcim, dcim_folder,
+                                    os.path.join(self.export_folder, "DCIM"), archive, journal, manifest)
+            self.run_tasks(task_group)
+            self.memory_profiler.mark('background stages')
+
+            # Back on the main thread, apply the results of the background stages to the project
+            with BulkMutation(project) as apply_mutation:
+                mutations.append(apply_mutation)
+                if base_map_path is not None:
+                    self.addBaseMapLayer(base_map_path)
+                    if journal is not None:
+                        journal.stage_done(
+                            'basemap', dict(base_map_parameters, output=PackageJournal.fingerprint(base_map_path)))
+                apply_mutation.remove_layers(removed_layer_ids)
+                copy_planner.apply(apply_mutation)
+            self.memory_profiler.mark('apply')
+
+            # the offline plugin writes the path of the offline database relative to the project file name,
+            # the project is only written once it has been converted
+            QgsProject.instance().setFileName(project_path)
+
+            # save the original project path, into the packaged project only
+            self.project_configuration.original_project_path = original_project_path
+            self.project_configuration.commit()
 
-            # export the DCIM folder
-            copy_images(os.path.join(os.path.dirname(original_project_path), "DCIM"),
-                        os.path.join(os.path.dirname(project_path), "DCIM"))
             try:
                 # Run the offline plugin for gpkg
                 gpkg_filename = "data.gpkg"
@@ -215,6 +351,28 @@ class OfflineConverter(QObject):
                                                                         only_selected):
                         raise Exception(self.tr("Error trying to convert layers to offline layers"))
 
+            self.memory_profiler.mark('offline conversion')
+
+            # original layer id -> layer id in the packaged project, for later lookups and syncs
+            layer_id_mapping = build_layer_id_mapping(project, original_layer_sources)
+            packaged_layer_ids = {layer_id: original_id for original_id, layer_id in layer_id_mapping.items()}
+            self.project_configuration.layer_id_mapping = layer_id_mapping
+            self.project_configuration.commit()
+
+            if kept_field_names:
+                self.prune_offline_fields(project, {layer_id_mapping[layer_id]: names
+                                                    for layer_id, names in kept_field_names.items()
+                                                    if layer_id in layer_id_mapping})
+
+            if target_crs is not None and target_crs.isValid():
+                self.reproject_offline_layers(project, target_crs)
+
+            # the tolerances are in the units of the packaged layers, the geometries are reduced once reprojected
+            if geometry_reducers:
+                self.reduce_offline_geometries(project, {layer_id_mapping[layer_id]: reducer
+                                                         for layer_id, reducer in geometry_reducers.items()
+                                                         if layer_id in layer_id_mapping})
+
             # Disable project options that could create problems on a portable
             # project with offline layers
             if self.__offline_layers:
@@ -222,53 +380,67 @@ class OfflineConverter(QObject):
                 QgsProject.instance().setAutoTransaction(False)
 
                 # check if value relations point to offline layers and adjust if necessary
-                for layer in project.mapLayers().values():
-                    if layer.type() == QgsMapLayer.VectorLayer:
-
-                        # Before QGIS 3.14 the custom properties of a layer are not
-                        # kept into the new layer during the conversion to offline project
-                        # So we try to identify the new created layer by its name and
-                        # we set the custom properties again.
-                        if not layer.customProperty('QFieldSync/cloudPrimaryKeys'):
-                            original_layer_name = layer.name().rsplit(' ', 1)[0]
-                            stored_fields = original_pk_fields_by_layer_name.get(original_layer_name, None)
-                            if stored_fields:
-                                layer.setCustomProperty(
-                                    'QFieldSync/sourceDataPrimaryKeys',
-                                    stored_fields)
-
-                        for field in layer.fields():
-                            ews = field.editorWidgetSetup()
-                            if ews.type() == 'ValueRelation':
-                                widget_config = ews.config()
-                                online_layer_id = widget_config['Layer']
-                                if project.mapLayer(online_layer_id):
-                                    continue
-
-                                layer_id = None
-                                loose_layer_id = None
-                                for offline_layer in project.mapLayers().values():
-                                    if offline_layer.customProperty('remoteSource') == original_layer_info[online_layer_id][0]:
-                                        #  First try strict matching: the offline layer should have a "remoteSource" property
-                                        layer_id = offline_layer.id()
-                                        break
-                                    elif offline_layer.name().startswith(original_layer_info[online_layer_id][1] + ' '):
-                                        #  If that did not work, go with loose matching
-                                        #    The offline layer should start with the online layer name + a translated version of " (offline)"
-                                        loose_layer_id = offline_layer.id()
-                                widget_config['Layer'] = layer_id or loose_layer_id
-                                offline_ews = QgsEditorWidgetSetup(ews.type(), widget_config)
-                                layer.setEditorWidgetSetup(layer.fields().indexOf(field.name()), offline_ews)
+                with BulkMutation(project) as offline_mutation:
+                    mutations.append(offline_mutation)
+                    for layer in project.mapLayers().values():
+                        if layer.type() == QgsMapLayer.VectorLayer:
+
+                            # Before QGIS 3.14 the custom properties of a layer are not
+                            # kept into the new layer during the conversion to offline project
+                            # So we look up the original layer and set the custom properties again.
+                            if not layer.customProperty('QFieldSync/cloudPrimaryKeys'):
+                                stored_fields = original_pk_fields_by_layer_id.get(packaged_layer_ids.get(layer.id()))
+                                if stored_fields:
+                                    offline_mutation.set_custom_property(
+                                        layer, 'QFieldSync/sourceDataPrimaryKeys', stored_fields)
+
+                            for field in layer.fields():
+                                ews = field.editorWidgetSetup()
+                                if ews.type() == 'ValueRelation':
+                                    widget_config = ews.config()
+                                    online_layer_id = widget_config['Layer']
+                                    if project.mapLayer(online_layer_id):
+                                        continue
+
+                                    widget_config['Layer'] = layer_id_mapping.get(online_layer_id)
+                                    offline_ews = QgsEditorWidgetSetup(ews.type(), widget_config)
+                                    offline_mutation.set_editor_widget_setup(
+                                        layer, layer.fields().indexOf(field.name()), offline_ews)
+
+            QgsMessageLog.logMessage(
+                self.tr('Applied the changes to the project in {:.2f}s').format(
+                    sum(mutation.seconds for mutation in mutations)),
+                'QFieldSync', Qgis.Info)
 
             # Now we have a project state which can be saved as offline project
-            QgsProject.instance().write(project_path)
+            if not self.write_project(project_path, self.tr('packaged project')):
+                raise Exception(self.tr('Error writing the project to {}').format(project_path))
+            succeeded = True
+            self.memory_profiler.mark('write project')
+
+            if journal is not None:
+                journal.remove()
         finally:
             # We need to let the app handle events before loading the next project or QGIS will crash with rasters
             QCoreApplication.processEvents()
             QgsProject.instance().clear()
             QCoreApplication.processEvents()
-            QgsProject.instance().read(backup_project_path)
+            QgsProject.instance().read(restore_project_path)
             QgsProject.instance().setFileName(original_project_path)
+            if project_backup_folder is not None:
+                shutil.rmtree(project_backup_folder, ignore_errors=True)
+            if succeeded:
+                # the offline data is only complete once the layers are closed
+                self.total_progress_updated.emit(0, 1, self.trUtf8('Writing manifest…'))
+                manifest.add_directory()
+                manifest.write()
+            else:
+                manifest.close()
+            if archive is not None:
+                # the project and the offline data are only complete once the layers are closed
+                self.finish_archive(archive, succeeded)
+            self.memory_profiler.mark('restore project')
+            self.memory_profiler.stop()
             QApplication.restoreOverrideCursor()
 
         self.offline_editing.layerProgressUpdated.disconnect(self.on_offline_editing_next_layer)
@@ -277,12 +449,205 @@ class OfflineConverter(QObject):
 
         self.total_progress_updated.emit(100, 100, self.tr('Finished'))
 
-    def createBaseMapLayer(self, map_theme, layer, tile_size, map_units_per_pixel):
+    def reproject_offline_layers(self, project, target_crs):
+        """
+        Transform the offline copies of the layers to the target CRS, so QField does not have to reproject
+        them while rendering.
+
+        Every table is reprojected into a new table of the offline database in a background task, then the
+        layers are pointed to the new tables and the old tables are removed. The features keep their ids, the
+        offline editing log stays valid. The synchronization transforms the edits back to the CRS of the
+        remote layers.
+
+        :param project: The converted project
+        :param target_crs: The QgsCoordinateReferenceSystem of the offline layers
+        """
+        inventory = LayerInventory.instance(project)
+        target_srs = target_crs.authid() or target_crs.toWkt()
+        jobs = list()
+        for layer in project.mapLayers().values():
+            if layer.type() != QgsMapLayer.VectorLayer or not layer.customProperty('isOfflineEditable'):
+                continue
+            if not layer.isSpatial() or not layer.crs().isValid() or layer.crs() == target_crs:
+                continue
+
+            entry = inventory.entry(layer)
+            if entry.provider_name != 'ogr' or not entry.layer_name:
+                QgsMessageLog.logMessage(
+                    self.tr('Layer "{}" is not stored in a GeoPackage and has not been reprojected').format(layer.name()),
+                    'QFieldSync', Qgis.Warning)
+                continue
+
+            new_table = '{}_{}'.format(entry.layer_name, slugify(target_srs).replace('-', '_') if target_crs.authid() else 'reprojected')
+            jobs.append((layer, entry.path, entry.layer_name, new_table))
+
+        if not jobs:
+            return
+
+        def reproject(task):
+            for done, (layer, path, table, new_table) in enumerate(jobs):
+                if task.isCanceled():
+                    raise Exception(self.tr('Packaging has been canceled'))
+                task.setProgress(100 * done / len(jobs))
+                reproject_table(path, table, new_table, target_srs)
+
+        self.total_progress_updated.emit(0, 1, self.trUtf8('Reprojecting offline layers…'))
+        task_group = TaskGroup(self.tr('Reprojecting offline layers'))
+        task_group.add_function(self.tr('Reprojecting offline layers'), reproject)
+        self.run_tasks(task_group)
+
+        tables_by_path = dict()
+        for layer, path, table, new_table in jobs:
+            layer_source = LayerSource(layer)
+            layer_source.copied_crs = target_crs
+            layer_source.change_data_source('{}|layername={}'.format(path, new_table))
+            tables_by_path.setdefault(path, list()).append(table)
+
+        for path, tables in tables_by_path.items():
+            delete_vector_layers(path, tables)
+
+        QgsMessageLog.logMessage(
+            self.tr('Reprojected {count} offline layers to {crs}').format(count=len(jobs), crs=target_srs),
+            'QFieldSync', Qgis.Info)
+
+    def prune_offline_fields(self, project, kept_field_names):
+        """
+        Remove the fields the form of an offline layer does not use from its offline copy.
+
+        QgsOfflineEditing copies all the fields, they are removed right after the conversion, before anything
+        is edited. `SyncEngine` matches the remaining fields and the fields added in QField to the remote fields
+        by name, `QgsOfflineEditing` would match them by position.
+
+        :param project: The converted project
+        :param kept_field_names: A dict of offline layer id -> names of the fields to keep
+        """
+        for layer_id, names in kept_field_names.items():
+            layer = project.mapLayer(layer_id)
+            if layer is None:
+                continue
+
+            provider = layer.dataProvider()
+            kept = set(names)
+            # the primary keys of the offline copy are needed to identify the features
+            kept.update(provider.fields()[index].name() for index in provider.pkAttributeIndexes())
+            pruned = [index for index, field in enumerate(provider.fields()) if field.name() not in kept]
+            if not pruned:
+                continue
+
+            if not provider.deleteAttributes(pruned):
+                QgsMessageLog.logMessage(
+                    self.tr('Could not remove the unused fields of layer "{}"').format(layer.name()),
+                    'QFieldSync', Qgis.Warning)
+                continue
+
+            layer.updateFields()
+            QgsMessageLog.logMessage(
+                self.tr('Removed {count} fields not used by the form of layer "{name}"').format(
+                    count=len(pruned), name=layer.name()),
+                'QFieldSync', Qgis.Info)
+
+    def reduce_offline_geometries(self, project, geometry_reducers):
+        """
+        Simplify the geometries of the offline layers and snap them to a grid, in a background task.
+
+        :param project: The converted project
+        :param geometry_reducers: A dict of offline layer id -> GeometryReducer
+        """
+        jobs = list()
+        for layer_id, reducer in geometry_reducers.items():
+            layer = project.mapLayer(layer_id)
+            if layer is not None:
+                jobs.append((layer, layer.source(), layer.providerType(), reducer))
+
+        def reduce(task):
+            def progress(count, total, offset):
+                if task.isCanceled():
+                    raise Exception(self.tr('Packaging has been canceled'))
+                task.setProgress(100 * (offset + count / max(total, 1)) / len(jobs))
+
+            sizes = list()
+            for done, (_, source, provider, reducer) in enumerate(jobs):
+                sizes.append(reducer.apply(source, provider, partial(progress, offset=done)))
+            return sizes
+
+        self.total_progress_updated.emit(0, 1, self.trUtf8('Reducing geometries…'))
+        task_group = TaskGroup(self.tr('Reducing geometries'))
+        task_group.add_function(self.tr('Reducing geometries'), reduce)
+        sizes, = self.run_tasks(task_group)
+
+        for (layer, _, _, _), (before, after) in zip(jobs, sizes):
+            layer.reload()
+            QgsMessageLog.logMessage(
+                self.tr('Reduced the geometries of "{name}": {before:.1f} MB -> {after:.1f} MB').format(
+                    name=layer.name(), before=before / 1024 ** 2, after=after / 1024 ** 2),
+                'QFieldSync', Qgis.Info)
+
+    def run_tasks(self, task_group):
+        """
+        Run a TaskGroup reading the current project.
+
+        The tasks are canceled if the project is cleared or layers are about to be removed while they run.
+
+        :return: The results of the tasks
+        """
+        project = QgsProject.instance()
+        project.cleared.connect(task_group.cancel)
+        project.layersWillBeRemoved.connect(task_group.cancel)
+        self._task_group = task_group
+        try:
+            return task_group.run()
+        finally:
+            self._task_group = None
+            project.cleared.disconnect(task_group.cancel)
+            project.layersWillBeRemoved.disconnect(task_group.cancel)
+
+    def cancel(self, *_):
+        """
+        Cancel the background tasks currently running, the conversion fails and the project is restored.
+        """
+        if self._task_group is not None:
+            self._task_group.cancel()
+
+    def write_project(self, path, description):
+        """
+        Write the current project and log how long it took.
+
+        :param path: The path to write the project to
+        :param description: What is written, for the log
+        :return: True if the project has been written
+        """
+        start = time.monotonic()
+        written = QgsProject.instance().write(path)
+        size = os.path.getsize(path) if os.path.isfile(path) else 0
+        QgsMessageLog.logMessage(
+            self.tr('Wrote {description} ({size:.1f} MB) in {seconds:.2f}s').format(
+                description=description, size=size / 1024 ** 2, seconds=time.monotonic() - start),
+            'QFieldSync', Qgis.Info)
+        return written
+
+    def finish_archive(self, archive, succeeded):
+        """
+        Write the remaining staged files into the archive and remove the staging folder.
+
+        :param archive: The PackageArchive
+        :param succeeded: if False, the incomplete archive is removed
         """
-        Create a basemap from map layer(s)
+        try:
+            if succeeded:
+                self.total_progress_updated.emit(0, 1, self.trUtf8('Writing project to archive…'))
+                archive.add_staged()
+        finally:
+            archive.close()
+            shutil.rmtree(archive.staging_folder, ignore_errors=True)
+            if not succeeded and os.path.isfile(archive.path):
+                os.remove(archive.path)
+
+    def createBaseMapTask(self, map_theme, layer, tile_size, map_units_per_pixel):
+        """
+        Create a task rendering a basemap from map layer(s) to basemap.gpkg in the export folder.
+
+        Algorithms which cannot run in a background thread are run right away and None is returned.
 
-        :param dataPath:             The path where the basemap should be writtent to
-        :param extent:               The extent rectangle in which data shall be fetched
         :param map_theme:            The name of the map theme to be rendered
         :param layer:                A layer id to be rendered. Will only be used if map_theme is None.
         :param tile_size:            The extent rectangle in which data shall be fetched
@@ -304,13 +669,68 @@ class OfflineConverter(QObject):
             'OUTPUT': os.path.join(self.export_folder, 'basemap.gpkg')
         }
 
-        feedback = QgsProcessingFeedback()
-        context = QgsProcessingContext()
-        context.setProject(QgsProject.instance())
+        # kept until the task has finished
+        self.__base_map_feedback = QgsProcessingFeedback()
+        self.__base_map_context = QgsProcessingContext()
+        self.__base_map_context.setProject(QgsProject.instance())
 
-        results, ok = alg.run(params, context, feedback)
+        if alg.flags() & QgsProcessingAlgorithm.FlagNoThreading:
+            alg.run(params, self.__base_map_context, self.__base_map_feedback)
+            return None
 
-        new_layer = QgsRasterLayer(results['OUTPUT'], self.tr('Basemap'))
+        return QgsProcessingAlgRunnerTask(alg, params, self.__base_map_context, self.__base_map_feedback)
+
+    def copy_layers(self, task, copy_planner, raster_exporter, archive, journal, manifest):
+        """
+        Copy the layer files, runs in a background task and must not modify the project.
+        """
+        def progress(done, count, layer_name):
+            if task.isCanceled():
+                raise Exception(self.tr('Packaging has been canceled'))
+            task.setProgress(100 * done / max(count, 1))
+            self.on_layer_copied(done, count, layer_name)
+
+        bytes_saved = copy_planner.execute(progress)
+        if bytes_saved:
+            QgsMessageLog.logMessage(
+                self.tr('Layers sharing source files, saved copying {:.1f} MB').format(bytes_saved / 1024 ** 2),
+                'QFieldSync', Qgis.Info)
+
+        if raster_exporter.pending_count:
+            self.total_progress_updated.emit(0, raster_exporter.pending_count, self.trUtf8('Optimizing rasters…'))
+            size_before, size_after = raster_exporter.wait(self.on_raster_exported)
+            self.total_progress_updated.emit(100, 100, self.tr('Optimized rasters from {before:.1f} MB to {after:.1f} MB').format(
+                before=size_before / 1024 ** 2, after=size_after / 1024 ** 2))
+
+        if archive is not None:
+            self.total_progress_updated.emit(0, 1, self.trUtf8('Writing layers to archive…'))
+            # the basemap is rendered at the same time and only added at the end
+            archive.add_staged(exclude=['basemap.gpkg'])
+        # the basemap and the pictures are written at the same time and added by their own stages
+        manifest.add_directory(exclude=['basemap.gpkg', 'DCIM'])
+        if journal is not None:
+            journal.stage_done('copy')
+
+    def copy_dcim(self, task, dcim_folder, destination_folder, archive, journal, manifest):
+        """
+        Copy the DCIM folder, runs in a background task.
+        """
+        if archive is not None:
+            archive.add_directory(dcim_folder, "DCIM")
+            manifest.add_directory(dcim_folder, "DCIM")
+        else:
+            copy_images(dcim_folder, destination_folder, journal)
+            manifest.add_directory(destination_folder, "DCIM")
+            if journal is not None:
+                journal.stage_done('dcim')
+
+    def addBaseMapLayer(self, path):
+        """
+        Add a rendered basemap to the project
+
+        :param path: The path of the basemap raster
+        """
+        new_layer = QgsRasterLayer(path, self.tr('Basemap'))
 
         resample_filter = new_layer.resampleFilter()
         resample_filter.setZoomedInResampler(QgsCubicRasterResampler())
@@ -319,6 +739,13 @@ class OfflineConverter(QObject):
         layer_tree = QgsProject.instance().layerTreeRoot()
         layer_tree.insertLayer(len(layer_tree.children()), new_layer)
 
+    def on_layer_copied(self, done, count, layer_name):
+        self.total_progress_updated.emit(done, count, self.trUtf8('Copying layer {}…').format(layer_name))
+
+    def on_raster_exported(self, done, count, layer_name):
+        msg = self.trUtf8('Optimized raster {layer_name}…').format(layer_name=layer_name)
+        self.total_progress_updated.emit(done, count, msg)
+
     @pyqtSlot(int, int)
     def on_offline_editing_next_layer(self, layer_index, layer_count):
         msg = self.trUtf8('Packaging layer {layer_name}…').format(layer_name=self.__offline_layers[layer_index - 1].name())
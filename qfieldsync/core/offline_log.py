@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import sqlite3
+
+from pathlib import Path
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+
+class LayerChanges(object):
+    """
+    The net changes logged for one layer, every feature appears at most once per kind of change.
+    """
+
+    def __init__(self, layer_id):
+        self.layer_id = layer_id
+        # offline feature ids of the added features, their current state is what has to be written
+        self.added = list()
+        # offline feature ids of the removed features
+        self.removed = list()
+        # offline feature ids of features added and removed again, nothing has to be written
+        self.discarded = list()
+        # offline feature id -> {offline attribute index: last logged value}
+        self.attribute_changes = dict()
+        # offline feature id -> last logged geometry as WKT
+        self.geometry_changes = dict()
+        # offline feature id -> remote feature id, for the removed and changed features
+        self.fid_map = dict()
+        self.added_attribute_count = 0
+        # the number of rows in the log, before collapsing
+        self.log_entry_count = 0
+
+    @property
+    def change_count(self):
+        return len(self.added) + len(self.removed) + len(self.attribute_changes) + len(self.geometry_changes)
+
+    def is_empty(self):
+        return self.change_count == 0 and self.added_attribute_count == 0
+
+
+class OfflineLog(object):
+    """
+    The edit log QgsOfflineEditing keeps in the offline database (data.gpkg or data.sqlite).
+
+    The log is read with plain SQLite. Every edit done in QField is a row in the log, `changes()`
+    collapses them into one net change per feature. Applied changes are removed from the log with
+    the `applied_*()` methods, so an interrupted synchronization does not apply them again.
+
+    Writing to the remote provider and updating the log cannot happen in a single transaction.
+    Removals, attribute and geometry changes applied twice give the same result. Added features
+    are recorded with `writing_added()` before they are written, if the synchronization is
+    interrupted before `applied_added()`, `interrupted_added()` returns them on the next run:
+    they may have been written already.
+    """
+
+    # Added features being written to the remote layer, kept in the offline database
+    WRITING_TABLE = 'qfieldsync_writing_added'
+
+    CHANGE_TABLES = [
+        'log_added_attrs',
+        'log_added_features',
+        'log_removed_features',
+        'log_feature_updates',
+        'log_geometry_updates',
+    ]
+
+    def __init__(self, path, read_only=False):
+        """
+        :param path: The path to the offline database
+        :param read_only: if True, the database is opened read only, nothing can be marked as applied
+        """
+        self.path = path
+        try:
+            if read_only:
+                uri = Path(os.path.abspath(path)).as_uri() + '?mode=ro'
+                self._connection = sqlite3.connect(uri, uri=True, isolation_level=None)
+            else:
+                self._connection = sqlite3.connect(path, isolation_level=None)
+        except sqlite3.Error as err:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Could not open offline database {path}: {error}').format(
+                    path=path, error=err))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def is_valid(self):
+        """
+        Whether the database holds an offline edit log
+        """
+        tables = {name for name, in self._connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return 'log_layer_ids' in tables and 'log_fids' in tables and set(OfflineLog.CHANGE_TABLES) <= tables
+
+    def layer_ids(self):
+        """
+        :return: A dict of QGIS layer id -> log layer id
+        """
+        return {qgis_id: layer_id for layer_id, qgis_id in self._connection.execute(
+            'SELECT id, qgis_id FROM log_layer_ids')}
+
+    def changes(self, layer_id):
+        """
+        Read the net changes of a layer.
+
+        Features added and removed again are dropped. Changes of added features are dropped too,
+        since added features are written as they are now. Of repeated changes to the same attribute
+        or geometry of a feature, only the last one is kept.
+
+        :param layer_id: The log layer id
+        :return: A LayerChanges
+        """
+        execute = self._connection.execute
+        changes = LayerChanges(layer_id)
+
+        for table in OfflineLog.CHANGE_TABLES:
+            changes.log_entry_count += execute(
+                'SELECT count(*) FROM {} WHERE layer_id = ?'.format(table), (layer_id,)).fetchone()[0]
+        changes.added_attribute_count = execute(
+            'SELECT count(*) FROM log_added_attrs WHERE layer_id = ?', (layer_id,)).fetchone()[0]
+
+        added = {fid for fid, in execute('SELECT fid FROM log_added_features WHERE layer_id = ?', (layer_id,))}
+        removed = {fid for fid, in execute('SELECT fid FROM log_removed_features WHERE layer_id = ?', (layer_id,))}
+        changes.added = sorted(added - removed)
+        changes.removed = sorted(removed - added)
+        changes.discarded = sorted(added & removed)
+
+        # the row order is the order the edits have been logged in
+        rows = execute(
+            'SELECT fid, attr, value FROM log_feature_updates WHERE rowid IN ('
+            'SELECT max(rowid) FROM log_feature_updates WHERE layer_id = ? GROUP BY fid, attr)', (layer_id,))
+        for fid, attr, value in rows:
+            if fid not in added and fid not in removed:
+                changes.attribute_changes.setdefault(fid, dict())[attr] = value
+
+        rows = execute(
+            'SELECT fid, geom_wkt FROM log_geometry_updates WHERE rowid IN ('
+            'SELECT max(rowid) FROM log_geometry_updates WHERE layer_id = ? GROUP BY fid)', (layer_id,))
+        for fid, wkt in rows:
+            if fid not in added and fid not in removed:
+                changes.geometry_changes[fid] = wkt
+
+        mapped = set(changes.removed) | set(changes.attribute_changes) | set(changes.geometry_changes)
+        for offline_fid, remote_fid in execute(
+                'SELECT offline_fid, remote_fid FROM log_fids WHERE layer_id = ?', (layer_id,)):
+            if offline_fid in mapped:
+                changes.fid_map[offline_fid] = remote_fid
+
+        return changes
+
+    def summary(self):
+        """
+        Count the net changes of all layers at once, without reading any feature ids into Python.
+
+        The logged feature ids are gathered in indexed temporary tables first, so features added and
+        removed again are sorted out with index lookups instead of scanning the log over and over.
+
+        :return: A dict of log layer id -> dict with the 'added', 'edited', 'deleted', 'added_attributes'
+                 and 'log_entries' counts
+        """
+        execute = self._connection.execute
+        for name in ('added', 'removed', 'edited'):
+            execute('DROP TABLE IF EXISTS temp.qfieldsync_{}'.format(name))
+            execute('CREATE TEMP TABLE qfieldsync_{} (layer_id INTEGER, fid INTEGER, '
+                    'PRIMARY KEY (layer_id, fid)) WITHOUT ROWID'.format(name))
+        execute('INSERT OR IGNORE INTO temp.qfieldsync_added SELECT layer_id, fid FROM main.log_added_features')
+        execute('INSERT OR IGNORE INTO temp.qfieldsync_removed SELECT layer_id, fid FROM main.log_removed_features')
+        execute('INSERT OR IGNORE INTO temp.qfieldsync_edited SELECT layer_id, fid FROM main.log_feature_updates '
+                'UNION SELECT layer_id, fid FROM main.log_geometry_updates')
+
+        summary = dict()
+
+        def count(key, sql):
+            for layer_id, value in execute(sql):
+                summary.setdefault(layer_id, dict.fromkeys(
+                    ('added', 'edited', 'deleted', 'added_attributes', 'log_entries'), 0))[key] += value
+
+        count('added', 'SELECT layer_id, count(*) FROM temp.qfieldsync_added a WHERE NOT EXISTS ('
+                       'SELECT 1 FROM temp.qfieldsync_removed r WHERE r.layer_id = a.layer_id AND r.fid = a.fid) '
+                       'GROUP BY layer_id')
+        count('deleted', 'SELECT layer_id, count(*) FROM temp.qfieldsync_removed r WHERE NOT EXISTS ('
+                         'SELECT 1 FROM temp.qfieldsync_added a WHERE a.layer_id = r.layer_id AND a.fid = r.fid) '
+                         'GROUP BY layer_id')
+        count('edited', 'SELECT layer_id, count(*) FROM temp.qfieldsync_edited e WHERE NOT EXISTS ('
+                        'SELECT 1 FROM temp.qfieldsync_added a WHERE a.layer_id = e.layer_id AND a.fid = e.fid) '
+                        'AND NOT EXISTS ('
+                        'SELECT 1 FROM temp.qfieldsync_removed r WHERE r.layer_id = e.layer_id AND r.fid = e.fid) '
+                        'GROUP BY layer_id')
+        count('added_attributes', 'SELECT layer_id, count(*) FROM main.log_added_attrs GROUP BY layer_id')
+        for table in OfflineLog.CHANGE_TABLES:
+            count('log_entries', 'SELECT layer_id, count(*) FROM main.{} GROUP BY layer_id'.format(table))
+
+        for name in ('added', 'removed', 'edited'):
+            execute('DROP TABLE temp.qfieldsync_{}'.format(name))
+
+        return summary
+
+    def added_attributes(self, layer_id):
+        """
+        :return: A list of (name, type, length, precision, comment) of the attributes added to a layer, in the
+                 order they have been added
+        """
+        return list(self._connection.execute(
+            'SELECT name, type, length, precision, comment FROM log_added_attrs WHERE layer_id = ? ORDER BY rowid',
+            (layer_id,)))
+
+    def applied_added_attributes(self, layer_id):
+        with self._transaction():
+            self._connection.execute('DELETE FROM log_added_attrs WHERE layer_id = ?', (layer_id,))
+
+    def writing_added(self, layer_id, offline_fids):
+        """
+        Record added features which are about to be written to the remote layer.
+        """
+        with self._transaction():
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS {} (layer_id INTEGER, fid INTEGER)'.format(OfflineLog.WRITING_TABLE))
+            self._delete([OfflineLog.WRITING_TABLE], layer_id, offline_fids)
+            self._connection.executemany(
+                'INSERT INTO {} (layer_id, fid) VALUES (?, ?)'.format(OfflineLog.WRITING_TABLE),
+                [(layer_id, fid) for fid in offline_fids])
+
+    def interrupted_added(self, layer_id):
+        """
+        :return: The offline feature ids of added features a previous synchronization has started to write
+                 but not recorded as applied, they may exist in the remote layer already
+        """
+        if not self._has_table(OfflineLog.WRITING_TABLE):
+            return []
+        return sorted(fid for fid, in self._connection.execute(
+            'SELECT fid FROM {} WHERE layer_id = ?'.format(OfflineLog.WRITING_TABLE), (layer_id,)))
+
+    def applied_added(self, layer_id, offline_fids, remote_fids):
+        """
+        Remove written added features from the log and record their remote feature ids.
+        """
+        with self._transaction():
+            self._connection.executemany(
+                'INSERT INTO log_fids (layer_id, offline_fid, remote_fid) VALUES (?, ?, ?)',
+                [(layer_id, offline_fid, remote_fid) for offline_fid, remote_fid in zip(offline_fids, remote_fids)])
+            self._delete(self._with_writing_table(['log_added_features', 'log_feature_updates', 'log_geometry_updates']),
+                         layer_id, offline_fids)
+
+    def applied_removed(self, layer_id, offline_fids):
+        with self._transaction():
+            self._delete(['log_removed_features', 'log_feature_updates', 'log_geometry_updates'], layer_id, offline_fids)
+
+    def discard(self, layer_id, offline_fids):
+        """
+        Remove features added and removed again from the log.
+        """
+        with self._transaction():
+            self._delete(self._with_writing_table(
+                ['log_added_features', 'log_removed_features', 'log_feature_updates', 'log_geometry_updates']),
+                layer_id, offline_fids)
+
+    def applied_attribute_changes(self, layer_id, offline_fids):
+        with self._transaction():
+            self._delete(['log_feature_updates'], layer_id, offline_fids)
+
+    def applied_geometry_changes(self, layer_id, offline_fids):
+        with self._transaction():
+            self._delete(['log_geometry_updates'], layer_id, offline_fids)
+
+    def _delete(self, tables, layer_id, fids):
+        # the log tables have no index, a temporary table keeps the deletion of many features linear
+        execute = self._connection.execute
+        execute('CREATE TEMP TABLE IF NOT EXISTS qfieldsync_fids (fid INTEGER PRIMARY KEY)')
+        execute('DELETE FROM temp.qfieldsync_fids')
+        self._connection.executemany('INSERT OR IGNORE INTO temp.qfieldsync_fids VALUES (?)', [(fid,) for fid in fids])
+        for table in tables:
+            execute('DELETE FROM {} WHERE layer_id = ? AND fid IN (SELECT fid FROM temp.qfieldsync_fids)'.format(table),
+                    (layer_id,))
+
+    def _with_writing_table(self, tables):
+        if self._has_table(OfflineLog.WRITING_TABLE):
+            return tables + [OfflineLog.WRITING_TABLE]
+        return tables
+
+    def _has_table(self, name):
+        return self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+
+class _Transaction(object):
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute('BEGIN')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
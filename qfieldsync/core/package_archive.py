@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import tarfile
+import threading
+import zipfile
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+
+class PackageArchive(object):
+    """
+    Writes a packaged project into a single zip or tar archive.
+
+    The files produced by the packaging stages are written into a staging folder and added to
+    the archive with `add_staged()` as soon as a stage is finished. Files which are not read by
+    the layers of the project, like the DCIM pictures, are written to the archive straight from
+    their source and never take space in the staging folder.
+    """
+
+    # format name -> (archive type, compression, file extension)
+    FORMATS = {
+        'zip': ('zip', zipfile.ZIP_DEFLATED, '.zip'),
+        'zip-stored': ('zip', zipfile.ZIP_STORED, '.zip'),
+        'zip-lzma': ('zip', zipfile.ZIP_LZMA, '.zip'),
+        'tar': ('tar', '', '.tar'),
+        'tar.gz': ('tar', 'gz', '.tar.gz'),
+        'tar.xz': ('tar', 'xz', '.tar.xz'),
+    }
+
+    def __init__(self, path, staging_folder, archive_format='zip'):
+        """
+        :param path: The path of the archive to write
+        :param staging_folder: The folder the packaging stages write to, the paths in the archive are relative to it
+        :param archive_format: One of the FORMATS keys
+        """
+        if archive_format not in PackageArchive.FORMATS:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Unknown archive format {}').format(archive_format))
+
+        self.path = path
+        self.staging_folder = staging_folder
+        self.archive_format = archive_format
+        self._names = set()
+        # stages running in parallel write to the same archive
+        self._lock = threading.Lock()
+
+        archive_type, compression, _ = PackageArchive.FORMATS[archive_format]
+        if archive_type == 'zip':
+            self._zip = zipfile.ZipFile(path, 'w', compression=compression, allowZip64=True)
+            self._tar = None
+        else:
+            self._zip = None
+            self._tar = tarfile.open(path, 'w:{}'.format(compression) if compression else 'w')
+
+    @staticmethod
+    def extension(archive_format):
+        return PackageArchive.FORMATS[archive_format][2]
+
+    def add_file(self, source_path, name):
+        """
+        Write a file into the archive.
+
+        :param source_path: The file to write
+        :param name: The path of the file in the archive
+        """
+        name = name.replace(os.sep, '/')
+        with self._lock:
+            if name in self._names:
+                return
+
+            if self._zip is not None:
+                self._zip.write(source_path, name)
+            else:
+                self._tar.add(source_path, name, recursive=False)
+            self._names.add(name)
+
+    def add_directory(self, source_folder, name):
+        """
+        Write the content of a folder into the archive.
+
+        :param source_folder: The folder to write
+        :param name: The path of the folder in the archive
+        """
+        for root, _, files in os.walk(source_folder):
+            for file_name in files:
+                file_path = os.path.join(root, file_name)
+                self.add_file(file_path, os.path.join(name, os.path.relpath(file_path, source_folder)))
+
+    def add_staged(self, exclude=()):
+        """
+        Write the files written to the staging folder so far into the archive.
+
+        Files already in the archive are skipped, the staged files are kept as long as layers
+        of the project may read them.
+
+        :param exclude: Paths relative to the staging folder which are not complete yet
+        """
+        exclude = {os.path.normcase(path) for path in exclude}
+        for root, _, files in os.walk(self.staging_folder):
+            for file_name in files:
+                file_path = os.path.join(root, file_name)
+                name = os.path.relpath(file_path, self.staging_folder)
+                if os.path.normcase(name) not in exclude:
+                    self.add_file(file_path, name)
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
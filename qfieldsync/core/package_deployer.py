@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from qfieldsync.core.package_manifest import PackageManifest, PackageVerifier
+from qfieldsync.utils.delta_utils import delta_copy
+from qfieldsync.utils.exceptions import ModifiedFilesError, QFieldSyncError
+
+
+class DeployResult(object):
+
+    def __init__(self):
+        # paths in the package
+        self.unchanged = list()
+        self.copied = list()
+        self.patched = list()
+        self.removed = list()
+        self.total_bytes = 0
+        # bytes which have not been copied, because the device had them already
+        self.saved_bytes = 0
+
+    def __str__(self):
+        return QCoreApplication.translate(
+            'QFieldSync',
+            '{copied} files copied, {patched} updated, {unchanged} unchanged, {saved:.1f} of {total:.1f} MB saved').format(
+                copied=len(self.copied), patched=len(self.patched), unchanged=len(self.unchanged),
+                saved=self.saved_bytes / 1024 ** 2, total=self.total_bytes / 1024 ** 2)
+
+
+class PackageDeployer(object):
+    """
+    Updates the copy of a package on a device, mounted as a folder, with a new version of the package.
+
+    Files the device has in the same version are skipped, which is decided from the manifests of
+    both packages without reading the files if possible. Changed files are compared block by block
+    and only the blocks which differ are written.
+
+    Files which have been modified on the device since the last deployment, e.g. data edited in
+    QField and not synchronized yet, are only overwritten or removed if asked to.
+
+    Every file is recorded on the device before it is written, until the deployment is complete.
+    The files an interrupted deployment has written are not taken for modifications, deploying
+    again resumes it.
+    """
+
+    def __init__(self, package_folder, device_folder, remove_stale=False, overwrite_modified=False):
+        """
+        :param package_folder: The folder of the new package
+        :param device_folder: The folder of the package on the device
+        :param remove_stale: if True, files on the device which are not part of the new package are removed
+        :param overwrite_modified: if True, files modified on the device since the last deployment are
+                                   overwritten, otherwise the deployment is refused
+        """
+        self.package_folder = package_folder
+        self.device_folder = device_folder
+        self.remove_stale = remove_stale
+        self.overwrite_modified = overwrite_modified
+
+    def deploy(self, progress_callback=None):
+        """
+        :param progress_callback: called with (done, total, file name) before a file is deployed
+        :return: A DeployResult
+        :raises ModifiedFilesError: if files modified on the device would be overwritten or removed
+        """
+        if not os.path.isdir(self.package_folder):
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Package folder {} does not exist').format(self.package_folder))
+
+        os.makedirs(self.device_folder, exist_ok=True)
+        package_files = list()
+        for root, _, files in os.walk(self.package_folder):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(root, file_name), self.package_folder).replace(os.sep, '/')
+                if not PackageManifest.is_ignored(name):
+                    package_files.append(name)
+        package_files.sort()
+
+        unchanged, modified = self._compare_device(package_files)
+        if modified and not self.overwrite_modified:
+            raise ModifiedFilesError(
+                QCoreApplication.translate(
+                    'QFieldSync', 'Files on the device have been modified since the last deployment: {}').format(
+                        ', '.join(modified)), modified)
+
+        deploying_path = os.path.join(self.device_folder, PackageManifest.DEPLOYING_FILE_NAME)
+        with open(deploying_path, 'a', encoding='utf-8') as deploying:
+            result = self._deploy_files(package_files, unchanged, deploying, progress_callback)
+
+        manifest_path = os.path.join(self.package_folder, PackageManifest.FILE_NAME)
+        device_manifest_path = os.path.join(self.device_folder, PackageManifest.FILE_NAME)
+        if os.path.isfile(manifest_path):
+            shutil.copyfile(manifest_path, device_manifest_path)
+        elif os.path.isfile(device_manifest_path):
+            # it describes the previous deployment
+            os.remove(device_manifest_path)
+        # the device matches its manifest again
+        os.remove(deploying_path)
+
+        if progress_callback:
+            progress_callback(len(package_files), len(package_files), '')
+        return result
+
+    def _deploy_files(self, package_files, unchanged, deploying, progress_callback):
+        result = DeployResult()
+        for done, name in enumerate(package_files):
+            if progress_callback:
+                progress_callback(done, len(package_files), name)
+
+            source_path = os.path.join(self.package_folder, name)
+            target_path = os.path.join(self.device_folder, name)
+            size = os.path.getsize(source_path)
+            result.total_bytes += size
+
+            if name in unchanged:
+                result.unchanged.append(name)
+                result.saved_bytes += size
+                continue
+
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            existed = os.path.isfile(target_path)
+            # recorded before anything is written, the file may be left half written
+            deploying.write(name + '\n')
+            deploying.flush()
+            os.fsync(deploying.fileno())
+            result.saved_bytes += delta_copy(source_path, target_path)
+            (result.patched if existed else result.copied).append(name)
+
+        if self.remove_stale:
+            deployed = set(package_files)
+            for root, _, files in os.walk(self.device_folder):
+                for file_name in files:
+                    name = os.path.relpath(os.path.join(root, file_name), self.device_folder).replace(os.sep, '/')
+                    if (name not in deployed and not name.startswith('DCIM/')
+                            and not PackageManifest.is_ignored(name)):
+                        os.remove(os.path.join(root, file_name))
+                        result.removed.append(name)
+        return result
+
+    def _interrupted_files(self):
+        """
+        The files an interrupted deployment has started to write
+        """
+        try:
+            with open(os.path.join(self.device_folder, PackageManifest.DEPLOYING_FILE_NAME), 'r', encoding='utf-8') as f:
+                return {line.rstrip('\n') for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def _compare_device(self, package_files):
+        """
+        Compare the device to the manifest of the last deployment.
+
+        :return: The set of files the device has in the same version as the package, according to the
+                 manifests, and the list of files modified on the device which would be overwritten or removed
+        """
+        try:
+            device_manifest = PackageManifest.load(self.device_folder)
+        except QFieldSyncError:
+            # never deployed to, nothing is known about the files
+            return set(), list()
+
+        # the device manifest describes the files as deployed, they may have been modified since
+        verification = PackageVerifier(self.device_folder, PackageVerifier.cache_path(self.device_folder)).verify()
+        package_files = set(package_files)
+        modified = [name for name in verification.changed
+                    if name in package_files or (self.remove_stale and not name.startswith('DCIM/'))]
+        modified += [name for name in verification.added if name in package_files]
+        # written by an interrupted deployment, not in QField
+        deploying = self._interrupted_files()
+        modified = [name for name in modified if name not in deploying]
+
+        try:
+            package_manifest = PackageManifest.load(self.package_folder)
+        except QFieldSyncError:
+            return set(), sorted(modified)
+        unchanged = {name for name in verification.unchanged
+                     if package_manifest.get(name) is not None and package_manifest[name] == device_manifest.get(name)}
+        return unchanged, sorted(modified)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+import threading
+import time
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsMessageLog, Qgis
+
+
+class PackageJournal(object):
+    """
+    Checkpoints of a packaging run, stored in the export folder.
+
+    The journal records the finished stages and every written file with the fingerprints
+    (size and modification time) of its source and of the written file. If packaging is
+    interrupted, the next run into the same export folder skips whatever is recorded and
+    unchanged since. Output which has not been recorded, or whose fingerprints do not match
+    anymore, is written again.
+
+    The journal is removed once packaging has succeeded.
+    """
+
+    FILE_NAME = '.qfieldsync_journal.json'
+    VERSION = 1
+
+    # Recorded files are written to disk at most every so many seconds
+    SAVE_INTERVAL = 2
+
+    def __init__(self, export_folder, project_path):
+        """
+        :param export_folder: The folder the package is written to
+        :param project_path: The path of the packaged project, a journal of another project is discarded
+        """
+        self.export_folder = export_folder
+        self.project_path = project_path
+        self.path = os.path.join(export_folder, PackageJournal.FILE_NAME)
+        self._stages = dict()
+        self._files = dict()
+        self._last_save = 0
+        # stages running in parallel record their files in the same journal
+        self._lock = threading.RLock()
+
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if content.get('version') != PackageJournal.VERSION or content.get('project') != self.project_path:
+            return
+
+        self._stages = content.get('stages', dict())
+        self._files = content.get('files', dict())
+        if self._stages or self._files:
+            QgsMessageLog.logMessage(
+                QCoreApplication.translate('QFieldSync', 'Resuming packaging into {folder}, {count} files have already been written').format(
+                    folder=self.export_folder, count=len(self._files)),
+                'QFieldSync', Qgis.Info)
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.export_folder, exist_ok=True)
+            content = {
+                'version': PackageJournal.VERSION,
+                'project': self.project_path,
+                'stages': self._stages,
+                'files': self._files,
+            }
+            # write and rename, an interrupted save never leaves a broken journal behind
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(content, f)
+            os.replace(temp_path, self.path)
+            self._last_save = time.monotonic()
+
+    def remove(self):
+        self._stages = dict()
+        self._files = dict()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def is_stage_done(self, stage, parameters=None):
+        """
+        Whether a stage has been finished with the same parameters.
+
+        :param stage: The name of the stage
+        :param parameters: JSON serializable parameters of the stage
+        """
+        return stage in self._stages and self._stages[stage] == self._normalized(parameters)
+
+    def stage_done(self, stage, parameters=None):
+        with self._lock:
+            self._stages[stage] = self._normalized(parameters)
+            self.save()
+
+    def is_file_done(self, source_path, target_path, part=None):
+        """
+        Whether a file has been written from an unchanged source and has not been modified since.
+
+        :param source_path: The file the target has been written from
+        :param target_path: The written file
+        :param part: if set, the part of the file (e.g. a layer of a multi layer dataset)
+        """
+        record = self._files.get(self._key(target_path, part))
+        if record is None:
+            return False
+
+        return record == {'source': self.fingerprint(source_path), 'target': self.fingerprint(target_path)}
+
+    def file_done(self, source_path, target_path, part=None):
+        """
+        Record a written file.
+
+        :param source_path: The file the target has been written from
+        :param target_path: The written file
+        :param part: if set, the part of the file which has been written
+        """
+        record = {
+            'source': self.fingerprint(source_path),
+            'target': self.fingerprint(target_path),
+        }
+        with self._lock:
+            self._files[self._key(target_path, part)] = record
+            if time.monotonic() - self._last_save >= PackageJournal.SAVE_INTERVAL:
+                self.save()
+
+    @staticmethod
+    def fingerprint(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _key(self, target_path, part=None):
+        key = os.path.relpath(target_path, self.export_folder).replace(os.sep, '/')
+        if part:
+            key += '|' + part
+        return key
+
+    @staticmethod
+    def _normalized(parameters):
+        # a JSON round trip, the same parameters compare equal after having been loaded
+        return json.loads(json.dumps(parameters))
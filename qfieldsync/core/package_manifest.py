@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsApplication
+
+from qfieldsync.core.package_journal import PackageJournal
+from qfieldsync.utils.exceptions import QFieldSyncError
+from qfieldsync.utils.file_utils import file_checksum
+
+
+# The number of files hashed at the same time
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class PackageManifest(object):
+    """
+    The list of the files of a package, with their sizes and content hashes.
+
+    Files are hashed in a thread pool as soon as they are added, while the packaging stages go on
+    writing other files. Adding a file again is free as long as its size and modification time are
+    unchanged, so whole folders can be added after every stage.
+    """
+
+    FILE_NAME = 'qfieldsync_manifest.json'
+    # The files a deployment has started to write, left on the device if it has been interrupted
+    DEPLOYING_FILE_NAME = 'qfieldsync_deploying.txt'
+    VERSION = 1
+    ALGORITHM = 'sha256'
+
+    # Files which are not part of the package
+    IGNORED_NAMES = {FILE_NAME, DEPLOYING_FILE_NAME, PackageJournal.FILE_NAME}
+    IGNORED_SUFFIXES = ('-wal', '-shm', '-journal', '.tmp')
+
+    def __init__(self, folder):
+        """
+        :param folder: The package folder, the paths in the manifest are relative to it
+        """
+        self.folder = folder
+        # path in the package -> (source path, fingerprint, future of the hash)
+        self._entries = dict()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_ignored(name):
+        file_name = os.path.basename(name)
+        return file_name in PackageManifest.IGNORED_NAMES or file_name.endswith(PackageManifest.IGNORED_SUFFIXES)
+
+    def add_file(self, path, name=None):
+        """
+        Hash a file of the package in the background.
+
+        :param path: The file to hash
+        :param name: The path of the file in the package, defaults to the path relative to the package folder
+        """
+        if name is None:
+            name = os.path.relpath(path, self.folder)
+        name = name.replace(os.sep, '/')
+        if PackageManifest.is_ignored(name):
+            return
+
+        fingerprint = PackageJournal.fingerprint(path)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[1] == fingerprint:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+            future = self._executor.submit(file_checksum, path, None, PackageManifest.ALGORITHM)
+            self._entries[name] = (path, fingerprint, future)
+
+    def add_directory(self, folder=None, name='', exclude=()):
+        """
+        Hash the files of a folder in the background.
+
+        :param folder: The folder, defaults to the package folder
+        :param name: The path of the folder in the package
+        :param exclude: Paths relative to the folder which are skipped, folders are skipped with their content
+        """
+        folder = folder or self.folder
+        exclude = {os.path.normcase(path) for path in exclude}
+        for root, dirs, files in os.walk(folder):
+            relative_root = os.path.relpath(root, folder)
+            dirs[:] = [d for d in dirs if os.path.normcase(os.path.normpath(os.path.join(relative_root, d))) not in exclude]
+            for file_name in files:
+                relative_path = os.path.normpath(os.path.join(relative_root, file_name))
+                if os.path.normcase(relative_path) not in exclude:
+                    self.add_file(os.path.join(root, file_name), os.path.join(name, relative_path))
+
+    def files(self):
+        """
+        Wait for all the hashes.
+
+        :return: A dict of path in the package -> {'size', 'sha256'}
+        """
+        with self._lock:
+            entries = dict(self._entries)
+
+        files = dict()
+        for name, (path, fingerprint, future) in sorted(entries.items()):
+            try:
+                checksum = future.result()
+            except OSError:
+                checksum = None
+
+            current_fingerprint = PackageJournal.fingerprint(path)
+            if current_fingerprint is None:
+                # removed since
+                continue
+            if current_fingerprint != fingerprint or checksum is None:
+                # modified while it has been hashed
+                checksum = file_checksum(path, None, PackageManifest.ALGORITHM)
+            files[name] = {'size': current_fingerprint[0], PackageManifest.ALGORITHM: checksum}
+        return files
+
+    def write(self):
+        """
+        Wait for all the hashes and write the manifest into the package folder.
+
+        :return: The path to the manifest
+        """
+        content = {
+            'version': PackageManifest.VERSION,
+            'algorithm': PackageManifest.ALGORITHM,
+            'files': self.files(),
+        }
+        path = os.path.join(self.folder, PackageManifest.FILE_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(content, f, indent=1, sort_keys=True)
+        self.close()
+        return path
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @staticmethod
+    def load(folder):
+        """
+        Read the manifest of a package folder.
+
+        :return: A dict of path in the package -> {'size', 'sha256'}
+        """
+        path = os.path.join(folder, PackageManifest.FILE_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except (OSError, ValueError) as err:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Could not read the package manifest {path}: {error}').format(
+                    path=path, error=err))
+
+        if content.get('version') != PackageManifest.VERSION or content.get('algorithm') != PackageManifest.ALGORITHM:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Unsupported package manifest {}').format(path))
+        return content['files']
+
+
+class VerificationResult(object):
+
+    def __init__(self):
+        # paths in the package
+        self.unchanged = list()
+        self.changed = list()
+        self.missing = list()
+        self.added = list()
+        # the number of files which had to be hashed
+        self.hashed_count = 0
+
+    @property
+    def is_intact(self):
+        return not self.changed and not self.missing
+
+
+class PackageVerifier(object):
+    """
+    Compares a package folder, e.g. on a device, to its manifest.
+
+    `compare()` only looks at the sizes and modification times of the files and is quick.
+    `verify()` hashes the files. Nothing is ever written into the folder, the size, modification
+    time and hash of every verified file can be remembered in a state file elsewhere: the next
+    verification only hashes the files whose size or modification time differ from then. A file
+    with a different size than in the manifest is never hashed at all.
+    """
+
+    # File systems like FAT store modification times in steps of two seconds
+    MTIME_TOLERANCE_NS = 2 * 10 ** 9
+
+    def __init__(self, folder, state_path=None):
+        """
+        :param folder: The package folder
+        :param state_path: The file remembering the verified files, outside of the folder. If None, all
+                           the files are hashed on every verification
+        """
+        self.folder = folder
+        self.state_path = state_path
+
+    @staticmethod
+    def cache_path(folder):
+        """
+        :return: A state file for the verifications of a folder in the QGIS profile
+        """
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(folder)).encode('utf-8')).hexdigest()
+        return os.path.join(QgsApplication.qgisSettingsDirPath(), 'qfieldsync', 'verified', key + '.json')
+
+    def compare(self):
+        """
+        Compare the sizes and modification times to the manifest, without reading any file.
+
+        A file is changed if its size differs from the manifest or if it has been modified after the
+        manifest has been written.
+
+        :return: A VerificationResult
+        """
+        manifest = PackageManifest.load(self.folder)
+        manifest_mtime = os.stat(os.path.join(self.folder, PackageManifest.FILE_NAME)).st_mtime_ns
+        result = VerificationResult()
+
+        for name, expected in manifest.items():
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                result.missing.append(name)
+                continue
+            if stat.st_size != expected['size'] or stat.st_mtime_ns > manifest_mtime + PackageVerifier.MTIME_TOLERANCE_NS:
+                result.changed.append(name)
+            else:
+                result.unchanged.append(name)
+
+        result.added = self._added_files(manifest)
+        for files in (result.unchanged, result.changed, result.missing):
+            files.sort()
+        return result
+
+    def verify(self, progress_callback=None):
+        """
+        :param progress_callback: called with (done, total) after every file
+        :return: A VerificationResult
+        """
+        manifest = PackageManifest.load(self.folder)
+        state = self._load_state()
+        new_state = dict()
+        result = VerificationResult()
+
+        to_hash = dict()
+        for name, expected in manifest.items():
+            path = os.path.join(self.folder, name)
+            fingerprint = PackageJournal.fingerprint(path)
+            if fingerprint is None:
+                result.missing.append(name)
+            elif fingerprint[0] != expected['size']:
+                result.changed.append(name)
+            elif state.get(name, [None, None])[:2] == fingerprint:
+                new_state[name] = state[name]
+            else:
+                to_hash[name] = (path, fingerprint)
+
+        done = 0
+        total = len(manifest)
+        if to_hash:
+            with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+                futures = {name: executor.submit(file_checksum, path, None, PackageManifest.ALGORITHM)
+                           for name, (path, _) in to_hash.items()}
+                for name, future in futures.items():
+                    new_state[name] = to_hash[name][1] + [future.result()]
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, total)
+        result.hashed_count = len(to_hash)
+
+        for name, (_, _, checksum) in new_state.items():
+            if checksum == manifest[name][PackageManifest.ALGORITHM]:
+                result.unchanged.append(name)
+            else:
+                result.changed.append(name)
+
+        result.added = self._added_files(manifest)
+        for files in (result.unchanged, result.changed, result.missing):
+            files.sort()
+
+        self._save_state(new_state)
+        if progress_callback:
+            progress_callback(total, total)
+        return result
+
+    def _added_files(self, manifest):
+        added = list()
+        for root, _, files in os.walk(self.folder):
+            for file_name in files:
+                name = os.path.relpath(os.path.join(root, file_name), self.folder).replace(os.sep, '/')
+                if name not in manifest and not PackageManifest.is_ignored(name):
+                    added.append(name)
+        return sorted(added)
+
+    def _load_state(self):
+        if self.state_path is None:
+            return dict()
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def _save_state(self, state):
+        if self.state_path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+        except OSError:
+            # without a state, the folder is verified completely every time
+            pass
@@ -1,5 +1,5 @@
 import os
-from qfieldsync.setting_manager import SettingManager, Scope, String
+from qfieldsync.setting_manager import SettingManager, Scope, Bool, String
 
 pluginName = "QFieldSync"
 
@@ -9,6 +9,10 @@ class Preferences(SettingManager):
         SettingManager.__init__(self, pluginName, False)
         self.add_setting(String('exportDirectory', Scope.Global, os.path.expanduser("~/QField/export")))
         self.add_setting(String('exportDirectoryProject', Scope.Project, None))
+        self.add_setting(String('packageArchiveFormat', Scope.Global, ''))
+        self.add_setting(String('deployDirectory', Scope.Global, ''))
         self.add_setting(String('importDirectory', Scope.Global, os.path.expanduser("~/QField/import")))
         self.add_setting(String('importDirectoryProject', Scope.Project, None))
+        self.add_setting(Bool('profileMemory', Scope.Global, False))
+        self.add_setting(String('logDirectory', Scope.Global, os.path.expanduser("~/QField/logs")))
 
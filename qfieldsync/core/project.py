@@ -1,3 +1,6 @@
+import json
+
+from functools import partial
 
 
 class ProjectProperties(object):
@@ -13,8 +16,12 @@ class ProjectProperties(object):
     BASE_MAP_MUPP = '/baseMapMupp'
     OFFLINE_COPY_ONLY_AOI = '/offlineCopyOnlyAoi'
     OFFLINE_COPY_ONLY_SELECTED_FEATURES = '/offlineCopyOnlySelectedFeatures'
+    CLIP_COPIED_LAYERS_TO_AOI = '/clipCopiedLayersToAoi'
     ORIGINAL_PROJECT_PATH = '/originalProjectPath'
     IMPORTED_FILES_CHECKSUMS = '/importedFilesChecksums'
+    LAYER_ID_MAPPING = '/layerIdMapping'
+    TARGET_CRS = '/targetCrs'
+    REPROJECT_RASTERS = '/reprojectRasters'
 
     class BaseMapType(object):
 
@@ -28,24 +35,156 @@ class ProjectProperties(object):
 class ProjectConfiguration(object):
     """
     Manages the QFieldSync specific configuration for a QGIS project.
+
+    In snapshot mode, all the entries are read once when the configuration is
+    created (or on `load()`), changes are kept in memory and only written to the
+    project in a single batch on `commit()`.
     """
 
-    def __init__(self, project):
+    SCOPE = 'qfieldsync'
+
+    # File names of the projects QFieldSync has written to since they have been saved, their files are outdated
+    _written_project_files = set()
+    # ids of the projects whose saving is tracked
+    _tracked_projects = set()
+
+    # Type and default value of each entry
+    ENTRIES = {
+        ProjectProperties.CREATE_BASE_MAP: (bool, False),
+        ProjectProperties.BASE_MAP_TYPE: (str, ProjectProperties.BaseMapType.SINGLE_LAYER),
+        ProjectProperties.BASE_MAP_THEME: (str, ''),
+        ProjectProperties.BASE_MAP_LAYER: (str, ''),
+        ProjectProperties.BASE_MAP_TILE_SIZE: (int, 1024),
+        ProjectProperties.BASE_MAP_MUPP: (float, 10.0),
+        ProjectProperties.OFFLINE_COPY_ONLY_AOI: (bool, False),
+        ProjectProperties.OFFLINE_COPY_ONLY_SELECTED_FEATURES: (bool, False),
+        ProjectProperties.CLIP_COPIED_LAYERS_TO_AOI: (bool, False),
+        ProjectProperties.ORIGINAL_PROJECT_PATH: (str, ''),
+        ProjectProperties.IMPORTED_FILES_CHECKSUMS: (list, []),
+        ProjectProperties.LAYER_ID_MAPPING: (str, ''),
+        ProjectProperties.TARGET_CRS: (str, ''),
+        ProjectProperties.REPROJECT_RASTERS: (bool, False),
+    }
+
+    def __init__(self, project, snapshot=False):
         self.project = project
+        self._snapshot = None
+        self._dirty = set()
+
+        if snapshot:
+            self.load()
+
+    @property
+    def is_snapshot(self):
+        return self._snapshot is not None
+
+    @property
+    def is_dirty(self):
+        return bool(self._dirty)
+
+    def load(self):
+        """
+        Read all the entries from the project into the snapshot, discarding uncommitted changes.
+        """
+        self._snapshot = {key: self._read_entry(key) for key in self.ENTRIES}
+        self._dirty = set()
+
+    def commit(self):
+        """
+        Write all the entries changed since the snapshot has been loaded to the project.
+
+        The project signals are blocked while writing, the project is marked dirty once at the end.
+        """
+        if not self._dirty:
+            return
+
+        # writing an entry marks the project dirty, with the signals blocked nobody would be told
+        was_dirty = self.project.isDirty()
+        signals_blocked = self.project.blockSignals(True)
+        try:
+            for key in self._dirty:
+                self._write_entry(key, self._snapshot[key])
+            if not was_dirty:
+                self.project.setDirty(False)
+        finally:
+            self.project.blockSignals(signals_blocked)
+
+        self._dirty = set()
+        self.project.setDirty(True)
+
+    def _read(self, key):
+        if self._snapshot is not None:
+            value = self._snapshot[key]
+            # hand out copies of lists, so in place modifications are not silently taken into the snapshot
+            return list(value) if isinstance(value, list) else value
+        return self._read_entry(key)
+
+    def _write(self, key, value):
+        if self._snapshot is not None:
+            if self._snapshot[key] != value:
+                self._snapshot[key] = value
+                self._dirty.add(key)
+        else:
+            self._write_entry(key, value)
+
+    def _read_entry(self, key):
+        entry_type, default = self.ENTRIES[key]
+
+        if entry_type == bool:
+            value, _ = self.project.readBoolEntry(self.SCOPE, key, default)
+        elif entry_type == int:
+            value, _ = self.project.readNumEntry(self.SCOPE, key, default)
+        elif entry_type == float:
+            value, _ = self.project.readDoubleEntry(self.SCOPE, key, default)
+        elif entry_type == list:
+            value, _ = self.project.readListEntry(self.SCOPE, key)
+        else:
+            value, _ = self.project.readEntry(self.SCOPE, key, default)
+
+        return value
+
+    def _write_entry(self, key, value):
+        entry_type, _ = self.ENTRIES[key]
+
+        if entry_type == float:
+            self.project.writeEntryDouble(self.SCOPE, key, value)
+        else:
+            self.project.writeEntry(self.SCOPE, key, value)
+        ProjectConfiguration.mark_written(self.project)
+
+    @staticmethod
+    def mark_written(project):
+        """
+        Remember that QFieldSync has changed the project in memory, e.g. its entries or layer properties,
+        until the project is saved
+        """
+        ProjectConfiguration._written_project_files.add(project.fileName())
+        if id(project) not in ProjectConfiguration._tracked_projects:
+            ProjectConfiguration._tracked_projects.add(id(project))
+            project.projectSaved.connect(partial(ProjectConfiguration._saved, project))
+
+    @staticmethod
+    def was_written(project):
+        """
+        Whether QFieldSync has changed the project since it has been saved, even if it is not dirty
+        """
+        return project.fileName() in ProjectConfiguration._written_project_files
+
+    @staticmethod
+    def _saved(project):
+        ProjectConfiguration._written_project_files.discard(project.fileName())
 
     @property
     def create_base_map(self):
-        create_base_map, _ = self.project.readBoolEntry('qfieldsync', ProjectProperties.CREATE_BASE_MAP, False)
-        return create_base_map
+        return self._read(ProjectProperties.CREATE_BASE_MAP)
 
     @create_base_map.setter
     def create_base_map(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.CREATE_BASE_MAP, value)
+        self._write(ProjectProperties.CREATE_BASE_MAP, value)
 
     @property
     def base_map_type(self):
-        base_map_type, _ = self.project.readEntry('qfieldsync', ProjectProperties.BASE_MAP_TYPE,
-                                                  ProjectProperties.BaseMapType.SINGLE_LAYER)
+        base_map_type = self._read(ProjectProperties.BASE_MAP_TYPE)
         if base_map_type != ProjectProperties.BaseMapType.SINGLE_LAYER:
             return ProjectProperties.BaseMapType.MAP_THEME
         else:
@@ -56,77 +195,110 @@ class ProjectConfiguration(object):
         if value != ProjectProperties.BaseMapType.SINGLE_LAYER and value != ProjectProperties.BaseMapType.MAP_THEME:
             raise ValueError('Only supported types can be set')
 
-        self.project.writeEntry('qfieldsync', ProjectProperties.BASE_MAP_TYPE, value)
+        self._write(ProjectProperties.BASE_MAP_TYPE, value)
 
     @property
     def base_map_theme(self):
-        base_map_theme, _ = self.project.readEntry('qfieldsync', ProjectProperties.BASE_MAP_THEME)
-        return base_map_theme
+        return self._read(ProjectProperties.BASE_MAP_THEME)
 
     @base_map_theme.setter
     def base_map_theme(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.BASE_MAP_THEME, value)
+        self._write(ProjectProperties.BASE_MAP_THEME, value)
 
     @property
     def base_map_layer(self):
-        base_map_layer, _ = self.project.readEntry('qfieldsync', ProjectProperties.BASE_MAP_LAYER)
-        return base_map_layer
+        return self._read(ProjectProperties.BASE_MAP_LAYER)
 
     @base_map_layer.setter
     def base_map_layer(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.BASE_MAP_LAYER, value)
+        self._write(ProjectProperties.BASE_MAP_LAYER, value)
 
     @property
     def base_map_tile_size(self):
-        base_map_tile_size, _ = self.project.readNumEntry('qfieldsync', ProjectProperties.BASE_MAP_TILE_SIZE, 1024)
-        return base_map_tile_size
+        return self._read(ProjectProperties.BASE_MAP_TILE_SIZE)
 
     @base_map_tile_size.setter
     def base_map_tile_size(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.BASE_MAP_TILE_SIZE, value)
+        self._write(ProjectProperties.BASE_MAP_TILE_SIZE, value)
 
     @property
     def base_map_mupp(self):
-        base_map_mupp, _ = self.project.readDoubleEntry('qfieldsync', ProjectProperties.BASE_MAP_MUPP, 10.0)
-        return base_map_mupp
+        return self._read(ProjectProperties.BASE_MAP_MUPP)
 
     @base_map_mupp.setter
     def base_map_mupp(self, value):
-        self.project.writeEntryDouble('qfieldsync', ProjectProperties.BASE_MAP_MUPP, value)
+        self._write(ProjectProperties.BASE_MAP_MUPP, value)
 
     @property
     def offline_copy_only_aoi(self):
-        offline_copy_only_aoi, _ = self.project.readBoolEntry('qfieldsync', ProjectProperties.OFFLINE_COPY_ONLY_AOI)
-        return offline_copy_only_aoi
+        return self._read(ProjectProperties.OFFLINE_COPY_ONLY_AOI)
 
     @offline_copy_only_aoi.setter
     def offline_copy_only_aoi(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.OFFLINE_COPY_ONLY_AOI, value)
+        self._write(ProjectProperties.OFFLINE_COPY_ONLY_AOI, value)
 
     @property
     def offline_copy_only_selected_features(self):
-        offline_copy_only_selected_features, _ = self.project.readBoolEntry('qfieldsync',
-                                                                            ProjectProperties.OFFLINE_COPY_ONLY_SELECTED_FEATURES)
-        return offline_copy_only_selected_features
+        return self._read(ProjectProperties.OFFLINE_COPY_ONLY_SELECTED_FEATURES)
 
     @offline_copy_only_selected_features.setter
     def offline_copy_only_selected_features(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.OFFLINE_COPY_ONLY_SELECTED_FEATURES, value)
+        self._write(ProjectProperties.OFFLINE_COPY_ONLY_SELECTED_FEATURES, value)
+
+    @property
+    def clip_copied_layers_to_aoi(self):
+        return self._read(ProjectProperties.CLIP_COPIED_LAYERS_TO_AOI)
+
+    @clip_copied_layers_to_aoi.setter
+    def clip_copied_layers_to_aoi(self, value):
+        self._write(ProjectProperties.CLIP_COPIED_LAYERS_TO_AOI, value)
+
+    @property
+    def target_crs(self):
+        """
+        The authority id of the CRS the layers are reprojected to while packaging, empty to keep the layer CRS
+        """
+        return self._read(ProjectProperties.TARGET_CRS)
+
+    @target_crs.setter
+    def target_crs(self, value):
+        self._write(ProjectProperties.TARGET_CRS, value)
+
+    @property
+    def reproject_rasters(self):
+        return self._read(ProjectProperties.REPROJECT_RASTERS)
+
+    @reproject_rasters.setter
+    def reproject_rasters(self, value):
+        self._write(ProjectProperties.REPROJECT_RASTERS, value)
 
     @property
     def original_project_path(self):
-        original_project_path, _ = self.project.readEntry('qfieldsync', ProjectProperties.ORIGINAL_PROJECT_PATH)
-        return original_project_path
+        return self._read(ProjectProperties.ORIGINAL_PROJECT_PATH)
 
     @original_project_path.setter
     def original_project_path(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.ORIGINAL_PROJECT_PATH, value)
+        self._write(ProjectProperties.ORIGINAL_PROJECT_PATH, value)
 
     @property
     def imported_files_checksums(self):
-        imported_files_checksums, _ = self.project.readListEntry('qfieldsync', ProjectProperties.IMPORTED_FILES_CHECKSUMS)
-        return imported_files_checksums
+        return self._read(ProjectProperties.IMPORTED_FILES_CHECKSUMS)
 
     @imported_files_checksums.setter
     def imported_files_checksums(self, value):
-        self.project.writeEntry('qfieldsync', ProjectProperties.IMPORTED_FILES_CHECKSUMS, value)
+        self._write(ProjectProperties.IMPORTED_FILES_CHECKSUMS, value)
+
+    @property
+    def layer_id_mapping(self):
+        """
+        The ids of the layers of a packaged project, by the ids of the layers in the original project
+        """
+        value = self._read(ProjectProperties.LAYER_ID_MAPPING)
+        try:
+            return json.loads(value) if value else {}
+        except ValueError:
+            return {}
+
+    @layer_id_mapping.setter
+    def layer_id_mapping(self, value):
+        self._write(ProjectProperties.LAYER_ID_MAPPING, json.dumps(value, sort_keys=True))
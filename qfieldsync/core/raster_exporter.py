@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsMessageLog, Qgis
+
+from qfieldsync.utils.gdal_utils import optimize_raster
+
+
+class RasterExporter(object):
+    """
+    Rewrites copied rasters as cloud optimized GeoTIFFs on a pool of worker threads.
+
+    Only the GDAL work happens on the workers, the datasources of the layers are
+    adjusted on the calling thread in `wait()` or collected to be applied later.
+    """
+
+    def __init__(self, max_workers=None, journal=None, data_source_changes=None):
+        """
+        :param max_workers: The number of worker threads, defaults to the number of CPUs up to 4
+        :param journal: if set, the PackageJournal recording the exported rasters
+        :param data_source_changes: if set, a list the new datasources are appended to as (layer_source, datasource)
+                                    instead of being applied in `wait()`
+        """
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.journal = journal
+        self.data_source_changes = data_source_changes
+        self._executor = None
+        self._jobs = dict()
+        self._paths = dict()
+        self._futures_by_target = dict()
+
+    def submit(self, layer_source, source_path, target_path, extent, new_source, target_srs=None):
+        """
+        Schedule the export of a raster.
+
+        :param layer_source: The LayerSource of the raster
+        :param source_path: The path to the source raster
+        :param target_path: The path of the GeoTIFF to create
+        :param extent: If set, the clipping extent (xmin, ymin, xmax, ymax) in the raster CRS
+        :param new_source: The datasource to set on the layer once the raster has been written
+        :param target_srs: If set, the CRS (authority id or WKT) the raster is warped to
+
+        Layers submitted with a target path which has already been scheduled share the first export.
+        """
+        future = self._futures_by_target.get(target_path)
+        if future is None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+            future = self._executor.submit(optimize_raster, source_path, target_path, extent, target_srs)
+            self._paths[future] = (source_path, target_path)
+            self._futures_by_target[target_path] = future
+            self._jobs[future] = list()
+
+        self._jobs[future].append((layer_source, new_source))
+
+    @property
+    def pending_count(self):
+        return len(self._jobs)
+
+    def wait(self, progress_callback=None):
+        """
+        Wait for all scheduled exports and adjust the datasources of the exported layers.
+
+        :param progress_callback: called with (done, total, layer_name) whenever an export has finished
+        :return: A tuple with the total source and exported size in bytes
+        """
+        total_before = 0
+        total_after = 0
+        job_count = len(self._jobs)
+
+        for done, future in enumerate(as_completed(self._jobs), 1):
+            layers = self._jobs[future]
+            layer_names = ', '.join(layer_source.name for layer_source, _ in layers)
+            sizes = future.result()
+
+            if sizes is None:
+                layers[0][0].log_not_intersecting(layer_names)
+                for layer_source, _ in layers:
+                    layer_source.exclude_from_package(self.data_source_changes)
+            else:
+                before, after = sizes
+                total_before += before
+                total_after += after
+                if self.journal is not None:
+                    self.journal.file_done(*self._paths[future])
+                for layer_source, new_source in layers:
+                    if self.data_source_changes is None:
+                        layer_source.change_data_source(new_source)
+                    else:
+                        self.data_source_changes.append((layer_source, new_source))
+                QgsMessageLog.logMessage(
+                    QCoreApplication.translate('QFieldSync',
+                                               'Optimized raster "{name}": {before:.1f} MB -> {after:.1f} MB').format(
+                        name=layer_names, before=before / 1024 ** 2, after=after / 1024 ** 2),
+                    'QFieldSync', Qgis.Info)
+
+            if progress_callback:
+                progress_callback(done, job_count, layer_names)
+
+        self._jobs = dict()
+        self._paths = dict()
+        self._futures_by_target = dict()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+        return total_before, total_after
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import time
+
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
+from qgis.core import (
+    NULL,
+    Qgis,
+    QgsCoordinateTransform,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsGeometry,
+    QgsMessageLog,
+    QgsVectorLayer,
+)
+
+from qfieldsync.core.layer_inventory import LayerInventory
+from qfieldsync.core.offline_log import OfflineLog
+from qfieldsync.core.project import ProjectConfiguration
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+
+class LayerStatistics(object):
+    """
+    What has been written to the remote provider of a layer, and how fast.
+    """
+
+    def __init__(self, layer_name, log_entry_count, original_layer_id=None):
+        self.layer_name = layer_name
+        # the id of the layer in the original project, if the package recorded it
+        self.original_layer_id = original_layer_id
+        self.log_entry_count = log_entry_count
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.seconds = 0.0
+
+    @property
+    def feature_count(self):
+        return self.inserted + self.updated + self.deleted
+
+    @property
+    def features_per_second(self):
+        return self.feature_count / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return QCoreApplication.translate(
+            'QFieldSync',
+            '{layer}: {inserted} inserted, {updated} updated, {deleted} deleted from {entries} logged edits '
+            'in {seconds:.1f}s ({rate:.0f} features/s)').format(
+                layer=self.layer_name, inserted=self.inserted, updated=self.updated, deleted=self.deleted,
+                entries=self.log_entry_count, seconds=self.seconds, rate=self.features_per_second)
+
+
+class SyncEngine(object):
+    """
+    Writes the edits logged in an offline project to the remote layers in batches.
+
+    `QgsOfflineEditing.synchronize()` replays the log one edit at a time. This reads the log
+    of every offline layer directly, collapses it into one net change per feature and writes
+    the changes straight to the remote data provider, one batch per call. The applied changes
+    are removed from the log, so `QgsOfflineEditing.synchronize()` run afterwards only restores
+    the remote layers in the project.
+
+    Every batch is removed from the log right after it has been written, the two are not atomic.
+    If the synchronization is interrupted in between, removals and changes are applied again
+    harmlessly, added features are written again and reported as possible duplicates.
+
+    Layers with added attributes are left to `QgsOfflineEditing`, unless their fields have been
+    pruned or they have been reprojected. `QgsOfflineEditing` matches the attributes by position
+    and writes the geometries as they are, so the added attributes are created in the remote layer
+    here, all the values are matched by name and the geometries are transformed back to the CRS of
+    the remote layer. Nothing which cannot be matched is left in the log.
+    """
+
+    # The number of features written to the remote provider in a single call
+    BATCH_SIZE = 5000
+
+    def __init__(self, project):
+        self.project = project
+        self.statistics = list()
+        # packaged layer id -> original layer id
+        self.original_layer_ids = {layer_id: original_layer_id for original_layer_id, layer_id
+                                   in ProjectConfiguration(project).layer_id_mapping.items()}
+
+    def offline_layers(self):
+        """
+        :return: The offline editable vector layers of the project
+        """
+        return [layer for layer in self.project.mapLayers().values()
+                if isinstance(layer, QgsVectorLayer) and layer.customProperty('isOfflineEditable')]
+
+    def synchronize(self, progress_callback=None):
+        """
+        Write the logged edits of all the offline layers.
+
+        :param progress_callback: called with (done, total, layer_name) while changes are written
+        :return: A list of LayerStatistics, one per synchronized layer
+        """
+        layers_by_database = dict()
+        inventory = LayerInventory.instance(self.project)
+        for layer in self.offline_layers():
+            path = inventory.entry(layer).path
+            if os.path.isfile(path):
+                layers_by_database.setdefault(path, list()).append(layer)
+
+        self.statistics = list()
+        for path, layers in layers_by_database.items():
+            with OfflineLog(path) as offline_log:
+                if not offline_log.is_valid():
+                    continue
+
+                log_layer_ids = offline_log.layer_ids()
+                pending = list()
+                for layer in layers:
+                    if layer.id() not in log_layer_ids:
+                        continue
+                    changes = offline_log.changes(log_layer_ids[layer.id()])
+                    if (changes.added_attribute_count and not layer.customProperty('QFieldSync/prune_fields')
+                            and not self._is_reprojected(layer)):
+                        QgsMessageLog.logMessage(
+                            QCoreApplication.translate(
+                                'QFieldSync', 'Attributes have been added to layer {}, it is synchronized by QGIS').format(
+                                    layer.name()),
+                            'QFieldSync', Qgis.Info)
+                    elif changes.change_count or changes.discarded or changes.added_attribute_count:
+                        pending.append((layer, changes))
+
+                total = sum(changes.change_count for _, changes in pending)
+                done = 0
+                for layer, changes in pending:
+                    def layer_progress(count, layer_name=layer.name(), offset=done):
+                        if progress_callback:
+                            progress_callback(offset + count, total, layer_name)
+
+                    statistics = self._synchronize_layer(layer, changes, offline_log, layer_progress)
+                    done += changes.change_count
+                    self.statistics.append(statistics)
+                    QgsMessageLog.logMessage(str(statistics), 'QFieldSync', Qgis.Info)
+
+        return self.statistics
+
+    def _synchronize_layer(self, layer, changes, offline_log, progress_callback):
+        start = time.monotonic()
+        statistics = LayerStatistics(layer.name(), changes.log_entry_count, self.original_layer_ids.get(layer.id()))
+
+        remote_layer = self._remote_layer(layer)
+        if not remote_layer.isValid():
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Could not open the remote data of layer {}').format(layer.name()))
+
+        provider = remote_layer.dataProvider()
+        if changes.added_attribute_count:
+            # only for pruned or reprojected layers, QgsOfflineEditing synchronizes the others
+            self._add_attributes(layer, provider, changes.layer_id, offline_log)
+        remote_fields = provider.fields()
+        # offline attribute index -> remote attribute index, matched by name
+        attribute_map = dict()
+        for offline_index, field in enumerate(layer.dataProvider().fields()):
+            remote_index = remote_fields.lookupField(field.name())
+            if remote_index >= 0:
+                attribute_map[offline_index] = remote_index
+
+        transform = None
+        if layer.crs() != remote_layer.crs():
+            transform = QgsCoordinateTransform(layer.crs(), remote_layer.crs(), self.project)
+
+        def remote_geometry(geometry):
+            geometry = QgsGeometry(geometry)
+            if transform is not None and not geometry.isNull():
+                geometry.transform(transform)
+            return geometry
+
+        def check(succeeded):
+            if not succeeded:
+                raise QFieldSyncError(
+                    QCoreApplication.translate('QFieldSync', 'Could not write the changes of layer {layer}: {errors}').format(
+                        layer=layer.name(), errors='\n'.join(provider.errors())))
+
+        done = 0
+        log_layer_id = changes.layer_id
+        interrupted = offline_log.interrupted_added(log_layer_id)
+        if interrupted:
+            # rather written twice than lost
+            QgsMessageLog.logMessage(
+                QCoreApplication.translate(
+                    'QFieldSync',
+                    'A previous synchronization of layer {layer} has been interrupted, these added features '
+                    'may have been written twice: {fids}').format(
+                        layer=layer.name(), fids=', '.join(str(fid) for fid in interrupted)),
+                'QFieldSync', Qgis.Warning)
+        if changes.discarded:
+            offline_log.discard(log_layer_id, changes.discarded)
+
+        # keys generated by the remote provider are not taken from the offline copy, they would collide.
+        # Fields which have not been packaged get their default values.
+        mapped_indexes = set(attribute_map.values())
+        primary_keys = set(provider.pkAttributeIndexes())
+        generated_keys = {index: provider.defaultValueClause(index) for index in range(remote_fields.count())
+                          if (index in primary_keys or index not in mapped_indexes)
+                          and provider.defaultValueClause(index)}
+
+        for fids in self._batches(changes.added):
+            offline_fids = list()
+            features = list()
+            request = QgsFeatureRequest().setFilterFids(fids)
+            for offline_feature in layer.dataProvider().getFeatures(request):
+                attributes = [NULL] * remote_fields.count()
+                for offline_index, value in enumerate(offline_feature.attributes()):
+                    if offline_index in attribute_map:
+                        attributes[attribute_map[offline_index]] = value
+                for index, clause in generated_keys.items():
+                    attributes[index] = clause
+
+                feature = QgsFeature(remote_fields)
+                feature.setAttributes(attributes)
+                feature.setGeometry(remote_geometry(offline_feature.geometry()))
+                features.append(feature)
+                offline_fids.append(offline_feature.id())
+
+            offline_log.writing_added(log_layer_id, offline_fids)
+            succeeded, added_features = provider.addFeatures(features)
+            check(succeeded)
+            offline_log.applied_added(log_layer_id, offline_fids, [feature.id() for feature in added_features])
+            statistics.inserted += len(features)
+            done += len(fids)
+            progress_callback(done)
+
+        unmapped = [fid for fid in changes.removed if fid not in changes.fid_map]
+        for fids in self._batches([fid for fid in changes.removed if fid in changes.fid_map]):
+            check(provider.deleteFeatures([changes.fid_map[fid] for fid in fids]))
+            offline_log.applied_removed(log_layer_id, fids)
+            statistics.deleted += len(fids)
+            done += len(fids)
+            progress_callback(done)
+        if unmapped:
+            # features which are unknown to the remote layer are gone already
+            offline_log.applied_removed(log_layer_id, unmapped)
+            done += len(unmapped)
+
+        for fids in self._batches([fid for fid in changes.attribute_changes if fid in changes.fid_map]):
+            attribute_changes = dict()
+            for fid in fids:
+                attribute_changes[changes.fid_map[fid]] = {
+                    attribute_map[index]: self._convert(remote_fields.at(attribute_map[index]), value)
+                    for index, value in changes.attribute_changes[fid].items() if index in attribute_map}
+            check(provider.changeAttributeValues(attribute_changes))
+            offline_log.applied_attribute_changes(log_layer_id, fids)
+            statistics.updated += len(fids)
+            done += len(fids)
+            progress_callback(done)
+
+        # changes of features which are unknown to the remote layer cannot be written, QgsOfflineEditing
+        # must not get to replay them either
+        unmapped = [fid for fid in changes.attribute_changes if fid not in changes.fid_map]
+        if unmapped:
+            offline_log.applied_attribute_changes(log_layer_id, unmapped)
+            done += len(unmapped)
+
+        for fids in self._batches([fid for fid in changes.geometry_changes if fid in changes.fid_map]):
+            geometry_changes = {
+                changes.fid_map[fid]: remote_geometry(QgsGeometry.fromWkt(changes.geometry_changes[fid]))
+                for fid in fids}
+            check(provider.changeGeometryValues(geometry_changes))
+            offline_log.applied_geometry_changes(log_layer_id, fids)
+            # a feature with changed attributes and geometry is counted once
+            statistics.updated += len([fid for fid in fids if fid not in changes.attribute_changes])
+            done += len(fids)
+            progress_callback(done)
+
+        unmapped = [fid for fid in changes.geometry_changes if fid not in changes.fid_map]
+        if unmapped:
+            offline_log.applied_geometry_changes(log_layer_id, unmapped)
+            done += len(unmapped)
+
+        statistics.seconds = time.monotonic() - start
+        return statistics
+
+    @staticmethod
+    def _remote_layer(layer):
+        return QgsVectorLayer(layer.customProperty('remoteSource'), layer.name(), layer.customProperty('remoteProvider'))
+
+    def _is_reprojected(self, layer):
+        """
+        Whether the offline layer is stored in another CRS than the remote layer
+        """
+        remote_layer = self._remote_layer(layer)
+        return remote_layer.isValid() and layer.crs() != remote_layer.crs()
+
+    @staticmethod
+    def _add_attributes(layer, provider, log_layer_id, offline_log):
+        """
+        Create the attributes added in QField in the remote layer, unless it has them already
+        """
+        remote_fields = provider.fields()
+        # the first native type of the provider for every variant type
+        type_names = {native_type.mType: native_type.mTypeName for native_type in reversed(provider.nativeTypes())}
+        fields = list()
+        for name, field_type, length, precision, comment in offline_log.added_attributes(log_layer_id):
+            if remote_fields.lookupField(name) < 0:
+                field_type = QVariant.Type(field_type)
+                fields.append(QgsField(name, field_type, type_names.get(field_type, ''), length or 0, precision or 0,
+                                       comment or ''))
+
+        if fields and not provider.addAttributes(fields):
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Could not add the attributes {fields} to layer {layer}: {errors}').format(
+                    fields=', '.join(field.name() for field in fields), layer=layer.name(), errors='\n'.join(provider.errors())))
+        offline_log.applied_added_attributes(log_layer_id)
+
+    @staticmethod
+    def _batches(fids):
+        fids = list(fids)
+        for offset in range(0, len(fids), SyncEngine.BATCH_SIZE):
+            yield fids[offset:offset + SyncEngine.BATCH_SIZE]
+
+    @staticmethod
+    def _convert(field, value):
+        """
+        Convert a value from the log, where all values are stored as text, to the type of the remote field
+        """
+        if value is None or (value == '' and field.type() != QVariant.String):
+            return NULL
+        try:
+            return field.convertCompatible(value)
+        except ValueError:
+            return value
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import time
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from qfieldsync.core.offline_log import OfflineLog
+from qfieldsync.core.package_manifest import PackageManifest, PackageVerifier
+from qfieldsync.core.project import ProjectProperties
+from qfieldsync.utils.file_utils import get_project_in_folder
+from qfieldsync.utils.qgis_utils import read_project_entries, read_project_layers
+
+
+class LayerDiff(object):
+    """
+    The net changes a synchronization would write to a layer.
+    """
+
+    def __init__(self, layer_id, name, added=0, edited=0, deleted=0, added_attributes=0, log_entries=0):
+        self.layer_id = layer_id
+        self.name = name
+        self.added = added
+        self.edited = edited
+        self.deleted = deleted
+        self.added_attributes = added_attributes
+        self.log_entries = log_entries
+
+
+class SyncPreview(object):
+    """
+    What synchronizing a QField folder would change, without changing anything.
+
+    Only the offline databases, the project file and the DCIM folders are read, the projects
+    are not opened and nothing is written. The files of the package are compared to its manifest
+    by size and modification time, `PackageVerifier.verify()` hashes them. Safe to call outside
+    of the main thread.
+    """
+
+    def __init__(self, qfield_folder):
+        """
+        :param qfield_folder: The folder returned from QField
+        """
+        self.qfield_folder = qfield_folder
+        self.original_project_path = None
+        self.layers = list()
+        self.new_pictures = list()
+        self.changed_pictures = list()
+        self.picture_bytes = 0
+        # the VerificationResult of comparing the folder to its manifest, if the package has one
+        self.verification = None
+        self.seconds = 0.0
+
+    def scan(self):
+        start = time.monotonic()
+
+        qgs_file = get_project_in_folder(self.qfield_folder)
+        self.original_project_path = read_project_entries(qgs_file).get(ProjectProperties.ORIGINAL_PROJECT_PATH)
+        layer_names = read_project_layers(qgs_file)
+
+        self.layers = list()
+        for entry in os.scandir(self.qfield_folder):
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in ('.gpkg', '.sqlite'):
+                continue
+            with OfflineLog(entry.path, read_only=True) as offline_log:
+                if not offline_log.is_valid():
+                    continue
+                qgis_ids = {layer_id: qgis_id for qgis_id, layer_id in offline_log.layer_ids().items()}
+                for layer_id, counts in offline_log.summary().items():
+                    qgis_id = qgis_ids.get(layer_id, str(layer_id))
+                    self.layers.append(LayerDiff(qgis_id, layer_names.get(qgis_id, qgis_id), **counts))
+        self.layers.sort(key=lambda diff: diff.name.lower())
+
+        self._scan_pictures()
+
+        self.verification = None
+        if os.path.isfile(os.path.join(self.qfield_folder, PackageManifest.FILE_NAME)):
+            self.verification = PackageVerifier(self.qfield_folder).compare()
+
+        self.seconds = time.monotonic() - start
+        return self
+
+    def _scan_pictures(self):
+        self.new_pictures = list()
+        self.changed_pictures = list()
+        self.picture_bytes = 0
+
+        source_folder = os.path.join(self.qfield_folder, 'DCIM')
+        target_folder = None
+        if self.original_project_path:
+            target_folder = os.path.join(os.path.dirname(self.original_project_path), 'DCIM')
+
+        for root, _, files in os.walk(source_folder):
+            for file_name in files:
+                source_path = os.path.join(root, file_name)
+                relative_path = os.path.relpath(source_path, source_folder)
+                size = os.path.getsize(source_path)
+                try:
+                    target_size = os.path.getsize(os.path.join(target_folder, relative_path)) if target_folder else None
+                except OSError:
+                    target_size = None
+
+                if target_size is None:
+                    self.new_pictures.append(relative_path)
+                elif target_size != size:
+                    self.changed_pictures.append(relative_path)
+                else:
+                    continue
+                self.picture_bytes += size
+
+    @property
+    def has_changes(self):
+        return bool(self.new_pictures or self.changed_pictures or any(
+            diff.added or diff.edited or diff.deleted or diff.added_attributes for diff in self.layers))
+
+    def report(self):
+        """
+        :return: A human readable summary of the changes
+        """
+        lines = list()
+        for diff in self.layers:
+            line = QCoreApplication.translate(
+                'QFieldSync', '{name}: {added} added, {edited} edited, {deleted} deleted').format(
+                    name=diff.name, added=diff.added, edited=diff.edited, deleted=diff.deleted)
+            if diff.added_attributes:
+                line += QCoreApplication.translate('QFieldSync', ', {} new attributes').format(diff.added_attributes)
+            lines.append(line)
+
+        if not lines:
+            lines.append(QCoreApplication.translate('QFieldSync', 'No edited layers'))
+
+        lines.append(QCoreApplication.translate(
+            'QFieldSync', 'Pictures: {new} new, {changed} changed ({size:.1f} MB)').format(
+                new=len(self.new_pictures), changed=len(self.changed_pictures), size=self.picture_bytes / 1024 ** 2))
+
+        if self.verification is not None:
+            changed = [name for name in self.verification.changed if not name.startswith('DCIM/')]
+            if changed:
+                lines.append(QCoreApplication.translate('QFieldSync', 'Files changed since packaging: {}').format(
+                    ', '.join(changed)))
+            if self.verification.missing:
+                lines.append(QCoreApplication.translate('QFieldSync', 'Files missing since packaging: {}').format(
+                    ', '.join(self.verification.missing)))
+        return '\n'.join(lines)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from qgis.PyQt.QtCore import pyqtSlot
+from qgis.PyQt.QtWidgets import QDialog, QDialogButtonBox, QMessageBox
+from qgis.PyQt.uic import loadUiType
+
+from qfieldsync.core.package_deployer import PackageDeployer
+from qfieldsync.core.preferences import Preferences
+from qfieldsync.utils.exceptions import ModifiedFilesError, QFieldSyncError
+from qfieldsync.utils.qt_utils import make_folder_selector
+from qfieldsync.utils.task_utils import TaskGroup
+
+DialogUi, _ = loadUiType(os.path.join(os.path.dirname(__file__), '../ui/deploy_dialog.ui'))
+
+
+class DeployDialog(QDialog, DialogUi):
+    """
+    Copies a package to a device mounted as a folder, writing only what changed since the last deployment.
+    """
+
+    def __init__(self, iface, parent=None):
+        super(DeployDialog, self).__init__(parent=parent)
+        self.setupUi(self)
+        self.iface = iface
+        self.preferences = Preferences()
+
+        self.button_box.button(QDialogButtonBox.Save).setText(self.tr('Deploy'))
+        self.button_box.button(QDialogButtonBox.Save).clicked.connect(self.deploy)
+        self.packageDir.setText(self.preferences.value('exportDirectoryProject') or self.preferences.value('exportDirectory'))
+        self.deviceDir.setText(self.preferences.value('deployDirectory'))
+        self.packageDir_button.clicked.connect(make_folder_selector(self.packageDir))
+        self.deviceDir_button.clicked.connect(make_folder_selector(self.deviceDir))
+
+    def deploy(self):
+        package_folder = self.packageDir.text()
+        device_folder = self.deviceDir.text()
+        if not device_folder:
+            self.iface.messageBar().pushWarning('QFieldSync', self.tr('Please select the folder on the device'))
+            return
+
+        self.preferences.set_value('deployDirectory', device_folder)
+        self.button_box.button(QDialogButtonBox.Save).setEnabled(False)
+        self.resultLabel.clear()
+        try:
+            try:
+                result = self.run_deployer(PackageDeployer(package_folder, device_folder, self.removeStaleCheckBox.isChecked()))
+            except ModifiedFilesError as e:
+                # e.g. data edited in QField which has not been synchronized yet
+                answer = QMessageBox.warning(
+                    self, self.tr('Modified files on the device'),
+                    self.tr('These files have been modified on the device since the last deployment, the changes '
+                            'will be lost:\n{}\n\nOverwrite them?').format('\n'.join(e.files)),
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+                if answer != QMessageBox.Yes:
+                    return
+                result = self.run_deployer(PackageDeployer(package_folder, device_folder, self.removeStaleCheckBox.isChecked(),
+                                                           overwrite_modified=True))
+        except (QFieldSyncError, OSError) as e:
+            self.iface.messageBar().pushWarning('QFieldSync', str(e))
+        else:
+            self.progressBar.setValue(100)
+            self.resultLabel.setText(str(result))
+            self.iface.messageBar().pushInfo('QFieldSync', self.tr('Package deployed to {}').format(device_folder))
+        finally:
+            self.button_box.button(QDialogButtonBox.Save).setEnabled(True)
+
+    def run_deployer(self, deployer):
+        task_group = TaskGroup(self.tr('Deploying package'))
+        task_group.add_function(self.tr('Deploying package'),
+                                lambda task: deployer.deploy(lambda done, total, _: task.setProgress(100 * done / max(total, 1))))
+        task_group.progress_changed.connect(self.update_progress)
+        result, = task_group.run()
+        return result
+
+    @pyqtSlot(float)
+    def update_progress(self, progress):
+        self.progressBar.setValue(int(progress))
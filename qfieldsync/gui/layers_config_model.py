@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ QFieldSyncDialog
+                                 A QGIS plugin
+ Sync your projects to QField on android
+                             -------------------
+        begin                : 2020-11-02
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qgis.PyQt.QtCore import (
+    Qt,
+    QAbstractTableModel,
+    QEvent,
+    QModelIndex,
+    QSortFilterProxyModel,
+)
+from qgis.PyQt.QtWidgets import (
+    QApplication,
+    QComboBox,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionButton,
+)
+
+from qfieldsync.core.layer import LayerSource, SyncAction
+from qfieldsync.gui.utils import set_available_actions
+
+
+class LayersConfigModel(QAbstractTableModel):
+    """
+    Table model of the QField configuration of all the layers of a project.
+
+    Changes are kept on the LayerSource instances and only written to the layers on `apply()`.
+    """
+
+    LAYER_COLUMN = 0
+    LOCK_GEOMETRY_COLUMN = 1
+    ACTION_COLUMN = 2
+
+    LayerSourceRole = Qt.UserRole
+    SortRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super(LayersConfigModel, self).__init__(parent)
+        self._layer_sources = list()
+        self._dirty = set()
+
+    def reload(self, layers):
+        """
+        Replace the content of the model with the given layers.
+        """
+        self.beginResetModel()
+        self._layer_sources = list()
+        self._dirty = set()
+        for layer in layers:
+            layer_source = LayerSource(layer)
+            if not layer_source.is_supported and layer_source.action != SyncAction.REMOVE:
+                layer_source.action = SyncAction.REMOVE
+                self._dirty.add(layer_source)
+            self._layer_sources.append(layer_source)
+        self.endResetModel()
+
+    @property
+    def layer_sources(self):
+        return list(self._layer_sources)
+
+    @property
+    def unsupported_layer_sources(self):
+        return [layer_source for layer_source in self._layer_sources if not layer_source.is_supported]
+
+    def apply(self):
+        """
+        Write the modified configurations to the layers.
+
+        :return: True if any layer has been modified
+        """
+        for layer_source in self._dirty:
+            layer_source.apply()
+
+        changed = bool(self._dirty)
+        self._dirty = set()
+        return changed
+
+    def layers_applied(self, layer_ids):
+        """
+        Refresh the rows of layers whose configuration has been applied outside of the model.
+
+        :param layer_ids: The ids of the applied layers
+        """
+        layer_ids = set(layer_ids)
+        if not layer_ids:
+            return
+
+        rows = list()
+        for row, layer_source in enumerate(self._layer_sources):
+            if layer_source.layer.id() in layer_ids:
+                self._dirty.discard(layer_source)
+                rows.append(row)
+
+        if rows:
+            # a single signal for the whole range, views and proxies only refresh once
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), self.columnCount() - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._layer_sources)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 3
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation != Qt.Horizontal:
+            return None
+
+        if role == Qt.DisplayRole:
+            if section == self.LAYER_COLUMN:
+                return self.tr('Layer')
+            elif section == self.LOCK_GEOMETRY_COLUMN:
+                return self.tr('Lock Geometries')
+            elif section == self.ACTION_COLUMN:
+                return self.tr('Action')
+        elif role == Qt.ToolTipRole and section == self.LOCK_GEOMETRY_COLUMN:
+            return self.tr('When enabled, this option disables adding and deleting features, as well as modifying the geometries of existing features.')
+
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+
+        layer_source = self._layer_sources[index.row()]
+        if not layer_source.is_supported:
+            return Qt.NoItemFlags
+
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == self.LOCK_GEOMETRY_COLUMN and layer_source.can_lock_geometry:
+            flags |= Qt.ItemIsUserCheckable
+        elif index.column() == self.ACTION_COLUMN:
+            flags |= Qt.ItemIsEditable
+
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        layer_source = self._layer_sources[index.row()]
+        column = index.column()
+
+        if role == self.LayerSourceRole:
+            return layer_source
+
+        if column == self.LAYER_COLUMN:
+            if role in (Qt.DisplayRole, Qt.EditRole, self.SortRole):
+                return layer_source.name
+            elif role == Qt.ToolTipRole:
+                return layer_source.warning
+        elif column == self.LOCK_GEOMETRY_COLUMN:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if layer_source.is_geometry_locked else Qt.Unchecked
+            elif role == self.SortRole:
+                return int(layer_source.is_geometry_locked)
+        elif column == self.ACTION_COLUMN:
+            if role in (Qt.DisplayRole, self.SortRole):
+                return dict(layer_source.available_actions).get(layer_source.action, layer_source.action)
+            elif role == Qt.EditRole:
+                return layer_source.action
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+
+        layer_source = self._layer_sources[index.row()]
+        column = index.column()
+
+        if column == self.LOCK_GEOMETRY_COLUMN and role == Qt.CheckStateRole:
+            is_geometry_locked = value == Qt.Checked
+            if layer_source.is_geometry_locked == is_geometry_locked:
+                return False
+            layer_source.is_geometry_locked = is_geometry_locked
+        elif column == self.ACTION_COLUMN and role == Qt.EditRole:
+            if layer_source.action == value:
+                return False
+            layer_source.action = value
+        else:
+            return False
+
+        self._dirty.add(layer_source)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+
+class LayersConfigProxyModel(QSortFilterProxyModel):
+    """
+    Sorts and filters the layers by name.
+    """
+
+    def __init__(self, parent=None):
+        super(LayersConfigProxyModel, self).__init__(parent)
+        self.setSortRole(LayersConfigModel.SortRole)
+        self.setFilterKeyColumn(LayersConfigModel.LAYER_COLUMN)
+        self.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.setSortCaseSensitivity(Qt.CaseInsensitive)
+
+
+class LayerActionDelegate(QStyledItemDelegate):
+    """
+    Edits the action of a layer with a combobox, created only while the cell is edited.
+    """
+
+    def createEditor(self, parent, option, index):
+        combobox = QComboBox(parent)
+        combobox.activated.connect(lambda: self.commitData.emit(combobox))
+        return combobox
+
+    def setEditorData(self, editor, index):
+        editor.clear()
+        set_available_actions(editor, index.data(LayersConfigModel.LayerSourceRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.itemData(editor.currentIndex()), Qt.EditRole)
+
+
+class CenteredCheckBoxDelegate(QStyledItemDelegate):
+    """
+    Paints and toggles a checkbox in the center of the cell.
+    """
+
+    def paint(self, painter, option, index):
+        check_state = index.data(Qt.CheckStateRole)
+        if check_state is None:
+            super(CenteredCheckBoxDelegate, self).paint(painter, option, index)
+            return
+
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+
+        button_option = QStyleOptionButton()
+        button_option.rect = self._check_box_rect(option)
+        button_option.state = QStyle.State_On if check_state == Qt.Checked else QStyle.State_Off
+        if index.flags() & Qt.ItemIsUserCheckable:
+            button_option.state |= QStyle.State_Enabled
+        style.drawControl(QStyle.CE_CheckBox, button_option, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if not index.flags() & Qt.ItemIsUserCheckable:
+            return False
+
+        if event.type() == QEvent.MouseButtonRelease:
+            if not self._check_box_rect(option).contains(event.pos()):
+                return False
+        elif event.type() == QEvent.KeyPress:
+            if event.key() not in (Qt.Key_Space, Qt.Key_Select):
+                return False
+        else:
+            return event.type() in (QEvent.MouseButtonPress, QEvent.MouseButtonDblClick)
+
+        new_state = Qt.Unchecked if index.data(Qt.CheckStateRole) == Qt.Checked else Qt.Checked
+        return model.setData(index, new_state, Qt.CheckStateRole)
+
+    def _check_box_rect(self, option):
+        style = option.widget.style() if option.widget else QApplication.style()
+        rect = style.subElementRect(QStyle.SE_CheckBoxIndicator, QStyleOptionButton(), option.widget)
+        rect.moveCenter(option.rect.center())
+        return rect
@@ -23,34 +23,19 @@
 import os
 
 from qgis.core import Qgis, QgsProject, QgsMapLayer
-from qgis.gui import QgsMapLayerConfigWidget, QgsMapLayerConfigWidgetFactory 
+from qgis.gui import QgsMapLayerConfigWidget
 
 from qgis.PyQt.uic import loadUiType
 
+from qfieldsync.core.geometry_reducer import GeometryReducer
 from qfieldsync.core.layer import LayerSource
+from qfieldsync.gui.map_layer_config_widget_factory import MapLayerConfigWidgetFactory  # NOQA
 from qfieldsync.gui.photo_naming_widget import PhotoNamingTableWidget
 from qfieldsync.gui.utils import set_available_actions
 
 WidgetUi, _ = loadUiType(os.path.join(os.path.dirname(__file__), '../ui/map_layer_config_widget.ui'))
 
 
-class MapLayerConfigWidgetFactory(QgsMapLayerConfigWidgetFactory):
-    def __init__(self, title, icon):
-        super(MapLayerConfigWidgetFactory, self).__init__(title, icon)
-
-
-    def createWidget(self, layer, canvas, dock_widget, parent):
-        return MapLayerConfigWidget(layer, canvas, parent)
-
-
-    def supportsLayer(self, layer):
-        return LayerSource(layer).is_supported
-
-
-    def supportLayerPropertiesDialog(self):
-        return True
-
-
 class MapLayerConfigWidget(QgsMapLayerConfigWidget, WidgetUi):
     def __init__(self, layer, canvas, parent):
         super(MapLayerConfigWidget, self).__init__(layer, canvas, parent)
@@ -62,6 +47,23 @@ class MapLayerConfigWidget(QgsMapLayerConfigWidget, WidgetUi):
 
         self.isGeometryLockedCheckBox.setEnabled(self.layer_source.can_lock_geometry)
         self.isGeometryLockedCheckBox.setChecked(self.layer_source.is_geometry_locked)
+        self.optimizeRasterCheckBox.setVisible(self.layer_source.can_optimize_raster)
+        self.optimizeRasterCheckBox.setChecked(self.layer_source.optimize_raster)
+        self.pruneFieldsCheckBox.setVisible(self.layer_source.can_prune_fields)
+        self.pruneFieldsCheckBox.setChecked(self.layer_source.prune_fields)
+
+        can_reduce_geometries = self.layer_source.can_reduce_geometries
+        for widget in (self.simplifyToleranceLabel, self.simplifyToleranceSpinBox, self.coordinatePrecisionLabel,
+                       self.coordinatePrecisionSpinBox, self.geometrySizeLabel):
+            widget.setVisible(can_reduce_geometries)
+        self.geometry_sample = None
+        if can_reduce_geometries:
+            self.simplifyToleranceSpinBox.setValue(self.layer_source.simplify_tolerance)
+            self.coordinatePrecisionSpinBox.setValue(self.layer_source.coordinate_precision)
+            self.simplifyToleranceSpinBox.valueChanged.connect(self.update_geometry_size)
+            self.coordinatePrecisionSpinBox.valueChanged.connect(self.update_geometry_size)
+            self.update_geometry_size()
+
         self.photoNamingTable = PhotoNamingTableWidget()
         self.photoNamingTable.addLayerFields(self.layer_source)
         self.photoNamingTable.setLayerColumnHidden(True)
@@ -75,15 +77,43 @@ class MapLayerConfigWidget(QgsMapLayerConfigWidget, WidgetUi):
     def apply(self):
         old_layer_action = self.layer_source.action
         old_is_geometry_locked = self.layer_source.is_geometry_locked
+        old_optimize_raster = self.layer_source.optimize_raster
+        old_simplify_tolerance = self.layer_source.simplify_tolerance
+        old_coordinate_precision = self.layer_source.coordinate_precision
+        old_prune_fields = self.layer_source.prune_fields
 
         self.layer_source.action = self.layerActionComboBox.itemData(self.layerActionComboBox.currentIndex())
         self.layer_source.is_geometry_locked = self.isGeometryLockedCheckBox.isChecked()
+        self.layer_source.optimize_raster = self.optimizeRasterCheckBox.isChecked()
+        self.layer_source.prune_fields = self.pruneFieldsCheckBox.isChecked()
+        if self.layer_source.can_reduce_geometries:
+            self.layer_source.simplify_tolerance = self.simplifyToleranceSpinBox.value()
+            self.layer_source.coordinate_precision = self.coordinatePrecisionSpinBox.value()
         self.photoNamingTable.syncLayerSourceValues()
 
         # apply always the photo_namings (to store default values on first apply as well)
         if (self.layer_source.action != old_layer_action or 
             self.layer_source.is_geometry_locked != old_is_geometry_locked or
+            self.layer_source.optimize_raster != old_optimize_raster or
+            self.layer_source.simplify_tolerance != old_simplify_tolerance or
+            self.layer_source.coordinate_precision != old_coordinate_precision or
+            self.layer_source.prune_fields != old_prune_fields or
             self.photoNamingTable.rowCount() > 0
             ):
             self.layer_source.apply()
             self.project.setDirty(True)
+
+    def update_geometry_size(self):
+        if self.geometry_sample is None:
+            # the geometries are only read once, the estimate is updated whenever a setting changes
+            self.geometry_sample = GeometryReducer.sample(self.layer())
+
+        reducer = GeometryReducer(self.simplifyToleranceSpinBox.value(), self.coordinatePrecisionSpinBox.value())
+        before, after = reducer.estimate(*self.geometry_sample)
+        if not before:
+            self.geometrySizeLabel.clear()
+        elif reducer.is_active:
+            self.geometrySizeLabel.setText(self.tr('Estimated geometry size: {before:.1f} MB, reduced to {after:.1f} MB').format(
+                before=before / 1024 ** 2, after=after / 1024 ** 2))
+        else:
+            self.geometrySizeLabel.setText(self.tr('Estimated geometry size: {:.1f} MB').format(before / 1024 ** 2))
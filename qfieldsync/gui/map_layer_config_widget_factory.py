@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ QFieldSyncDialog
+                                 A QGIS plugin
+ Sync your projects to QField on android
+                             -------------------
+        begin                : 2020-06-15
+        git sha              : $Format:%H$
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.gui import QgsMapLayerConfigWidgetFactory
+
+from qfieldsync.core.layer import LayerSource
+
+
+class MapLayerConfigWidgetFactory(QgsMapLayerConfigWidgetFactory):
+    def __init__(self, title, icon):
+        super(MapLayerConfigWidgetFactory, self).__init__(title, icon)
+
+
+    def createWidget(self, layer, canvas, dock_widget, parent):
+        # imported here, the widget module compiles its .ui file on import
+        from qfieldsync.gui.map_layer_config_widget import MapLayerConfigWidget
+        return MapLayerConfigWidget(layer, canvas, parent)
+
+
+    def supportsLayer(self, layer):
+        return LayerSource(layer).is_supported
+
+
+    def supportLayerPropertiesDialog(self):
+        return True
@@ -23,10 +23,12 @@
 import os
 
 from qfieldsync.core import (
+    LayerInventory,
     LayerSource,
     ProjectConfiguration,
     OfflineConverter
 )
+from qfieldsync.core.package_archive import PackageArchive
 from qfieldsync.gui.project_configuration_dialog import ProjectConfigurationDialog
 from qgis.PyQt.QtCore import (
     pyqtSlot,
@@ -45,8 +47,6 @@ from qgis.PyQt.QtWidgets import (
 from qgis.core import (
     QgsProject,
     QgsApplication,
-    QgsProviderRegistry,
-    QgsProviderMetadata,
     Qgis
 )
 from qgis.PyQt.uic import loadUiType
@@ -82,6 +82,9 @@ class PackageDialog(QDialog, DialogUi):
         # self.refresh_devices()
         self.setup_gui()
 
+        # while packaging, the project is changed and read in the background, nothing else may touch it
+        self.is_packaging = False
+
         self.offline_editing.warning.connect(self.show_warning)
 
     def update_progress(self, sent, total):
@@ -98,6 +101,25 @@ class PackageDialog(QDialog, DialogUi):
 
         self.manualDir.setText(export_folder_path)
         self.manualDir_btn.clicked.connect(make_folder_selector(self.manualDir))
+
+        archive_formats = [
+            ('zip', self.tr('Zip (compressed)')),
+            ('zip-stored', self.tr('Zip (uncompressed)')),
+            ('zip-lzma', self.tr('Zip (LZMA)')),
+            ('tar', self.tr('Tar (uncompressed)')),
+            ('tar.gz', self.tr('Tar (gzip)')),
+            ('tar.xz', self.tr('Tar (xz)')),
+        ]
+        for archive_format, label in archive_formats:
+            self.archiveFormatComboBox.addItem(label, archive_format)
+
+        archive_format = self.qfield_preferences.value('packageArchiveFormat')
+        self.archiveCheckBox.setChecked(bool(archive_format))
+        self.archiveFormatComboBox.setEnabled(bool(archive_format))
+        if archive_format:
+            self.archiveFormatComboBox.setCurrentIndex(max(self.archiveFormatComboBox.findData(archive_format), 0))
+        self.archiveCheckBox.toggled.connect(self.archiveFormatComboBox.setEnabled)
+
         self.update_info_visibility()
 
     def get_export_folder_from_dialog(self):
@@ -105,22 +127,52 @@ class PackageDialog(QDialog, DialogUi):
         # manual
         return self.manualDir.text()
 
+    def get_archive_format_from_dialog(self):
+        """Get the selected archive format or None if no archive should be written"""
+        if not self.archiveCheckBox.isChecked():
+            return None
+        return self.archiveFormatComboBox.currentData()
+
+    def get_archive_path_from_dialog(self):
+        """Get the path of the archive, next to the export folder"""
+        archive_format = self.get_archive_format_from_dialog()
+        if not archive_format:
+            return None
+        return os.path.normpath(self.get_export_folder_from_dialog()) + PackageArchive.extension(archive_format)
+
     def package_project(self):
+        # packaging runs in the background, the project must not be configured meanwhile
         self.button_box.button(QDialogButtonBox.Save).setEnabled(False)
+        self.button_box.button(QDialogButtonBox.Reset).setEnabled(False)
         self.informationStack.setCurrentWidget(self.progressPage)
 
+        # QGIS keeps handling events while packaging, block any input to other windows meanwhile.
+        # The modality of a visible window only changes once it is shown again.
+        self.setWindowModality(Qt.ApplicationModal)
+        self.hide()
+        self.show()
+        self.is_packaging = True
+
         export_folder = self.get_export_folder_from_dialog()
 
         self.qfield_preferences.set_value('exportDirectoryProject', export_folder)
+        archive_format = self.get_archive_format_from_dialog()
+        self.qfield_preferences.set_value('packageArchiveFormat', archive_format or '')
 
         offline_convertor = OfflineConverter(self.project, export_folder, self.iface.mapCanvas().extent(),
-                                             self.offline_editing)
+                                             self.offline_editing, self.get_archive_path_from_dialog(),
+                                             archive_format or 'zip')
 
         # progress connections
         offline_convertor.total_progress_updated.connect(self.update_total)
         offline_convertor.task_progress_updated.connect(self.update_task)
+        self.destroyed.connect(offline_convertor.cancel)
 
-        offline_convertor.convert()
+        try:
+            offline_convertor.convert()
+        finally:
+            self.is_packaging = False
+            self.setWindowModality(Qt.NonModal)
         self.do_post_offline_convert_action()
         self.close()
 
@@ -132,29 +184,30 @@ class PackageDialog(QDialog, DialogUi):
         with a nice link to open the result folder.
         """
         export_folder = self.get_export_folder_from_dialog()
+        archive_path = self.get_archive_path_from_dialog()
 
-        result_message = self.tr('Finished creating the project at {result_folder}. Please copy this folder to '
-                                      'your QField device.').format(result_folder='<a href="{folder}">{folder}</a>'.format(folder=export_folder))
+        if archive_path:
+            result_message = self.tr('Finished creating the project archive {archive}. Please copy and extract this archive on '
+                                     'your QField device.').format(archive='<a href="{folder}">{path}</a>'.format(
+                                         folder=os.path.dirname(archive_path), path=archive_path))
+        else:
+            result_message = self.tr('Finished creating the project at {result_folder}. Please copy this folder to '
+                                          'your QField device.').format(result_folder='<a href="{folder}">{folder}</a>'.format(folder=export_folder))
         self.iface.messageBar().pushMessage(result_message, Qgis.Success, 0)
 
     def update_info_visibility(self):
         """
         Show the info label if there are unconfigured layers
         """
-        pathResolver = QgsProject.instance().pathResolver()
+        inventory = LayerInventory.instance(self.project)
         showInfoConfiguration = False
         localizedDataPathLayers = []
         for layer in list(self.project.mapLayers().values()):
             if not LayerSource(layer).is_configured:
                 showInfoConfiguration = True
-            if layer.dataProvider() is not None:
-                metadata = QgsProviderRegistry.instance().providerMetadata(layer.dataProvider().name())
-                if metadata is not None:
-                    decoded = metadata.decodeUri(layer.source())
-                    if "path" in decoded:
-                        path = pathResolver.writePath(decoded["path"])
-                        if path.startswith("localized:"):
-                            localizedDataPathLayers.append('- {} ({})'.format(layer.name(), path[10:]))
+            entry = inventory.entry(layer)
+            if entry.is_localized:
+                localizedDataPathLayers.append('- {} ({})'.format(layer.name(), entry.localized_path))
 
         self.infoConfigurationLabel.setVisible(showInfoConfiguration)
         if localizedDataPathLayers:
@@ -169,9 +222,9 @@ class PackageDialog(QDialog, DialogUi):
             self.infoLocalizedPresentLabel.setVisible(False)
         self.infoGroupBox.setVisible(showInfoConfiguration or len(localizedDataPathLayers) > 0)
 
-        project_configuration = ProjectConfiguration(self.project)
+        project_configuration = ProjectConfiguration(self.project, snapshot=True)
 
-        if project_configuration.offline_copy_only_aoi or project_configuration.create_base_map:
+        if project_configuration.offline_copy_only_aoi or project_configuration.clip_copied_layers_to_aoi or project_configuration.create_base_map:
             self.informationStack.setCurrentWidget(self.selectExtentPage)
         else:
             self.informationStack.setCurrentWidget(self.progressPage)
@@ -184,6 +237,17 @@ class PackageDialog(QDialog, DialogUi):
             dlg.exec_()
         self.update_info_visibility()
 
+    def closeEvent(self, event):
+        if self.is_packaging:
+            event.ignore()
+        else:
+            super(PackageDialog, self).closeEvent(event)
+
+    def reject(self):
+        # escape closes the dialog
+        if not self.is_packaging:
+            super(PackageDialog, self).reject()
+
     @pyqtSlot(int, int, str)
     def update_total(self, current, layer_count, message):
         self.totalProgressBar.setMaximum(layer_count)
@@ -49,6 +49,7 @@ class PreferencesWidget(WidgetUi, QgsOptionsPageWidget, SettingDialog):
 
         self.setting_widget('importDirectory').widget.setStorageMode(QgsFileWidget.GetDirectory)
         self.setting_widget('exportDirectory').widget.setStorageMode(QgsFileWidget.GetDirectory)
+        self.setting_widget('logDirectory').widget.setStorageMode(QgsFileWidget.GetDirectory)
 
     def apply(self):
         self.set_values_from_widgets()
@@ -21,10 +21,10 @@ import os
 
 from qgis.PyQt.QtCore import Qt
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import QDialog, QTableWidgetItem, QToolButton, QComboBox, QCheckBox, QMenu, QAction, QWidget, QHBoxLayout
+from qgis.PyQt.QtWidgets import QAbstractItemView, QToolButton, QMenu, QAction
 from qgis.PyQt.uic import loadUiType
 
-from qgis.core import QgsProject, QgsMapLayerProxyModel, Qgis
+from qgis.core import QgsCoordinateReferenceSystem, QgsProject, QgsMapLayerProxyModel, Qgis
 
 from qgis.gui import (
     QgsOptionsWidgetFactory,
@@ -32,10 +32,15 @@ from qgis.gui import (
 )
 
 from qfieldsync.core import ProjectConfiguration
-from qfieldsync.core.layer import LayerSource, SyncAction
+from qfieldsync.core.layer import SyncAction, apply_action_to_layers
 from qfieldsync.core.project import ProjectProperties
+from qfieldsync.gui.layers_config_model import (
+    CenteredCheckBoxDelegate,
+    LayerActionDelegate,
+    LayersConfigModel,
+    LayersConfigProxyModel,
+)
 from qfieldsync.gui.photo_naming_widget import PhotoNamingTableWidget
-from qfieldsync.gui.utils import set_available_actions
 
 WidgetUi, _ = loadUiType(
     os.path.join(os.path.dirname(__file__), '../ui/project_configuration_widget.ui'),
@@ -54,7 +59,7 @@ class ProjectConfigurationWidget(WidgetUi, QgsOptionsPageWidget):
         self.setupUi(self)
 
         self.project = QgsProject.instance()
-        self.__project_configuration = ProjectConfiguration(self.project)
+        self.__project_configuration = ProjectConfiguration(self.project, snapshot=True)
 
         self.multipleToggleButton.setIcon(QIcon(os.path.join(os.path.dirname(__file__), '../resources/visibility.svg')))
 
@@ -79,72 +84,48 @@ class ProjectConfigurationWidget(WidgetUi, QgsOptionsPageWidget):
         self.singleLayerRadioButton.toggled.connect(self.baseMapTypeChanged)
         self.unsupportedLayersList = list()
 
+        self.layersModel = LayersConfigModel(self)
+        self.layersProxyModel = LayersConfigProxyModel(self)
+        self.layersProxyModel.setSourceModel(self.layersModel)
+        self.layersTable.setModel(self.layersProxyModel)
+        self.layersTable.setItemDelegateForColumn(LayersConfigModel.LOCK_GEOMETRY_COLUMN, CenteredCheckBoxDelegate(self.layersTable))
+        self.layersTable.setItemDelegateForColumn(LayersConfigModel.ACTION_COLUMN, LayerActionDelegate(self.layersTable))
+        self.layersTable.setEditTriggers(QAbstractItemView.AllEditTriggers)
+        self.layersTable.setSortingEnabled(True)
+        self.layersTable.sortByColumn(LayersConfigModel.LAYER_COLUMN, Qt.AscendingOrder)
+        self.layerFilterLineEdit.textChanged.connect(self.layersProxyModel.setFilterFixedString)
+
+        self.photoNamingTable = PhotoNamingTableWidget()
+        self.photoNamingTab.layout().addWidget(self.photoNamingTable)
+
+        # Remove the tab when not yet suported in QGIS
+        if Qgis.QGIS_VERSION_INT < 31300:
+            self.tabWidget.removeTab(self.tabWidget.count() - 1)
+
         self.reloadProject()
 
     def reloadProject(self):
         """
         Load all layers from the map layer registry into the table.
         """
-        self.unsupportedLayersList = list()
-
-        self.photoNamingTable = PhotoNamingTableWidget()
-        self.photoNamingTab.layout().addWidget(self.photoNamingTable)
-
-        self.layersTable.setRowCount(0)
-        self.layersTable.setSortingEnabled(False)
-        for layer in self.project.mapLayers().values():
-            layer_source = LayerSource(layer)
-            count = self.layersTable.rowCount()
-            self.layersTable.insertRow(count)
-            item = QTableWidgetItem(layer.name())
-            item.setData(Qt.UserRole, layer_source)
-            item.setData(Qt.EditRole, layer.name())
-            self.layersTable.setItem(count, 0, item)
-
-            cmb = QComboBox()
-            set_available_actions(cmb, layer_source)
-            
-            cbx = QCheckBox()
-            cbx.setEnabled(layer_source.can_lock_geometry)
-            cbx.setChecked(layer_source.is_geometry_locked)
-            # it's more UI friendly when the checkbox is centered, an ugly workaround to achieve it
-            cbx_widget = QWidget()
-            cbx_layout = QHBoxLayout()
-            cbx_layout.setAlignment(Qt.AlignCenter)
-            cbx_layout.setContentsMargins(0, 0, 0, 0)
-            cbx_layout.addWidget(cbx)
-            cbx_widget.setLayout(cbx_layout)
-            # NOTE the margin is not updated when the table column is resized, so better rely on the code above
-            # cbx.setStyleSheet("margin-left:50%; margin-right:50%;")
-
-            self.layersTable.setCellWidget(count, 1, cbx_widget)
-            self.layersTable.setCellWidget(count, 2, cmb)
-
-            if not layer_source.is_supported:
-                self.unsupportedLayersList.append(layer_source)
-                self.layersTable.item(count,0).setFlags(Qt.NoItemFlags)
-                self.layersTable.cellWidget(count,1).setEnabled(False)
-                self.layersTable.cellWidget(count,2).setEnabled(False)
-                cmb.setCurrentIndex(cmb.findData(SyncAction.REMOVE))
+        self.layersModel.reload(self.project.mapLayers().values())
+        self.unsupportedLayersList = self.layersModel.unsupported_layer_sources
 
+        self.photoNamingTable.setRowCount(0)
+        for layer_source in self.layersModel.layer_sources:
             # make sure layer_source is the same instance everywhere
             self.photoNamingTable.addLayerFields(layer_source)
 
         self.layersTable.resizeColumnsToContents()
-        self.layersTable.sortByColumn(0, Qt.AscendingOrder)
-        self.layersTable.setSortingEnabled(True)
-
-        # Remove the tab when not yet suported in QGIS
-        if Qgis.QGIS_VERSION_INT < 31300:
-            self.tabWidget.removeTab(self.tabWidget.count() - 1)
 
         # Load Map Themes
+        self.mapThemeComboBox.clear()
         for theme in self.project.mapThemeCollection().mapThemes():
             self.mapThemeComboBox.addItem(theme)
 
         self.layerComboBox.setFilters(QgsMapLayerProxyModel.RasterLayer)
 
-        self.__project_configuration = ProjectConfiguration(self.project)
+        self.__project_configuration = ProjectConfiguration(self.project, snapshot=True)
         self.createBaseMapGroupBox.setChecked(self.__project_configuration.create_base_map)
 
         if self.__project_configuration.base_map_type == ProjectProperties.BaseMapType.SINGLE_LAYER:
@@ -159,6 +140,11 @@ class ProjectConfigurationWidget(WidgetUi, QgsOptionsPageWidget):
         self.mapUnitsPerPixel.setText(str(self.__project_configuration.base_map_mupp))
         self.tileSize.setText(str(self.__project_configuration.base_map_tile_size))
         self.onlyOfflineCopyFeaturesInAoi.setChecked(self.__project_configuration.offline_copy_only_aoi)
+        self.clipCopiedLayersToAoi.setChecked(self.__project_configuration.clip_copied_layers_to_aoi)
+        target_crs = self.__project_configuration.target_crs
+        self.reprojectGroupBox.setChecked(bool(target_crs))
+        self.targetCrsWidget.setCrs(QgsCoordinateReferenceSystem(target_crs) if target_crs else self.project.crs())
+        self.reprojectRastersCheckBox.setChecked(self.__project_configuration.reproject_rasters)
 
         if self.unsupportedLayersList:
             self.unsupportedLayersLabel.setVisible(True)
@@ -172,21 +158,8 @@ class ProjectConfigurationWidget(WidgetUi, QgsOptionsPageWidget):
         """
         Update layer configuration in project
         """
-        for i in range(self.layersTable.rowCount()):
-            item = self.layersTable.item(i, 0)
-            layer_source = item.data(Qt.UserRole)
-            cbx = self.layersTable.cellWidget(i, 1).layout().itemAt(0).widget()
-            cmb = self.layersTable.cellWidget(i, 2)
-
-            old_action = layer_source.action
-            old_is_geometry_locked = layer_source.can_lock_geometry and layer_source.is_geometry_locked
-
-            layer_source.action = cmb.itemData(cmb.currentIndex())
-            layer_source.is_geometry_locked = cbx.isChecked()
-
-            if layer_source.action != old_action or layer_source.is_geometry_locked != old_is_geometry_locked:
-                self.project.setDirty(True)
-                layer_source.apply()
+        if self.layersModel.apply():
+            self.project.setDirty(True)
 
         # apply always the photo_namings (to store default values on first apply as well)
         self.photoNamingTable.syncLayerSourceValues(should_apply=True)
@@ -208,6 +181,14 @@ class ProjectConfigurationWidget(WidgetUi, QgsOptionsPageWidget):
         self.__project_configuration.base_map_tile_size = int(self.tileSize.text())
 
         self.__project_configuration.offline_copy_only_aoi = self.onlyOfflineCopyFeaturesInAoi.isChecked()
+        self.__project_configuration.clip_copied_layers_to_aoi = self.clipCopiedLayersToAoi.isChecked()
+        target_crs = self.targetCrsWidget.crs()
+        if self.reprojectGroupBox.isChecked() and target_crs.isValid():
+            self.__project_configuration.target_crs = target_crs.authid() or target_crs.toWkt()
+        else:
+            self.__project_configuration.target_crs = ''
+        self.__project_configuration.reproject_rasters = self.reprojectRastersCheckBox.isChecked()
+        self.__project_configuration.commit()
 
     def baseMapTypeChanged(self):
         if self.singleLayerRadioButton.isChecked():
@@ -228,30 +209,20 @@ class ProjectConfigurationWidget(WidgetUi, QgsOptionsPageWidget):
 
         # all layers
         if action in (self.remove_all_action, self.add_all_copy_action, self.add_all_offline_action):
-            for i in range(self.layersTable.rowCount()):
-                item = self.layersTable.item(i, 0)
-                layer_source = item.data(Qt.UserRole)
-                old_action = layer_source.action
-                available_actions, _ = zip(*layer_source.available_actions)
-                if sync_action in available_actions:
-                    layer_source.action = sync_action
-                    if layer_source.action != old_action:
-                        self.project.setDirty(True)
-                    layer_source.apply()
+            layer_sources = self.layersModel.layer_sources
         # based on visibility
         elif action in (self.remove_hidden_action, self.add_visible_copy_action, self.add_visible_offline_action):
             visible = Qt.Unchecked if action == self.remove_hidden_action else Qt.Checked
-            root = QgsProject.instance().layerTreeRoot()
-            for layer in QgsProject.instance().mapLayers().values():
-                node = root.findLayer(layer.id())
+            root = self.project.layerTreeRoot()
+            layer_sources = list()
+            for layer_source in self.layersModel.layer_sources:
+                node = root.findLayer(layer_source.layer.id())
                 if node and node.isVisible() == visible:
-                    layer_source = LayerSource(layer)
-                    old_action = layer_source.action
-                    available_actions, _ = zip(*layer_source.available_actions)
-                    if sync_action in available_actions:
-                        layer_source.action = sync_action
-                        if layer_source.action != old_action:
-                            self.project.setDirty(True)
-                        layer_source.apply()
+                    layer_sources.append(layer_source)
+        else:
+            return
 
-        self.reloadProject()
+        changed_layer_ids = apply_action_to_layers(layer_sources, sync_action)
+        if changed_layer_ids:
+            self.project.setDirty(True)
+            self.layersModel.layers_applied(changed_layer_ids)
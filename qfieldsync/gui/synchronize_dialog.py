@@ -25,24 +25,43 @@ from qgis.PyQt.QtCore import pyqtSlot
 from qgis.PyQt.QtWidgets import (
     QDialog,
     QDialogButtonBox,
+    QMessageBox,
     QPushButton
 )
 from qgis.core import QgsProject
 from qgis.PyQt.uic import loadUiType
 
-from qfieldsync.core.project import ProjectConfiguration
+from qfieldsync.core.project import ProjectConfiguration, ProjectProperties
 from qfieldsync.core.preferences import Preferences
+from qfieldsync.core.sync_engine import SyncEngine
+from qfieldsync.core.package_manifest import PackageManifest, PackageVerifier
+from qfieldsync.core.sync_preview import SyncPreview
 
-from qfieldsync.utils.exceptions import NoProjectFoundError
+from qfieldsync.utils.exceptions import NoProjectFoundError, QFieldSyncError
 from qfieldsync.utils.file_utils import get_project_in_folder, import_file_checksum, copy_images
-from qfieldsync.utils.qgis_utils import open_project, import_checksums_of_project
+from qfieldsync.utils.qgis_utils import (
+    load_imported_files_checksums,
+    open_project,
+    read_imported_files_checksums,
+    read_project_entries,
+)
 from qfieldsync.utils.qt_utils import make_folder_selector
+from qfieldsync.utils.profiling import MemoryProfiler
+from qfieldsync.utils.task_utils import TaskGroup
 
 DialogUi, _ = loadUiType(os.path.join(os.path.dirname(__file__), '../ui/synchronize_dialog.ui'))
 
 
 class SynchronizeDialog(QDialog, DialogUi):
 
+    # The range of the total progress bar covered by every step of the synchronization
+    PROGRESS_STEPS = {
+        'prepare': (0, 10),
+        'replay': (10, 70),
+        'synchronize': (70, 90),
+        'finish': (90, 100),
+    }
+
     def __init__(self, iface, offline_editing, parent=None):
         """Constructor.
         """
@@ -53,37 +72,80 @@ class SynchronizeDialog(QDialog, DialogUi):
         self.offline_editing = offline_editing
         self.button_box.button(QDialogButtonBox.Save).setText(self.tr('Synchronize'))
         self.button_box.button(QDialogButtonBox.Save).clicked.connect(self.start_synchronization)
+        self.preview_button = self.button_box.addButton(self.tr('Preview'), QDialogButtonBox.ActionRole)
+        self.preview_button.clicked.connect(self.show_preview)
+        self.verify_button = self.button_box.addButton(self.tr('Verify'), QDialogButtonBox.ActionRole)
+        self.verify_button.clicked.connect(self.show_verification)
         self.qfieldDir.setText(self.preferences.value('importDirectoryProject') or self.preferences.value('importDirectory'))
         self.qfieldDir_button.clicked.connect(make_folder_selector(self.qfieldDir))
 
         self.offline_editing_done = False
+        self.progress_step = 'prepare'
 
     def start_synchronization(self):
         self.button_box.button(QDialogButtonBox.Save).setEnabled(False)
         qfield_folder = self.qfieldDir.text()
         self.preferences.set_value('importDirectoryProject', qfield_folder)
+        self.totalProgressBar.setMaximum(100)
+        memory_profiler = MemoryProfiler('synchronization', self.preferences.value('logDirectory'),
+                                         enabled=bool(self.preferences.value('profileMemory')))
+        memory_profiler.start()
         try:
-            current_import_file_checksum = import_file_checksum(qfield_folder)
-            imported_files_checksums = import_checksums_of_project(qfield_folder)
+            # hash the returned data and read the projects in the background, at the same time
+            self.progress_step = 'prepare'
+            task_group = TaskGroup(self.tr('Preparing synchronization'))
+            task_group.add_function(self.tr('Computing data checksum'), self.compute_checksum, qfield_folder)
+            task_group.add_function(self.tr('Reading projects'), self.read_projects, qfield_folder)
+            task_group.progress_changed.connect(self.update_task_progress)
+            current_import_file_checksum, (qgs_file, original_project_path, imported_files_checksums) = task_group.run()
+            if original_project_path and imported_files_checksums is None:
+                # not a plain project file, e.g. stored in PostgreSQL
+                imported_files_checksums = load_imported_files_checksums(original_project_path)
+                if imported_files_checksums is None:
+                    self.iface.messageBar().pushWarning('QFieldSync', self.tr(
+                        'Could not read the original project {}, data which has already been synchronized '
+                        'cannot be detected').format(original_project_path))
+                    imported_files_checksums = []
+            memory_profiler.mark('prepare')
 
             if imported_files_checksums and current_import_file_checksum and current_import_file_checksum in imported_files_checksums:
                 message = self.tr("Data from this file are already synchronized with the original project.")
                 raise NoProjectFoundError(message)
-            qgs_file = get_project_in_folder(qfield_folder)
+
             open_project(qgs_file)
+            memory_profiler.mark('open offline project')
+
+            # write the logged edits in batches, QGIS only restores the layers afterwards
+            self.progress_step = 'replay'
+            SyncEngine(QgsProject.instance()).synchronize(self.update_replay_progress)
+            memory_profiler.mark('replay')
+
+            self.progress_step = 'synchronize'
             self.offline_editing.progressStopped.connect(self.update_done)
             self.offline_editing.layerProgressUpdated.connect(self.update_total)
             self.offline_editing.progressModeSet.connect(self.update_mode)
             self.offline_editing.progressUpdated.connect(self.update_value)
             self.offline_editing.synchronize()
+            memory_profiler.mark('synchronize')
+
             if self.offline_editing_done:
-                original_project_path = ProjectConfiguration(QgsProject.instance()).original_project_path
+                self.progress_step = 'finish'
                 if original_project_path:
-                    # import the DCIM folder
-                    copy_images(os.path.join(qfield_folder, "DCIM"),os.path.join(os.path.dirname(original_project_path), "DCIM"))
-                    if open_project(original_project_path):
+                    # once synchronized, import the pictures and hash the data while the original project is loaded
+                    finish_group = TaskGroup(self.tr('Finishing synchronization'))
+                    finish_group.add_function(self.tr('Computing data checksum'), self.compute_checksum, qfield_folder)
+                    finish_group.add_function(self.tr('Importing pictures'), self.copy_dcim, qfield_folder,
+                                              os.path.dirname(original_project_path))
+                    finish_group.progress_changed.connect(self.update_task_progress)
+                    finish_group.start()
+                    try:
+                        project_opened = open_project(original_project_path)
+                    finally:
+                        synchronized_checksum, _ = finish_group.wait()
+
+                    if project_opened:
                         # save the data_file_checksum to the project and save it
-                        imported_files_checksums.append(import_file_checksum(qfield_folder))
+                        imported_files_checksums.append(synchronized_checksum)
                         ProjectConfiguration(QgsProject.instance()).imported_files_checksums = imported_files_checksums
                         QgsProject.instance().write()
                         self.iface.messageBar().pushInfo('QFieldSync', self.tr("Opened original project {}".format(original_project_path)))
@@ -91,17 +153,130 @@ class SynchronizeDialog(QDialog, DialogUi):
                         self.iface.messageBar().pushInfo('QFieldSync', self.tr("The data has been synchronized successfully but the original project ({}) could not be opened".format(original_project_path)))
                 else:
                     self.iface.messageBar().pushInfo('QFieldSync', self.tr("No original project path found"))
+                self.set_progress('finish', 1)
+                memory_profiler.mark('finish')
                 self.close()
             else:
                 message = self.tr("The project you imported does not seem to be an offline project")
                 raise NoProjectFoundError(message)
-        except NoProjectFoundError as e:
+        except QFieldSyncError as e:
             self.iface.messageBar().pushWarning('QFieldSync', str(e))
+        finally:
+            memory_profiler.stop()
+
+    def show_preview(self):
+        """
+        Show what the synchronization would change, without changing anything.
+        """
+        self.preview_button.setEnabled(False)
+        try:
+            task_group = TaskGroup(self.tr('Previewing synchronization'))
+            task_group.add_function(self.tr('Previewing synchronization'),
+                                    lambda task, folder: SyncPreview(folder).scan(), self.qfieldDir.text())
+            preview, = task_group.run()
+        except QFieldSyncError as e:
+            self.iface.messageBar().pushWarning('QFieldSync', str(e))
+            return
+        finally:
+            self.preview_button.setEnabled(True)
+
+        message_box = QMessageBox(QMessageBox.Information, self.tr('Synchronization preview'), preview.report(),
+                                  QMessageBox.Ok, self)
+        if preview.new_pictures or preview.changed_pictures:
+            message_box.setDetailedText('\n'.join(preview.new_pictures + preview.changed_pictures))
+        message_box.exec_()
+
+    def show_verification(self):
+        """
+        Hash the files of the returned package and compare them to its manifest.
+        """
+        qfield_folder = self.qfieldDir.text()
+        if not os.path.isfile(os.path.join(qfield_folder, PackageManifest.FILE_NAME)):
+            self.iface.messageBar().pushWarning('QFieldSync', self.tr(
+                'The folder {} has no package manifest, it cannot be verified').format(qfield_folder))
+            return
+
+        self.verify_button.setEnabled(False)
+        try:
+            task_group = TaskGroup(self.tr('Verifying package'))
+            task_group.add_function(self.tr('Verifying package'), self.verify_package, qfield_folder)
+            self.layerProgressBar.setMaximum(100)
+            task_group.progress_changed.connect(lambda progress: self.layerProgressBar.setValue(int(progress)))
+            verification, = task_group.run()
+        except QFieldSyncError as e:
+            self.iface.messageBar().pushWarning('QFieldSync', str(e))
+            return
+        finally:
+            self.verify_button.setEnabled(True)
+
+        lines = [self.tr('{} files unchanged since packaging').format(len(verification.unchanged))]
+        if verification.changed:
+            lines.append(self.tr('Files changed since packaging: {}').format(', '.join(verification.changed)))
+        if verification.missing:
+            lines.append(self.tr('Files missing since packaging: {}').format(', '.join(verification.missing)))
+        QMessageBox(QMessageBox.Information if verification.is_intact else QMessageBox.Warning,
+                    self.tr('Package verification'), '\n'.join(lines), QMessageBox.Ok, self).exec_()
+
+    def verify_package(self, task, qfield_folder):
+        """
+        Hash the files of a package, runs in a background task. The hashes are remembered in the QGIS profile.
+        """
+        verifier = PackageVerifier(qfield_folder, PackageVerifier.cache_path(qfield_folder))
+        return verifier.verify(lambda done, total: task.setProgress(100 * done / max(total, 1)))
+
+    def compute_checksum(self, task, qfield_folder):
+        """
+        Hash the returned data, runs in a background task.
+        """
+        return import_file_checksum(qfield_folder, lambda read, size: task.setProgress(100 * read / max(size, 1)))
+
+    def read_projects(self, task, qfield_folder):
+        """
+        Read the original project path and the already imported checksums from the project files,
+        runs in a background task.
+
+        The checksums are None if the original project is not a file which can be parsed.
+        """
+        qgs_file = get_project_in_folder(qfield_folder)
+        original_project_path = read_project_entries(qgs_file).get(ProjectProperties.ORIGINAL_PROJECT_PATH)
+
+        imported_files_checksums = []
+        if original_project_path:
+            imported_files_checksums = read_imported_files_checksums(original_project_path)
+
+        return qgs_file, original_project_path, imported_files_checksums
+
+    def copy_dcim(self, task, qfield_folder, original_project_folder):
+        """
+        Copy the pictures taken in QField to the original project, runs in a background task.
+        """
+        copy_images(os.path.join(qfield_folder, "DCIM"), os.path.join(original_project_folder, "DCIM"))
+
+    def set_progress(self, step, fraction):
+        """
+        Show the progress of a step of the synchronization on the total progress bar.
+
+        :param step: One of the PROGRESS_STEPS
+        :param fraction: The progress of the step, between 0 and 1
+        """
+        start, end = self.PROGRESS_STEPS[step]
+        self.totalProgressBar.setValue(int(start + (end - start) * fraction))
+
+    @pyqtSlot(float)
+    def update_task_progress(self, progress):
+        self.layerProgressBar.setMaximum(100)
+        self.layerProgressBar.setValue(int(progress))
+        self.set_progress(self.progress_step, progress / 100)
+
+    def update_replay_progress(self, done, total, layer_name):
+        self.layerProgressBar.setMaximum(total)
+        self.layerProgressBar.setValue(done)
+        self.set_progress('replay', done / max(total, 1))
 
     @pyqtSlot(int, int)
     def update_total(self, current, layer_count):
-        self.totalProgressBar.setMaximum(layer_count)
-        self.totalProgressBar.setValue(current)
+        if layer_count:
+            self.set_progress('synchronize', current / layer_count)
 
     @pyqtSlot(int)
     def update_value(self, progress):
@@ -41,12 +41,9 @@ from qgis.gui import (
     QgsOptionsPageWidget,
 )
 
-from qfieldsync.gui.package_dialog import PackageDialog
-from qfieldsync.gui.preferences_widget import PreferencesWidget
-from qfieldsync.gui.synchronize_dialog import SynchronizeDialog
-from qfieldsync.gui.project_configuration_widget import ProjectConfigurationWidget
-from qfieldsync.gui.project_configuration_dialog import ProjectConfigurationDialog
-from qfieldsync.gui.map_layer_config_widget import MapLayerConfigWidgetFactory
+# The dialogs and widgets are only imported once they are needed, their modules
+# compile .ui files on import and this would slow down every QGIS start.
+from qfieldsync.gui.map_layer_config_widget_factory import MapLayerConfigWidgetFactory
 
 
 class QFieldSyncProjectPropertiesFactory(QgsOptionsWidgetFactory):
@@ -61,6 +58,7 @@ class QFieldSyncProjectPropertiesFactory(QgsOptionsWidgetFactory):
         return QIcon(os.path.join(os.path.dirname(__file__),'resources','qfield_logo.svg'))
 
     def createWidget(self, parent):
+        from qfieldsync.gui.project_configuration_widget import ProjectConfigurationWidget
         return ProjectConfigurationWidget(parent)
 
 
@@ -73,6 +71,7 @@ class QFieldSyncOptionsFactory(QgsOptionsWidgetFactory):
         return QIcon(os.path.join(os.path.dirname(__file__),'resources','qfield_logo.svg'))
 
     def createWidget(self, parent):
+        from qfieldsync.gui.preferences_widget import PreferencesWidget
         return PreferencesWidget(parent)
 
 
@@ -229,6 +228,13 @@ class QFieldSync(object):
             callback=self.show_synchronize_dialog,
             parent=self.iface.mainWindow())
 
+        self.add_action(
+            QIcon(os.path.join(os.path.dirname(__file__), 'resources/package.svg')),
+            text=self.tr('Deploy Package to Folder'),
+            callback=self.show_deploy_dialog,
+            parent=self.iface.mainWindow(),
+            add_to_toolbar=False)
+
         self.add_action(
             QIcon(os.path.join(os.path.dirname(__file__), './resources/project_properties.svg')),
             text=self.tr('Configure Current Project'),
@@ -283,6 +289,7 @@ class QFieldSync(object):
         """
         Synchronize from QField
         """
+        from qfieldsync.gui.synchronize_dialog import SynchronizeDialog
         dlg = SynchronizeDialog(self.iface, self.offline_editing, self.iface.mainWindow())
         dlg.exec_()
 
@@ -290,6 +297,7 @@ class QFieldSync(object):
         """
         Push to QField
         """
+        from qfieldsync.gui.package_dialog import PackageDialog
         self.push_dlg = PackageDialog(self.iface, QgsProject.instance(), self.offline_editing,
                                       self.iface.mainWindow())
         self.push_dlg.setAttribute(Qt.WA_DeleteOnClose)
@@ -299,6 +307,14 @@ class QFieldSync(object):
         self.push_dlg.finished.connect(self.push_dialog_finished)
         self.update_button_enabled_status()
 
+    def show_deploy_dialog(self):
+        """
+        Deploy a package to a device folder
+        """
+        from qfieldsync.gui.deploy_dialog import DeployDialog
+        dlg = DeployDialog(self.iface, self.iface.mainWindow())
+        dlg.exec_()
+
     def show_project_configuration_dialog(self):
         """
         Show the project configuration dialog.
@@ -306,6 +322,7 @@ class QFieldSync(object):
         if Qgis.QGIS_VERSION_INT >= 31500:
             self.iface.showProjectPropertiesDialog('QField')
         else:
+            from qfieldsync.gui.project_configuration_dialog import ProjectConfigurationDialog
             dlg = ProjectConfigurationDialog(self.iface.mainWindow())
             dlg.exec_()
 
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import time
+
+from qfieldsync.core.bulk_mutation import BulkMutation
+from qgis.core import QgsProject, QgsVectorLayer
+from qgis.gui import QgsMapCanvas
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class BulkMutationTest(unittest.TestCase):
+
+    LAYER_COUNT = 300
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        self.project = QgsProject.instance()
+        self.layers = [QgsVectorLayer('Point?crs=EPSG:4326&field=name:string', 'points {}'.format(i), 'memory')
+                       for i in range(self.LAYER_COUNT)]
+        self.project.addMapLayers(self.layers)
+
+    def test_removals_are_batched(self):
+        removals = []
+        self.project.layersWillBeRemoved.connect(removals.append)
+
+        with BulkMutation(self.project, canvases=[]) as mutation:
+            for layer in self.layers[:10]:
+                mutation.remove_layer(layer.id())
+            # nothing is removed before the context is left
+            self.assertEqual(len(self.project.mapLayers()), self.LAYER_COUNT)
+
+        self.assertEqual(len(removals), 1)
+        self.assertEqual(len(removals[0]), 10)
+        self.assertEqual(len(self.project.mapLayers()), self.LAYER_COUNT - 10)
+
+    def test_layer_signals_are_blocked(self):
+        layer = self.layers[0]
+        changed = []
+        layer.customPropertyChanged.connect(changed.append)
+
+        with BulkMutation(self.project, canvases=[]) as mutation:
+            mutation.set_custom_property(layer, 'QFieldSync/test', 'value')
+
+        self.assertEqual(layer.customProperty('QFieldSync/test'), 'value')
+        self.assertEqual(changed, [])
+        self.assertFalse(layer.signalsBlocked())
+
+    def test_canvas_is_frozen(self):
+        canvas = QgsMapCanvas()
+        with BulkMutation(self.project, canvases=[canvas]):
+            self.assertTrue(canvas.isFrozen())
+        self.assertFalse(canvas.isFrozen())
+
+        # a canvas frozen by somebody else stays frozen
+        canvas.freeze(True)
+        with BulkMutation(self.project, canvases=[canvas]):
+            pass
+        self.assertTrue(canvas.isFrozen())
+
+    def test_bulk_is_faster(self):
+        canvas = QgsMapCanvas()
+        canvas.setLayers(self.layers)
+        half = self.LAYER_COUNT // 2
+
+        start = time.monotonic()
+        for layer in self.layers[:half]:
+            layer.setCustomProperty('QFieldSync/test', 'value')
+            self.project.removeMapLayer(layer.id())
+        one_by_one = time.monotonic() - start
+
+        start = time.monotonic()
+        with BulkMutation(self.project, canvases=[canvas]) as mutation:
+            for layer in self.layers[half:]:
+                mutation.set_custom_property(layer, 'QFieldSync/test', 'value')
+                mutation.remove_layer(layer.id())
+        bulk = time.monotonic() - start
+
+        self.assertEqual(self.project.mapLayers(), {})
+        self.assertLess(bulk, one_by_one)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from osgeo import gdal, ogr
+
+from qfieldsync.core.copy_planner import CopyPlanner
+from qfieldsync.core.layer import LayerSource
+from qfieldsync.tests.test_gdal_utils import create_raster
+from qfieldsync.tests.utilities import test_data_folder
+from qgis.core import QgsCoordinateReferenceSystem, QgsProject, QgsRasterLayer, QgsRectangle, QgsVectorLayer
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class CopyPlannerTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        self.target_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        QgsProject.instance().clear()
+        shutil.rmtree(self.target_path)
+
+    def test_shared_source_is_copied_once(self):
+        path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        layers = [QgsVectorLayer(path, 'france {}'.format(i), 'ogr') for i in range(3)]
+        QgsProject.instance().addMapLayers(layers)
+
+        planner = CopyPlanner(self.target_path)
+        for layer in layers:
+            planner.add(LayerSource(layer))
+        self.assertEqual(planner.file_count, 1)
+        self.assertEqual(planner.layer_count, 3)
+
+        bytes_saved = planner.execute()
+
+        copied = list(planner.copied_files.values())
+        self.assertEqual(len(copied), 1)
+        self.assertEqual(copied[0]['layer_count'], 3)
+        self.assertEqual(bytes_saved, copied[0]['size'] * 2)
+        self.assertGreater(bytes_saved, 0)
+
+        target_file = os.path.join(self.target_path, 'france_parts_shape.shp')
+        for layer in layers:
+            self.assertTrue(layer.isValid())
+            self.assertEqual(os.path.normcase(os.path.realpath(LayerSource(layer).source_file_path)),
+                             os.path.normcase(os.path.realpath(target_file)))
+
+    def test_non_file_layers_are_ignored(self):
+        layer = QgsVectorLayer('Point?crs=EPSG:4326', 'points', 'memory')
+        QgsProject.instance().addMapLayer(layer)
+
+        planner = CopyPlanner(self.target_path)
+        planner.add(LayerSource(layer))
+
+        self.assertEqual(planner.execute(), 0)
+        self.assertEqual(planner.copied_files, {})
+        self.assertEqual(layer.providerType(), 'memory')
+
+    def test_deferred(self):
+        path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        layer = QgsVectorLayer(path, 'france', 'ogr')
+        QgsProject.instance().addMapLayer(layer)
+
+        planner = CopyPlanner(self.target_path, deferred=True)
+        planner.add(LayerSource(layer))
+        planner.execute()
+
+        # the file is copied, the layer is left alone until applied on the main thread
+        self.assertTrue(os.path.isfile(os.path.join(self.target_path, 'france_parts_shape.shp')))
+        self.assertEqual(LayerSource(layer).source_file_path, path)
+
+        planner.apply()
+        self.assertEqual(os.path.dirname(os.path.realpath(LayerSource(layer).source_file_path)),
+                         os.path.realpath(self.target_path))
+        self.assertEqual(planner.data_source_changes, [])
+
+    def test_reprojected(self):
+        path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        layer = QgsVectorLayer(path, 'france', 'ogr')
+        QgsProject.instance().addMapLayer(layer)
+        feature_count = layer.featureCount()
+        target_crs = QgsCoordinateReferenceSystem('EPSG:3857')
+        self.assertNotEqual(layer.crs(), target_crs)
+
+        planner = CopyPlanner(self.target_path, target_crs=target_crs)
+        planner.add(LayerSource(layer))
+        planner.execute()
+
+        self.assertTrue(layer.isValid())
+        self.assertEqual(layer.crs().authid(), 'EPSG:3857')
+        self.assertEqual(layer.dataProvider().crs().authid(), 'EPSG:3857')
+        self.assertEqual(layer.featureCount(), feature_count)
+        self.assertEqual(os.path.dirname(os.path.realpath(LayerSource(layer).source_file_path)),
+                         os.path.realpath(self.target_path))
+
+    def test_disjoint_raster_is_removed(self):
+        source_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_folder)
+        path = os.path.join(source_folder, 'raster.tif')
+        create_raster(path)
+        layer = QgsRasterLayer(path, 'raster', 'gdal')
+        QgsProject.instance().addMapLayer(layer)
+        QgsProject.instance().setCrs(layer.crs())
+        layer_id = layer.id()
+
+        planner = CopyPlanner(self.target_path, QgsRectangle(2700000, 1200000, 2700100, 1200100), deferred=True)
+        planner.add(LayerSource(layer))
+        planner.execute()
+
+        # the layer would point to the original raster, outside of the package
+        self.assertFalse(os.path.exists(os.path.join(self.target_path, 'raster.tif')))
+        self.assertEqual(planner.apply(), [layer_id])
+        self.assertIsNone(QgsProject.instance().mapLayer(layer_id))
+
+    def test_clipped_table_is_kept_by_gpkg_tables(self):
+        source_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source_folder)
+        source_path = os.path.join(source_folder, 'source.gpkg')
+        shape_path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        for table in ('france_a', 'france_b'):
+            gdal.VectorTranslate(source_path, shape_path,
+                                 options=gdal.VectorTranslateOptions(format='GPKG', layerName=table, accessMode='append'))
+
+        clipped = QgsVectorLayer('{}|layername=france_a'.format(source_path), 'clipped', 'ogr')
+        extracted = QgsVectorLayer('{}|layername=france_b'.format(source_path), 'extracted', 'ogr')
+        QgsProject.instance().addMapLayers([clipped, extracted])
+        clipped_source = LayerSource(clipped)
+        clipped_source.simplify_tolerance = 0.01
+        self.assertEqual(clipped_source.copy_mode(), LayerSource.COPY_MODE_CLIP)
+        self.assertEqual(LayerSource(extracted).copy_mode(), LayerSource.COPY_MODE_GPKG_TABLES)
+
+        planner = CopyPlanner(self.target_path)
+        planner.add(clipped_source)
+        planner.add(LayerSource(extracted))
+        planner.execute()
+
+        # both modes write into source.gpkg, the table clipped first is not wiped
+        target = ogr.Open(os.path.join(self.target_path, 'source.gpkg'))
+        self.assertEqual(sorted(target.GetLayer(i).GetName() for i in range(target.GetLayerCount())),
+                         ['france_a', 'france_b'])
+        self.assertTrue(clipped.isValid())
+        self.assertTrue(extracted.isValid())
+        self.assertGreater(clipped.featureCount(), 0)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from qfieldsync.utils.delta_utils import compute_delta, delta_copy
+from qgis.testing import unittest
+
+BLOCK_SIZE = 1024
+
+
+class DeltaUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.temp_dir, 'source.gpkg')
+        self.target_path = os.path.join(self.temp_dir, 'target.gpkg')
+        self.data = os.urandom(64 * BLOCK_SIZE)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_modified_in_place(self):
+        source = bytearray(self.data)
+        source[10 * BLOCK_SIZE + 5] ^= 0xff
+        source[40 * BLOCK_SIZE] ^= 0xff
+        self.write(self.source_path, bytes(source))
+        self.write(self.target_path, self.data)
+
+        instructions = compute_delta(self.source_path, self.target_path, BLOCK_SIZE)
+        self.assertEqual([kind for kind, _, _ in instructions], ['copy', 'data', 'copy', 'data', 'copy'])
+
+        saved = delta_copy(self.source_path, self.target_path, BLOCK_SIZE)
+        self.assertEqual(saved, 62 * BLOCK_SIZE)
+        self.assertEqual(self.read(self.target_path), bytes(source))
+
+    def test_grown_and_shrunk(self):
+        source = self.data + b'appended'
+        self.write(self.source_path, source)
+        self.write(self.target_path, self.data)
+
+        saved = delta_copy(self.source_path, self.target_path, BLOCK_SIZE)
+        self.assertEqual(saved, 64 * BLOCK_SIZE)
+        self.assertEqual(self.read(self.target_path), source)
+
+        source = self.data[:20 * BLOCK_SIZE]
+        self.write(self.source_path, source)
+        self.assertEqual(delta_copy(self.source_path, self.target_path, BLOCK_SIZE), 20 * BLOCK_SIZE)
+        self.assertEqual(self.read(self.target_path), source)
+
+    def test_shifted(self):
+        # data inserted at the beginning shifts all the blocks, none can be reused in place
+        source = b'inserted' + self.data
+        self.write(self.source_path, source)
+        self.write(self.target_path, self.data)
+
+        self.assertEqual(delta_copy(self.source_path, self.target_path, BLOCK_SIZE), 0)
+        self.assertEqual(self.read(self.target_path), source)
+
+    def test_new_file(self):
+        self.write(self.source_path, self.data)
+
+        self.assertEqual(delta_copy(self.source_path, self.target_path, BLOCK_SIZE), 0)
+        self.assertEqual(self.read(self.target_path), self.data)
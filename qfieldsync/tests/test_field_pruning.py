@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from osgeo import ogr
+
+from qfieldsync.core.copy_planner import CopyPlanner
+from qfieldsync.core.layer import LayerSource, value_relation_field_names
+from qfieldsync.tests.utilities import test_data_folder
+from qgis.core import (
+    QgsAttributeEditorField,
+    QgsEditFormConfig,
+    QgsEditorWidgetSetup,
+    QgsProject,
+    QgsRelation,
+    QgsVectorLayer,
+)
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class FieldPruningTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        self.project = QgsProject.instance()
+        self.target_path = tempfile.mkdtemp()
+
+        self.layer = QgsVectorLayer(
+            'Point?crs=EPSG:4326&field=id:integer&field=name:string&field=notes:string&field=blob:string'
+            '&field=parent_id:integer&field=category:integer&field=hidden:string',
+            'points', 'memory')
+        self.parent = QgsVectorLayer('Point?crs=EPSG:4326&field=pid:integer&field=label:string', 'parents', 'memory')
+        self.categories = QgsVectorLayer(
+            'None?field=code:integer&field=title:string&field=description:string', 'categories', 'memory')
+        self.project.addMapLayers([self.layer, self.parent, self.categories])
+
+        self.layer.setEditorWidgetSetup(self.layer.fields().indexOf('hidden'), QgsEditorWidgetSetup('Hidden', {}))
+        self.layer.setEditorWidgetSetup(self.layer.fields().indexOf('category'), QgsEditorWidgetSetup(
+            'ValueRelation', {'Layer': self.categories.id(), 'Key': 'code', 'Value': 'title'}))
+
+        relation = QgsRelation()
+        relation.setId('points_parent')
+        relation.setName('points_parent')
+        relation.setReferencingLayer(self.layer.id())
+        relation.setReferencedLayer(self.parent.id())
+        relation.addFieldPair('parent_id', 'pid')
+        self.assertTrue(relation.isValid())
+        self.project.relationManager().addRelation(relation)
+
+    def tearDown(self):
+        QgsProject.instance().clear()
+        shutil.rmtree(self.target_path)
+
+    def test_disabled(self):
+        self.assertIsNone(LayerSource(self.layer).kept_field_names())
+
+    def test_autogenerated_form(self):
+        layer_source = LayerSource(self.layer)
+        layer_source.prune_fields = True
+        self.assertEqual(layer_source.kept_field_names(),
+                         ['id', 'name', 'notes', 'blob', 'parent_id', 'category'])
+
+    def test_drag_and_drop_form(self):
+        form_config = self.layer.editFormConfig()
+        form_config.setLayout(QgsEditFormConfig.TabLayout)
+        root = form_config.invisibleRootContainer()
+        root.clear()
+        root.addChildElement(QgsAttributeEditorField('name', self.layer.fields().indexOf('name'), root))
+        self.layer.setEditFormConfig(form_config)
+        self.layer.setDisplayExpression('"notes"')
+        self.layer.setCustomProperty('QFieldSync/sourceDataPrimaryKeys', 'id')
+
+        layer_source = LayerSource(self.layer)
+        layer_source.prune_fields = True
+        self.assertEqual(layer_source.kept_field_names(), ['id', 'name', 'notes', 'parent_id'])
+
+    def test_referenced_layers(self):
+        parent_source = LayerSource(self.parent)
+        parent_source.prune_fields = True
+        self.assertEqual(parent_source.kept_field_names(), ['pid', 'label'])
+
+        form_config = self.categories.editFormConfig()
+        form_config.setLayout(QgsEditFormConfig.TabLayout)
+        form_config.invisibleRootContainer().clear()
+        self.categories.setEditFormConfig(form_config)
+
+        categories_source = LayerSource(self.categories)
+        categories_source.prune_fields = True
+        # the key and the value of the value relation are kept, even if not in the form
+        self.assertEqual(categories_source.kept_field_names(), ['code', 'title'])
+
+    def test_value_relations_are_looked_up_once(self):
+        self.assertEqual(value_relation_field_names(self.project), {self.categories.id(): {'code', 'title'}})
+
+        form_config = self.categories.editFormConfig()
+        form_config.setLayout(QgsEditFormConfig.TabLayout)
+        form_config.invisibleRootContainer().clear()
+        self.categories.setEditFormConfig(form_config)
+
+        categories_source = LayerSource(self.categories)
+        categories_source.prune_fields = True
+        # the given lookup is used instead of scanning the project
+        self.assertNotIn('code', categories_source.kept_field_names(value_relation_fields={}))
+
+        planner = CopyPlanner(self.target_path)
+        self.assertEqual(planner.compute_kept_field_names(categories_source), ['code', 'title'])
+        self.assertEqual(planner.kept_field_names, {self.categories.id(): ['code', 'title']})
+
+    def test_copied_layer_is_pruned(self):
+        path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        layer = QgsVectorLayer(path, 'france', 'ogr')
+        self.project.addMapLayer(layer)
+        kept_field = layer.fields()[0].name()
+        for index in range(1, layer.fields().count()):
+            layer.setEditorWidgetSetup(index, QgsEditorWidgetSetup('Hidden', {}))
+
+        layer_source = LayerSource(layer)
+        layer_source.prune_fields = True
+        layer_source.apply()
+
+        planner = CopyPlanner(self.target_path)
+        planner.add(LayerSource(layer))
+        planner.execute()
+
+        dataset = ogr.Open(os.path.join(self.target_path, 'france_parts_shape.shp'))
+        definition = dataset.GetLayer(0).GetLayerDefn()
+        self.assertEqual([definition.GetFieldDefn(i).GetName() for i in range(definition.GetFieldCount())],
+                         [kept_field])
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import os
+
+from qfieldsync.core.layer import get_file_extension_group
+from qfieldsync.tests.utilities import test_data_folder
+from qfieldsync.utils.file_utils import DirectoryIndex, file_checksum
+from qgis.testing import unittest
+
+
+class FileUtilsTest(unittest.TestCase):
+
+    def test_file_extension_group(self):
+        basename, group = get_file_extension_group('airports.shp')
+        self.assertEqual(basename, 'airports')
+        self.assertIn('.shx', group)
+
+        basename, group = get_file_extension_group('airports.shp.xml')
+        self.assertEqual(basename, 'airports')
+        self.assertIn('.shx', group)
+
+        basename, group = get_file_extension_group('roads.TAB')
+        self.assertEqual(basename, 'roads')
+        self.assertIn('.map', group)
+
+        self.assertEqual(get_file_extension_group('forests.gpkg'), ('forests', ['.gpkg']))
+
+    def test_directory_index(self):
+        folder = os.path.join(test_data_folder(), 'simple_project')
+        index = DirectoryIndex()
+
+        _, group = get_file_extension_group('france_parts_shape.shp')
+        names = index.find_files(folder, 'france_parts_shape', group)
+        self.assertEqual(set(names), {
+            'france_parts_shape.shp',
+            'france_parts_shape.shx',
+            'france_parts_shape.dbf',
+            'france_parts_shape.prj',
+            'france_parts_shape.cpg',
+            'france_parts_shape.qpj',
+        })
+
+        self.assertEqual(index.find_files(folder, 'missing', group), [])
+        self.assertEqual(index.find_files(os.path.join(folder, 'missing'), 'france_parts_shape', group), [])
+
+    def test_file_checksum(self):
+        path = os.path.join(test_data_folder(), 'simple_project', 'curved_polys.gpkg')
+        with open(path, 'rb') as f:
+            expected = hashlib.md5(f.read()).hexdigest()
+
+        progress = []
+        self.assertEqual(file_checksum(path, lambda read, size: progress.append((read, size))), expected)
+        self.assertEqual(progress[-1], (os.path.getsize(path), os.path.getsize(path)))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from osgeo import gdal, ogr, osr
+
+from qfieldsync.tests.utilities import test_data_folder
+from qfieldsync.utils.gdal_utils import (
+    CLIP_CACHE_MAX_MB,
+    clip_raster,
+    clip_vector,
+    gdal_config,
+    optimize_raster,
+    raster_extent,
+)
+from qgis.testing import unittest
+
+
+def create_raster(path, origin_x=2600000, origin_y=1200100, size=100):
+    """
+    Write a GeoTIFF of size x size pixels of 1 m in EPSG:2056 with its upper left corner at the origin
+    """
+    dataset = gdal.GetDriverByName('GTiff').Create(path, size, size, 1, gdal.GDT_Byte)
+    dataset.SetGeoTransform([origin_x, 1, 0, origin_y, 0, -1])
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(2056)
+    dataset.SetProjection(srs.ExportToWkt())
+    dataset.GetRasterBand(1).Fill(42)
+    dataset = None
+
+
+class GdalUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.raster_path = os.path.join(self.temp_dir, 'raster.tif')
+        create_raster(self.raster_path)
+        self.vector_path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_clip_raster_intersecting(self):
+        target_path = os.path.join(self.temp_dir, 'clipped.tif')
+        self.assertTrue(clip_raster(self.raster_path, target_path, (2599000, 1199000, 2601000, 1201000)))
+
+        clipped = gdal.Open(target_path)
+        self.assertEqual((clipped.RasterXSize, clipped.RasterYSize), (100, 100))
+        self.assertEqual(raster_extent(clipped), (2600000, 1200000, 2600100, 1200100))
+        self.assertLessEqual(gdal.GetCacheMax(), CLIP_CACHE_MAX_MB * 1024 ** 2)
+
+    def test_clip_raster_partial(self):
+        target_path = os.path.join(self.temp_dir, 'clipped.tif')
+        self.assertTrue(clip_raster(self.raster_path, target_path, (2600050, 1200000, 2600200, 1200030)))
+
+        clipped = gdal.Open(target_path)
+        self.assertEqual((clipped.RasterXSize, clipped.RasterYSize), (50, 30))
+        self.assertEqual(raster_extent(clipped), (2600050, 1200000, 2600100, 1200030))
+        self.assertEqual(clipped.GetRasterBand(1).Checksum(), gdal.Open(self.raster_path).GetRasterBand(1).Checksum(50, 70, 50, 30))
+
+    def test_clip_raster_disjoint(self):
+        target_path = os.path.join(self.temp_dir, 'clipped.tif')
+        self.assertFalse(clip_raster(self.raster_path, target_path, (2700000, 1200000, 2700100, 1200100)))
+        self.assertFalse(os.path.exists(target_path))
+
+        self.assertIsNone(optimize_raster(self.raster_path, target_path, (2700000, 1200000, 2700100, 1200100)))
+        self.assertFalse(os.path.exists(target_path))
+
+    def test_optimize_raster_partial(self):
+        target_path = os.path.join(self.temp_dir, 'optimized.tif')
+        sizes = optimize_raster(self.raster_path, target_path, (2600050, 1200000, 2600200, 1200030))
+        self.assertEqual(sizes, (os.path.getsize(self.raster_path), os.path.getsize(target_path)))
+
+        optimized = gdal.Open(target_path)
+        self.assertEqual((optimized.RasterXSize, optimized.RasterYSize), (50, 30))
+        # the option only applied while optimizing
+        self.assertIsNone(gdal.GetConfigOption('COMPRESS_OVERVIEW'))
+
+    def vector_extent(self):
+        layer = ogr.Open(self.vector_path).GetLayer(0)
+        xmin, xmax, ymin, ymax = layer.GetExtent()
+        return xmin, ymin, xmax, ymax
+
+    def feature_count(self, path, extent=None):
+        layer = ogr.Open(path).GetLayer(0)
+        if extent is not None:
+            layer.SetSpatialFilterRect(*extent)
+        return layer.GetFeatureCount()
+
+    def test_clip_vector_intersecting(self):
+        target_path = os.path.join(self.temp_dir, 'clipped.gpkg')
+        xmin, ymin, xmax, ymax = self.vector_extent()
+        clip_vector(self.vector_path, target_path, (xmin - 1, ymin - 1, xmax + 1, ymax + 1))
+
+        self.assertEqual(self.feature_count(target_path), self.feature_count(self.vector_path))
+
+    def test_clip_vector_partial(self):
+        target_path = os.path.join(self.temp_dir, 'clipped.gpkg')
+        xmin, ymin, xmax, ymax = self.vector_extent()
+        extent = (xmin, ymin, (xmin + xmax) / 2, (ymin + ymax) / 2)
+        clip_vector(self.vector_path, target_path, extent)
+
+        expected_count = self.feature_count(self.vector_path, extent)
+        self.assertGreater(expected_count, 0)
+        self.assertLess(expected_count, self.feature_count(self.vector_path))
+        self.assertEqual(self.feature_count(target_path), expected_count)
+
+    def test_clip_vector_disjoint(self):
+        target_path = os.path.join(self.temp_dir, 'clipped.gpkg')
+        _, _, xmax, ymax = self.vector_extent()
+        clip_vector(self.vector_path, target_path, (xmax + 1, ymax + 1, xmax + 2, ymax + 2))
+
+        # the layer is written without any feature, so the packaged layer stays valid
+        self.assertEqual(self.feature_count(target_path), 0)
+
+    def test_gdal_config_is_thread_local(self):
+        with gdal_config(COMPRESS_OVERVIEW='DEFLATE'):
+            self.assertEqual(gdal.GetConfigOption('COMPRESS_OVERVIEW'), 'DEFLATE')
+            self.assertEqual(gdal.GetThreadLocalConfigOption('COMPRESS_OVERVIEW', None), 'DEFLATE')
+        self.assertIsNone(gdal.GetConfigOption('COMPRESS_OVERVIEW'))
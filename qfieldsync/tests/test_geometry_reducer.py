@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+
+from qfieldsync.core.geometry_reducer import GeometryReducer
+from qfieldsync.core.layer import LayerSource
+from qfieldsync.tests.utilities import test_data_folder
+from qgis.core import QgsFeature, QgsGeometry, QgsProject, QgsVectorLayer
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class GeometryReducerTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        QgsProject.instance().clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_reduce(self):
+        # a nearly straight line with many vertices
+        wkt = 'LineString ({})'.format(', '.join('{} {}'.format(x, 0.0001 * (x % 2)) for x in range(1000)))
+        geometry = QgsGeometry.fromWkt(wkt)
+
+        self.assertIs(GeometryReducer().reduce(geometry), geometry)
+        self.assertFalse(GeometryReducer().is_active)
+
+        simplified = GeometryReducer(simplify_tolerance=0.01).reduce(geometry)
+        self.assertEqual(simplified.constGet().numPoints(), 2)
+
+        snapped = GeometryReducer(coordinate_precision=1).reduce(QgsGeometry.fromWkt('Point (1.4 2.6)'))
+        self.assertEqual(snapped.asWkt(), 'Point (1 3)')
+
+        # geometries collapsing are kept
+        polygon = QgsGeometry.fromWkt('Polygon ((0 0, 1 0, 1 1, 0 0))')
+        self.assertFalse(GeometryReducer(simplify_tolerance=10).reduce(polygon).isEmpty())
+
+    def test_estimate(self):
+        layer = QgsVectorLayer('LineString?crs=EPSG:2056', 'lines', 'memory')
+        features = list()
+        for i in range(10):
+            feature = QgsFeature()
+            feature.setGeometry(QgsGeometry.fromWkt(
+                'LineString ({})'.format(', '.join('{} {}'.format(x, i) for x in range(100)))))
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+
+        geometries, feature_count = GeometryReducer.sample(layer, sample_size=5)
+        self.assertEqual(len(geometries), 5)
+        self.assertEqual(feature_count, 10)
+
+        before, after = GeometryReducer(simplify_tolerance=0.5).estimate(geometries, feature_count)
+        self.assertEqual(before, 10 * len(geometries[0].asWkb()))
+        self.assertLess(after, before / 10)
+
+    def test_apply(self):
+        for path in glob.glob(os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.*')):
+            shutil.copy(path, self.temp_dir)
+        path = os.path.join(self.temp_dir, 'france_parts_shape.shp')
+
+        progress = []
+        before, after = GeometryReducer(simplify_tolerance=0.1).apply(
+            path, progress_callback=lambda done, total: progress.append((done, total)))
+        self.assertLess(after, before)
+
+        layer = QgsVectorLayer(path, 'france', 'ogr')
+        self.assertEqual(progress[-1], (layer.featureCount(), layer.featureCount()))
+        self.assertEqual(sum(len(feature.geometry().asWkb()) for feature in layer.getFeatures()), after)
+
+    def test_layer_settings(self):
+        layer = QgsVectorLayer('Polygon?crs=EPSG:2056', 'polygons', 'memory')
+        layer_source = LayerSource(layer)
+        self.assertTrue(layer_source.can_reduce_geometries)
+        self.assertIsNone(layer_source.geometry_reducer)
+
+        layer_source.simplify_tolerance = 0.5
+        layer_source.apply()
+        self.assertEqual(float(layer.customProperty('QFieldSync/simplify_tolerance')), 0.5)
+        self.assertIsNone(layer.customProperty('QFieldSync/coordinate_precision'))
+
+        reducer = LayerSource(layer).geometry_reducer
+        self.assertEqual(reducer.simplify_tolerance, 0.5)
+        self.assertEqual(reducer.coordinate_precision, 0.0)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from osgeo import gdal, ogr
+
+from qfieldsync.tests.utilities import test_data_folder
+from qfieldsync.utils.gpkg_utils import extract_tables
+from qgis.testing import unittest
+
+
+class GpkgUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.temp_dir, 'source.gpkg')
+
+        shape_path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        for layer_name in ('france_a', 'france_b', 'france_c'):
+            options = gdal.VectorTranslateOptions(format='GPKG', layerName=layer_name, accessMode='append')
+            gdal.VectorTranslate(self.source_path, shape_path, options=options)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_extract_tables(self):
+        target_path = os.path.join(self.temp_dir, 'target.gpkg')
+
+        self.assertEqual(extract_tables(self.source_path, target_path, ['FRANCE_B']), ['france_b'])
+        # tables are appended, existing ones are skipped
+        self.assertEqual(extract_tables(self.source_path, target_path, ['france_b', 'france_c']), ['france_c'])
+
+        source = ogr.Open(self.source_path)
+        target = ogr.Open(target_path)
+        self.assertEqual(sorted(target.GetLayer(i).GetName() for i in range(target.GetLayerCount())),
+                         ['france_b', 'france_c'])
+
+        source_layer = source.GetLayerByName('france_b')
+        target_layer = target.GetLayerByName('france_b')
+        self.assertEqual(target_layer.GetFeatureCount(), source_layer.GetFeatureCount())
+        self.assertEqual(target_layer.GetSpatialRef().ExportToWkt(), source_layer.GetSpatialRef().ExportToWkt())
+
+        # the spatial index is copied along
+        xmin, xmax, ymin, ymax = source_layer.GetExtent()
+        target_layer.SetSpatialFilterRect(xmin, ymin, xmax, ymax)
+        self.assertEqual(target_layer.GetFeatureCount(), source_layer.GetFeatureCount())
+        result = target.ExecuteSQL("SELECT HasSpatialIndex('france_b', 'geom')", dialect='SQLite')
+        self.assertEqual(result.GetNextFeature().GetField(0), 1)
+        target.ReleaseResultSet(result)
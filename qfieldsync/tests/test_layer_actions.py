@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from qfieldsync.core.layer import LayerSource, SyncAction, apply_action_to_layers
+from qfieldsync.gui.layers_config_model import LayersConfigModel
+from qgis.core import QgsProject, QgsVectorLayer
+from qgis.PyQt.QtCore import Qt
+from qgis.testing import start_app, unittest
+
+start_app()
+
+LAYER_COUNT = 1500
+
+
+class LayerActionsTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        layers = [QgsVectorLayer('Point?crs=EPSG:4326', 'layer {}'.format(i), 'memory') for i in range(LAYER_COUNT)]
+        QgsProject.instance().addMapLayers(layers)
+        self.layers = layers
+
+    def tearDown(self):
+        QgsProject.instance().clear()
+
+    def test_apply_action_returns_changed_layers(self):
+        layer_sources = [LayerSource(layer) for layer in self.layers]
+
+        changed_layer_ids = apply_action_to_layers(layer_sources, SyncAction.OFFLINE)
+
+        self.assertEqual(len(changed_layer_ids), LAYER_COUNT)
+        self.assertEqual(self.layers[0].customProperty('QFieldSync/action'), SyncAction.OFFLINE)
+
+        self.assertEqual(apply_action_to_layers(layer_sources, SyncAction.OFFLINE), [])
+
+        changed_layer_ids = apply_action_to_layers(layer_sources[:10], SyncAction.REMOVE)
+        self.assertEqual(changed_layer_ids, [layer.id() for layer in self.layers[:10]])
+
+    def test_model_updates_changed_rows_only(self):
+        model = LayersConfigModel()
+        model.reload(self.layers)
+
+        resets = []
+        changes = []
+        model.modelReset.connect(lambda: resets.append(True))
+        model.dataChanged.connect(lambda top_left, bottom_right, roles=[]: changes.append((top_left.row(), bottom_right.row())))
+
+        changed_layer_ids = apply_action_to_layers(model.layer_sources[10:20], SyncAction.REMOVE)
+        model.layers_applied(changed_layer_ids)
+
+        self.assertEqual(resets, [])
+        self.assertEqual(changes, [(10, 19)])
+        self.assertEqual(model.data(model.index(10, LayersConfigModel.ACTION_COLUMN), Qt.EditRole), SyncAction.REMOVE)
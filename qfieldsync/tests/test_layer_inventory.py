@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from qfieldsync.core.layer_inventory import LayerInventory
+from qfieldsync.tests.utilities import test_data_folder
+from qgis.core import QgsProject, QgsVectorLayer
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class LayerInventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+
+    def test_entry_is_cached(self):
+        path = os.path.join(test_data_folder(), 'simple_project', 'france_parts_shape.shp')
+        layer = QgsVectorLayer(path, 'france', 'ogr')
+        QgsProject.instance().addMapLayer(layer)
+
+        inventory = LayerInventory.instance()
+        entry = inventory.entry(layer)
+        self.assertTrue(entry.is_file)
+        self.assertFalse(entry.is_localized)
+        self.assertEqual(entry.path, path)
+        self.assertIs(inventory.entry(layer), entry)
+
+    def test_invalidation(self):
+        layer = QgsVectorLayer('Point?crs=EPSG:4326', 'points', 'memory')
+        QgsProject.instance().addMapLayer(layer)
+
+        inventory = LayerInventory.instance()
+        entry = inventory.entry(layer)
+        self.assertFalse(entry.is_file)
+
+        QgsProject.instance().removeMapLayer(layer.id())
+        layer = QgsVectorLayer('Point?crs=EPSG:4326', 'points', 'memory')
+        QgsProject.instance().addMapLayer(layer)
+        self.assertIsNot(inventory.entry(layer), entry)
+
+        layer_id = layer.id()
+        inventory.entry(layer)
+        QgsProject.instance().clear()
+        self.assertNotIn(layer_id, inventory._entries)
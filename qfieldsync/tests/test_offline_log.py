@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from qfieldsync.core.offline_log import OfflineLog
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class OfflineLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'data.gpkg')
+
+        # the log tables as QgsOfflineEditing creates them
+        connection = sqlite3.connect(self.path)
+        connection.executescript("""
+            CREATE TABLE log_indices (name TEXT, last_index INTEGER);
+            CREATE TABLE log_layer_ids (id INTEGER, qgis_id TEXT);
+            CREATE TABLE log_fids (layer_id INTEGER, offline_fid INTEGER, remote_fid INTEGER);
+            CREATE TABLE log_added_attrs (layer_id INTEGER, commit_no INTEGER, name TEXT, type INTEGER,
+                                          length INTEGER, precision INTEGER, comment TEXT);
+            CREATE TABLE log_added_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_removed_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_feature_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, attr INTEGER, value TEXT);
+            CREATE TABLE log_geometry_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, geom_wkt TEXT);
+
+            INSERT INTO log_layer_ids VALUES (1, 'points_offline'), (2, 'lines_offline');
+            INSERT INTO log_fids VALUES (1, 1, 101), (1, 2, 102), (1, 3, 103), (2, 1, 201);
+
+            -- feature 10 is added and changed, feature 11 is added and removed again
+            INSERT INTO log_added_features VALUES (1, 10), (1, 11);
+            INSERT INTO log_removed_features VALUES (1, 11), (1, 3);
+            INSERT INTO log_feature_updates VALUES
+                (1, 1, 1, 1, 'first'), (1, 2, 1, 1, 'second'), (1, 2, 1, 2, 'other'),
+                (1, 3, 10, 1, 'added'), (1, 3, 3, 1, 'removed'), (1, 4, 1, 1, 'last');
+            INSERT INTO log_geometry_updates VALUES
+                (1, 1, 2, 'Point (0 0)'), (1, 5, 2, 'Point (1 1)'), (2, 1, 1, 'LineString (0 0, 1 1)');
+        """)
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_changes(self):
+        with OfflineLog(self.path) as offline_log:
+            self.assertTrue(offline_log.is_valid())
+            self.assertEqual(offline_log.layer_ids(), {'points_offline': 1, 'lines_offline': 2})
+
+            changes = offline_log.changes(1)
+            self.assertEqual(changes.log_entry_count, 12)
+            self.assertEqual(changes.added, [10])
+            self.assertEqual(changes.removed, [3])
+            self.assertEqual(changes.discarded, [11])
+            self.assertEqual(changes.attribute_changes, {1: {1: 'last', 2: 'other'}})
+            self.assertEqual(changes.geometry_changes, {2: 'Point (1 1)'})
+            self.assertEqual(changes.fid_map, {1: 101, 2: 102, 3: 103})
+            self.assertEqual(changes.change_count, 4)
+
+            changes = offline_log.changes(2)
+            self.assertEqual(changes.geometry_changes, {1: 'LineString (0 0, 1 1)'})
+            self.assertEqual(changes.fid_map, {1: 201})
+
+    def test_applied(self):
+        with OfflineLog(self.path) as offline_log:
+            offline_log.applied_added(1, [10], [110])
+            offline_log.applied_removed(1, [3])
+            offline_log.applied_attribute_changes(1, [1])
+            offline_log.discard(1, [11])
+
+            changes = offline_log.changes(1)
+            self.assertEqual(changes.added, [])
+            self.assertEqual(changes.removed, [])
+            self.assertEqual(changes.attribute_changes, {})
+            self.assertEqual(changes.geometry_changes, {2: 'Point (1 1)'})
+
+            offline_log.applied_geometry_changes(1, [2])
+            changes = offline_log.changes(1)
+            self.assertTrue(changes.is_empty())
+            self.assertEqual(changes.log_entry_count, 0)
+            # the other layers are untouched
+            self.assertEqual(offline_log.changes(2).change_count, 1)
+
+        connection = sqlite3.connect(self.path)
+        self.assertEqual(connection.execute('SELECT remote_fid FROM log_fids WHERE offline_fid = 10').fetchone(), (110,))
+        connection.close()
+
+    def test_interrupted_added(self):
+        with OfflineLog(self.path) as offline_log:
+            self.assertEqual(offline_log.interrupted_added(1), [])
+
+            # interrupted between writing to the remote layer and updating the log
+            offline_log.writing_added(1, [10])
+            self.assertEqual(offline_log.interrupted_added(1), [10])
+            self.assertEqual(offline_log.interrupted_added(2), [])
+            self.assertEqual(offline_log.changes(1).added, [10])
+
+            offline_log.applied_added(1, [10], [110])
+            self.assertEqual(offline_log.interrupted_added(1), [])
+
+            offline_log.writing_added(1, [11])
+            offline_log.discard(1, [11])
+            self.assertEqual(offline_log.interrupted_added(1), [])
+
+    def test_added_attributes(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("INSERT INTO log_added_attrs VALUES (1, 1, 'comment', 10, 0, 0, ''), (2, 1, 'note', 10, 0, 0, '')")
+        connection.commit()
+        connection.close()
+
+        with OfflineLog(self.path) as offline_log:
+            self.assertEqual(offline_log.added_attributes(1), [('comment', 10, 0, 0, '')])
+
+            offline_log.applied_added_attributes(1)
+            self.assertEqual(offline_log.added_attributes(1), [])
+            self.assertEqual(offline_log.changes(2).added_attribute_count, 1)
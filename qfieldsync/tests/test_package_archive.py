@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from qfieldsync.core.package_archive import PackageArchive
+from qfieldsync.tests.utilities import test_data_folder
+from qgis.testing import unittest
+
+
+class PackageArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.staging_folder = os.path.join(self.temp_dir, 'staging')
+        os.makedirs(os.path.join(self.staging_folder, 'raster'))
+        with open(os.path.join(self.staging_folder, 'project_qfield.qgs'), 'w') as f:
+            f.write('<qgis/>')
+        with open(os.path.join(self.staging_folder, 'raster', 'dem.tif'), 'wb') as f:
+            f.write(b'\0' * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_archive(self, archive_format):
+        path = os.path.join(self.temp_dir, 'package' + PackageArchive.extension(archive_format))
+        archive = PackageArchive(path, self.staging_folder, archive_format)
+        archive.add_staged(exclude=['project_qfield.qgs'])
+        archive.add_directory(os.path.join(test_data_folder(), 'simple_project', 'DCIM'), 'DCIM')
+        archive.add_staged()
+        archive.close()
+        return path
+
+    def test_zip(self):
+        path = self.write_archive('zip')
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            self.assertEqual(archive.read('raster/dem.tif'), b'\0' * 1024)
+
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn('project_qfield.qgs', names)
+        self.assertTrue(any(name.startswith('DCIM/') for name in names))
+
+    def test_tar(self):
+        path = self.write_archive('tar.gz')
+        with tarfile.open(path) as archive:
+            names = archive.getnames()
+            self.assertEqual(archive.extractfile('project_qfield.qgs').read(), b'<qgis/>')
+
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn('raster/dem.tif', names)
+        self.assertTrue(any(name.startswith('DCIM/') for name in names))
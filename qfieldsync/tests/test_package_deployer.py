@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from qfieldsync.core.package_deployer import PackageDeployer
+from qfieldsync.core.package_manifest import PackageManifest
+from qfieldsync.utils.delta_utils import DELTA_BLOCK_SIZE
+from qfieldsync.utils.exceptions import ModifiedFilesError
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class PackageDeployerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.package_folder = os.path.join(self.temp_dir, 'package')
+        self.device_folder = os.path.join(self.temp_dir, 'device')
+        os.makedirs(os.path.join(self.package_folder, 'DCIM'))
+
+        self.data = bytearray(os.urandom(8 * DELTA_BLOCK_SIZE))
+        self.write('data.gpkg', self.data)
+        self.write('project_qfield.qgs', b'<qgis/>')
+        self.write('DCIM/picture.jpg', b'picture')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, content):
+        with open(os.path.join(self.package_folder, name), 'wb') as f:
+            f.write(content)
+
+    def write_manifest(self):
+        manifest = PackageManifest(self.package_folder)
+        manifest.add_directory()
+        manifest.write()
+
+    def test_deploy(self):
+        self.write_manifest()
+        result = PackageDeployer(self.package_folder, self.device_folder).deploy()
+        self.assertEqual(result.copied, ['DCIM/picture.jpg', 'data.gpkg', 'project_qfield.qgs'])
+        self.assertEqual(result.saved_bytes, 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.device_folder, PackageManifest.FILE_NAME)))
+
+        # a new version of the package with a single changed block
+        self.data[3 * DELTA_BLOCK_SIZE] ^= 0xff
+        self.write('data.gpkg', self.data)
+        self.write('new.txt', b'new')
+        self.write_manifest()
+        with open(os.path.join(self.device_folder, 'stale.txt'), 'wb') as f:
+            f.write(b'stale')
+
+        result = PackageDeployer(self.package_folder, self.device_folder, remove_stale=True).deploy()
+        self.assertEqual(result.unchanged, ['DCIM/picture.jpg', 'project_qfield.qgs'])
+        self.assertEqual(result.patched, ['data.gpkg'])
+        self.assertEqual(result.copied, ['new.txt'])
+        self.assertEqual(result.removed, ['stale.txt'])
+        self.assertEqual(result.saved_bytes, 7 * DELTA_BLOCK_SIZE + len(b'picture') + len(b'<qgis/>'))
+
+        with open(os.path.join(self.device_folder, 'data.gpkg'), 'rb') as f:
+            self.assertEqual(f.read(), bytes(self.data))
+
+    def test_modified_on_device(self):
+        self.write_manifest()
+        PackageDeployer(self.package_folder, self.device_folder).deploy()
+
+        # edited in QField after the deployment, not synchronized yet
+        device_data = os.path.join(self.device_folder, 'data.gpkg')
+        with open(device_data, 'r+b') as f:
+            f.write(b'edited')
+        self.data[0] ^= 0xff
+        self.write('data.gpkg', self.data)
+        self.write_manifest()
+
+        with self.assertRaises(ModifiedFilesError) as context:
+            PackageDeployer(self.package_folder, self.device_folder).deploy()
+        self.assertEqual(context.exception.files, ['data.gpkg'])
+        with open(device_data, 'rb') as f:
+            self.assertEqual(f.read(6), b'edited')
+
+        PackageDeployer(self.package_folder, self.device_folder, overwrite_modified=True).deploy()
+        with open(device_data, 'rb') as f:
+            self.assertEqual(f.read(), bytes(self.data))
+
+    def test_resume_interrupted(self):
+        self.write_manifest()
+        PackageDeployer(self.package_folder, self.device_folder).deploy()
+
+        self.data[0] ^= 0xff
+        self.write('data.gpkg', self.data)
+        self.write_manifest()
+
+        # interrupted while data.gpkg is patched, after the first block
+        device_data = os.path.join(self.device_folder, 'data.gpkg')
+        with open(os.path.join(self.device_folder, PackageManifest.DEPLOYING_FILE_NAME), 'w') as f:
+            f.write('data.gpkg\n')
+        with open(device_data, 'r+b') as f:
+            f.write(bytes(self.data[:DELTA_BLOCK_SIZE]))
+
+        result = PackageDeployer(self.package_folder, self.device_folder).deploy()
+        self.assertEqual(result.patched, ['data.gpkg'])
+        with open(device_data, 'rb') as f:
+            self.assertEqual(f.read(), bytes(self.data))
+        self.assertFalse(os.path.exists(os.path.join(self.device_folder, PackageManifest.DEPLOYING_FILE_NAME)))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from qfieldsync.core.package_journal import PackageJournal
+from qfieldsync.tests.utilities import test_data_folder
+from qfieldsync.utils.file_utils import copy_images
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class PackageJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.export_folder = os.path.join(self.temp_dir, 'export')
+        self.source_path = os.path.join(self.temp_dir, 'source.txt')
+        self.target_path = os.path.join(self.export_folder, 'target.txt')
+        os.makedirs(self.export_folder)
+        with open(self.source_path, 'w') as f:
+            f.write('source')
+        shutil.copyfile(self.source_path, self.target_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_files(self):
+        journal = PackageJournal(self.export_folder, '/project.qgs')
+        self.assertFalse(journal.is_file_done(self.source_path, self.target_path))
+
+        journal.file_done(self.source_path, self.target_path)
+        journal.save()
+
+        journal = PackageJournal(self.export_folder, '/project.qgs')
+        self.assertTrue(journal.is_file_done(self.source_path, self.target_path))
+        self.assertFalse(journal.is_file_done(self.source_path, self.target_path, 'layer'))
+
+        # a partially written target is written again
+        with open(self.target_path, 'a') as f:
+            f.write('partial')
+        self.assertFalse(journal.is_file_done(self.source_path, self.target_path))
+
+        # a journal of another project is discarded
+        journal.file_done(self.source_path, self.target_path)
+        journal.save()
+        journal = PackageJournal(self.export_folder, '/other_project.qgs')
+        self.assertFalse(journal.is_file_done(self.source_path, self.target_path))
+
+    def test_stages(self):
+        journal = PackageJournal(self.export_folder, '/project.qgs')
+        journal.stage_done('basemap', {'tile_size': 1024, 'extent': (0, 0, 1, 1)})
+
+        journal = PackageJournal(self.export_folder, '/project.qgs')
+        self.assertTrue(journal.is_stage_done('basemap', {'tile_size': 1024, 'extent': (0, 0, 1, 1)}))
+        self.assertFalse(journal.is_stage_done('basemap', {'tile_size': 512, 'extent': (0, 0, 1, 1)}))
+        self.assertFalse(journal.is_stage_done('dcim'))
+
+        journal.remove()
+        self.assertFalse(os.path.exists(journal.path))
+        self.assertFalse(journal.is_stage_done('basemap', {'tile_size': 1024, 'extent': (0, 0, 1, 1)}))
+
+    def test_resume_copy_images(self):
+        source_folder = os.path.join(test_data_folder(), 'simple_project', 'DCIM')
+        destination_folder = os.path.join(self.export_folder, 'DCIM')
+
+        journal = PackageJournal(self.export_folder, '/project.qgs')
+        copy_images(source_folder, destination_folder, journal)
+        journal.save()
+
+        copied_file = os.path.join(destination_folder, sorted(os.listdir(destination_folder))[0])
+        mtime = os.stat(copied_file).st_mtime_ns
+
+        journal = PackageJournal(self.export_folder, '/project.qgs')
+        copy_images(source_folder, destination_folder, journal)
+        self.assertEqual(os.stat(copied_file).st_mtime_ns, mtime)
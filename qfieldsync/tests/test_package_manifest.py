@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from qfieldsync.core.package_journal import PackageJournal
+from qfieldsync.core.package_manifest import PackageManifest, PackageVerifier
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class PackageManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.package_folder = os.path.join(self.temp_dir, 'package')
+        self.dcim_folder = os.path.join(self.temp_dir, 'DCIM')
+        os.makedirs(os.path.join(self.package_folder, 'sub'))
+        os.makedirs(self.dcim_folder)
+
+        self.write(os.path.join(self.package_folder, 'data.gpkg'), b'data')
+        self.write(os.path.join(self.package_folder, 'data.gpkg-wal'), b'wal')
+        self.write(os.path.join(self.package_folder, 'sub', 'layer.shp'), b'layer')
+        self.write(os.path.join(self.package_folder, PackageJournal.FILE_NAME), b'{}')
+        self.write(os.path.join(self.dcim_folder, 'picture.jpg'), b'picture')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, path, content):
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_manifest(self):
+        manifest = PackageManifest(self.package_folder)
+        manifest.add_directory(exclude=['sub'])
+        manifest.add_directory(self.dcim_folder, 'DCIM')
+        manifest.add_directory()
+        manifest.write()
+
+        files = PackageManifest.load(self.package_folder)
+        self.assertEqual(sorted(files), ['DCIM/picture.jpg', 'data.gpkg', 'sub/layer.shp'])
+        self.assertEqual(files['data.gpkg'], {'size': 4, 'sha256': hashlib.sha256(b'data').hexdigest()})
+
+    def test_verify(self):
+        manifest = PackageManifest(self.package_folder)
+        manifest.add_directory()
+        manifest.write()
+
+        verifier = PackageVerifier(self.package_folder, os.path.join(self.temp_dir, 'state', 'verified.json'))
+        files = sorted(os.listdir(self.package_folder))
+        result = verifier.verify()
+        self.assertTrue(result.is_intact)
+        self.assertEqual(result.unchanged, ['data.gpkg', 'sub/layer.shp'])
+        self.assertEqual(result.hashed_count, 2)
+        # the state is kept outside of the package
+        self.assertEqual(sorted(os.listdir(self.package_folder)), files)
+        self.assertTrue(os.path.isfile(verifier.state_path))
+
+        # unchanged files are not hashed again
+        result = verifier.verify()
+        self.assertTrue(result.is_intact)
+        self.assertEqual(result.hashed_count, 0)
+
+        # same size, different content
+        self.write(os.path.join(self.package_folder, 'data.gpkg'), b'atad')
+        stat = os.stat(os.path.join(self.package_folder, 'data.gpkg'))
+        os.utime(os.path.join(self.package_folder, 'data.gpkg'), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        os.remove(os.path.join(self.package_folder, 'sub', 'layer.shp'))
+        self.write(os.path.join(self.package_folder, 'new.txt'), b'new')
+
+        result = verifier.verify()
+        self.assertFalse(result.is_intact)
+        self.assertEqual(result.changed, ['data.gpkg'])
+        self.assertEqual(result.missing, ['sub/layer.shp'])
+        self.assertEqual(result.added, ['new.txt'])
+        self.assertEqual(result.hashed_count, 1)
+
+        # a different size is detected without hashing
+        self.write(os.path.join(self.package_folder, 'data.gpkg'), b'longer data')
+        result = verifier.verify()
+        self.assertEqual(result.changed, ['data.gpkg'])
+        self.assertEqual(result.hashed_count, 0)
+
+    def test_verify_without_state(self):
+        manifest = PackageManifest(self.package_folder)
+        manifest.add_directory()
+        manifest.write()
+
+        verifier = PackageVerifier(self.package_folder)
+        self.assertEqual(verifier.verify().hashed_count, 2)
+        self.assertEqual(verifier.verify().hashed_count, 2)
+
+    def test_compare(self):
+        manifest = PackageManifest(self.package_folder)
+        manifest.add_directory()
+        manifest_path = manifest.write()
+        files = sorted(os.listdir(self.package_folder))
+
+        result = PackageVerifier(self.package_folder).compare()
+        self.assertTrue(result.is_intact)
+        self.assertEqual(result.unchanged, ['data.gpkg', 'sub/layer.shp'])
+        self.assertEqual(result.hashed_count, 0)
+
+        # same size, modified after the manifest has been written
+        path = os.path.join(self.package_folder, 'data.gpkg')
+        self.write(path, b'atad')
+        stat = os.stat(manifest_path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + PackageVerifier.MTIME_TOLERANCE_NS + 10 ** 9))
+        os.remove(os.path.join(self.package_folder, 'sub', 'layer.shp'))
+        self.write(os.path.join(self.package_folder, 'new.txt'), b'new')
+
+        result = PackageVerifier(self.package_folder).compare()
+        self.assertEqual(result.changed, ['data.gpkg'])
+        self.assertEqual(result.missing, ['sub/layer.shp'])
+        self.assertEqual(result.added, ['new.txt'])
+        self.assertEqual(result.hashed_count, 0)
+        # nothing has been written
+        self.assertEqual(sorted(os.listdir(self.package_folder)), sorted(files + ['new.txt']))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from qgis.testing import unittest
+
+# Loads the plugin in a fresh interpreter, so modules imported by other tests do not interfere
+STARTUP_SCRIPT = """
+import json
+import sys
+
+from qgis.testing import start_app
+from qgis.testing.mocked import get_iface
+
+start_app()
+iface = get_iface()
+
+import qfieldsync
+plugin = qfieldsync.classFactory(iface)
+plugin.initGui()
+
+print(json.dumps({
+    'modules': sorted(name for name in sys.modules if name.startswith('qfieldsync')),
+}))
+"""
+
+# Modules compiling .ui files, they must not be imported on startup
+DEFERRED_MODULES = [
+    'qfieldsync.gui.package_dialog',
+    'qfieldsync.gui.synchronize_dialog',
+    'qfieldsync.gui.project_configuration_widget',
+    'qfieldsync.gui.project_configuration_dialog',
+    'qfieldsync.gui.map_layer_config_widget',
+    'qfieldsync.gui.preferences_widget',
+]
+
+
+class PluginStartupTest(unittest.TestCase):
+
+    def test_startup(self):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT], cwd=root)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, result['modules'])
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from qfieldsync.core.offline_log import OfflineLog
+from qfieldsync.utils.file_utils import file_checksum
+from qfieldsync.utils.profiling import MemoryProfiler
+from qgis.testing import start_app, unittest
+
+start_app()
+
+MB = 1024 ** 2
+
+
+class MemoryProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_report(self):
+        profiler = MemoryProfiler('test', self.temp_dir)
+        with profiler:
+            data = [bytes(1024) for _ in range(4 * 1024)]
+            profiler.mark('allocate')
+            del data
+            profiler.mark('release')
+
+        self.assertEqual([record.phase for record in profiler.records], ['allocate', 'release'])
+        allocate, release = profiler.records
+        self.assertGreater(allocate.peak, 4 * MB)
+        self.assertLess(release.current, allocate.current)
+        self.assertTrue(allocate.top_allocations)
+
+        reports = os.listdir(self.temp_dir)
+        self.assertEqual(len(reports), 1)
+        with open(os.path.join(self.temp_dir, reports[0])) as f:
+            report = f.read()
+        self.assertIn('allocate:', report)
+        self.assertIn('Top allocations during allocate:', report)
+
+    def test_disabled(self):
+        profiler = MemoryProfiler('test', self.temp_dir, enabled=False)
+        with profiler:
+            profiler.mark('nothing')
+
+        self.assertEqual(profiler.records, [])
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+
+class MemoryCeilingTest(unittest.TestCase):
+    """
+    Memory ceilings of the steps which have to scale to large packages.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def profile(self, function, *args):
+        profiler = MemoryProfiler('ceiling')
+        with profiler:
+            function(*args)
+            profiler.mark('run')
+        return profiler.peak
+
+    def test_file_checksum(self):
+        path = os.path.join(self.temp_dir, 'data.gpkg')
+        with open(path, 'wb') as f:
+            f.truncate(64 * MB)
+
+        self.assertLess(self.profile(file_checksum, path), 4 * MB)
+
+    def test_offline_log_summary(self):
+        path = os.path.join(self.temp_dir, 'data.gpkg')
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            CREATE TABLE log_layer_ids (id INTEGER, qgis_id TEXT);
+            CREATE TABLE log_fids (layer_id INTEGER, offline_fid INTEGER, remote_fid INTEGER);
+            CREATE TABLE log_added_attrs (layer_id INTEGER, commit_no INTEGER, name TEXT, type INTEGER,
+                                          length INTEGER, precision INTEGER, comment TEXT);
+            CREATE TABLE log_added_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_removed_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_feature_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, attr INTEGER, value TEXT);
+            CREATE TABLE log_geometry_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, geom_wkt TEXT);
+        """)
+        connection.executemany('INSERT INTO log_added_features VALUES (?, ?)',
+                               ((fid % 4, fid) for fid in range(100000)))
+        connection.executemany('INSERT INTO log_feature_updates VALUES (?, 1, ?, 1, ?)',
+                               ((fid % 4, fid, 'value') for fid in range(50000, 250000)))
+        connection.commit()
+        connection.close()
+
+        with OfflineLog(path, read_only=True) as offline_log:
+            self.assertLess(self.profile(offline_log.summary), 1 * MB)
+            summary = offline_log.summary()
+
+        self.assertEqual(sum(counts['added'] for counts in summary.values()), 100000)
+        self.assertEqual(sum(counts['edited'] for counts in summary.values()), 150000)
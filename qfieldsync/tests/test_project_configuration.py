@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+
+from qfieldsync.core.project import ProjectConfiguration, ProjectProperties
+from qgis.core import QgsProject
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+class ProjectConfigurationTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        self.project = QgsProject.instance()
+
+    def test_defaults(self):
+        configuration = ProjectConfiguration(self.project, snapshot=True)
+        self.assertFalse(configuration.create_base_map)
+        self.assertEqual(configuration.base_map_type, ProjectProperties.BaseMapType.SINGLE_LAYER)
+        self.assertEqual(configuration.base_map_tile_size, 1024)
+        self.assertEqual(configuration.base_map_mupp, 10.0)
+        self.assertEqual(configuration.imported_files_checksums, [])
+
+    def test_snapshot_batches_writes(self):
+        configuration = ProjectConfiguration(self.project, snapshot=True)
+        configuration.create_base_map = True
+        configuration.base_map_mupp = 2.5
+        configuration.base_map_theme = 'theme'
+
+        # nothing is written until committed
+        self.assertTrue(configuration.is_dirty)
+        self.assertFalse(ProjectConfiguration(self.project).create_base_map)
+        self.assertTrue(configuration.create_base_map)
+
+        dirty_signals = []
+        self.project.isDirtyChanged.connect(dirty_signals.append)
+        configuration.commit()
+
+        self.assertFalse(configuration.is_dirty)
+        self.assertEqual(dirty_signals, [True])
+        self.assertTrue(self.project.isDirty())
+
+        configuration = ProjectConfiguration(self.project)
+        self.assertTrue(configuration.create_base_map)
+        self.assertEqual(configuration.base_map_mupp, 2.5)
+        self.assertEqual(configuration.base_map_theme, 'theme')
+
+    def test_commit_to_dirty_project(self):
+        self.project.setDirty(True)
+        configuration = ProjectConfiguration(self.project, snapshot=True)
+        configuration.create_base_map = True
+
+        dirty_signals = []
+        self.project.isDirtyChanged.connect(dirty_signals.append)
+        configuration.commit()
+
+        # already dirty, nothing changed for the listeners
+        self.assertEqual(dirty_signals, [])
+        self.assertTrue(self.project.isDirty())
+
+    def test_unchanged_values_are_not_dirty(self):
+        configuration = ProjectConfiguration(self.project, snapshot=True)
+        configuration.base_map_tile_size = configuration.base_map_tile_size
+        self.assertFalse(configuration.is_dirty)
+
+        checksums = configuration.imported_files_checksums
+        checksums.append('abc')
+        configuration.imported_files_checksums = checksums
+        self.assertTrue(configuration.is_dirty)
+
+    def test_layer_id_mapping(self):
+        configuration = ProjectConfiguration(self.project, snapshot=True)
+        self.assertEqual(configuration.layer_id_mapping, {})
+
+        mapping = {'points_1234': 'points_offline_5678', 'lines with spaces_1': 'lines with spaces_1'}
+        configuration.layer_id_mapping = mapping
+        configuration.commit()
+
+        self.assertEqual(ProjectConfiguration(self.project).layer_id_mapping, mapping)
+
+    def test_was_written(self):
+        self.project.setFileName('/tmp/written.qgs')
+        configuration = ProjectConfiguration(self.project, snapshot=True)
+        configuration.create_base_map = True
+        self.assertFalse(ProjectConfiguration.was_written(self.project))
+
+        configuration.commit()
+        # even once the project is not dirty anymore, its file may not have the entries
+        self.project.setDirty(False)
+        self.assertTrue(ProjectConfiguration.was_written(self.project))
+
+        # once saved, the file is up to date
+        path = os.path.join(tempfile.mkdtemp(), 'written.qgs')
+        self.project.setFileName(path)
+        configuration.base_map_theme = 'theme'
+        configuration.commit()
+        self.assertTrue(ProjectConfiguration.was_written(self.project))
+        self.assertTrue(self.project.write())
+        self.assertFalse(ProjectConfiguration.was_written(self.project))
+        shutil.rmtree(os.path.dirname(path))
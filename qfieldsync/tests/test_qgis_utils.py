@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import tempfile
+import zipfile
+
+from qfieldsync.core.project import ProjectProperties
+from qfieldsync.utils.qgis_utils import read_imported_files_checksums, read_project_entries, read_project_layers
+from qgis.testing import unittest
+
+
+PROJECT_XML = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+<qgis projectname="" version="3.16.0">
+  <projectlayers>
+    <maplayer type="vector">
+      <id>points_abc</id>
+      <layername>Points</layername>
+    </maplayer>
+    <maplayer type="raster">
+      <id>raster_def</id>
+      <layername>Raster</layername>
+    </maplayer>
+  </projectlayers>
+  <properties>
+    <qfieldsync>
+      <originalProjectPath type="QString">/data/project.qgs</originalProjectPath>
+      <importedFilesChecksums type="QStringList">
+        <value>abc</value>
+        <value>def</value>
+      </importedFilesChecksums>
+      <baseMap>
+        <tileSize type="int">1024</tileSize>
+      </baseMap>
+    </qfieldsync>
+  </properties>
+</qgis>
+"""
+
+
+class QgisUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assert_entries(self, entries):
+        self.assertEqual(entries[ProjectProperties.ORIGINAL_PROJECT_PATH], '/data/project.qgs')
+        self.assertEqual(entries[ProjectProperties.IMPORTED_FILES_CHECKSUMS], ['abc', 'def'])
+        self.assertEqual(entries['/baseMap/tileSize'], '1024')
+
+    def test_read_project_entries_qgs(self):
+        path = os.path.join(self.temp_dir, 'project.qgs')
+        with open(path, 'w') as f:
+            f.write(PROJECT_XML)
+
+        self.assert_entries(read_project_entries(path))
+        self.assertEqual(read_project_entries(path, 'otherScope'), {})
+
+    def test_read_project_entries_qgz(self):
+        path = os.path.join(self.temp_dir, 'project.qgz')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('project.qgs', PROJECT_XML)
+            archive.writestr('project.qgd', b'')
+
+        self.assert_entries(read_project_entries(path))
+
+    def test_read_project_layers(self):
+        path = os.path.join(self.temp_dir, 'project.qgs')
+        with open(path, 'w') as f:
+            f.write(PROJECT_XML)
+
+        self.assertEqual(read_project_layers(path), {'points_abc': 'Points', 'raster_def': 'Raster'})
+
+    def test_read_imported_files_checksums(self):
+        path = os.path.join(self.temp_dir, 'project.qgs')
+        with open(path, 'w') as f:
+            f.write(PROJECT_XML)
+        self.assertEqual(read_imported_files_checksums(path), ['abc', 'def'])
+
+        # projects which are not files to parse are loaded through QGIS instead
+        self.assertIsNone(read_imported_files_checksums('postgresql:?service=qgis&schema=public&project=survey'))
+        broken_path = os.path.join(self.temp_dir, 'broken.qgz')
+        with zipfile.ZipFile(broken_path, 'w') as archive:
+            archive.writestr('project.qgd', b'')
+        self.assertIsNone(read_imported_files_checksums(broken_path))
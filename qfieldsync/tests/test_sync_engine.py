@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from osgeo import ogr, osr
+
+from qfieldsync.core.offline_log import OfflineLog
+from qfieldsync.core.sync_engine import SyncEngine
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsFeatureRequest, QgsProject, QgsVectorLayer
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+def create_points(path, fields, rows, epsg=4326):
+    """
+    Write a GeoPackage with a point layer "points"
+
+    :param fields: A list of (name, ogr type)
+    :param rows: A list of (fid, {name: value}, x, y)
+    :param epsg: The EPSG code of the CRS of the layer
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    dataset = ogr.GetDriverByName('GPKG').CreateDataSource(path)
+    layer = dataset.CreateLayer('points', srs, ogr.wkbPoint)
+    for name, field_type in fields:
+        layer.CreateField(ogr.FieldDefn(name, field_type))
+    for fid, values, x, y in rows:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetFID(fid)
+        for name, value in values.items():
+            feature.SetField(name, value)
+        feature.SetGeometry(ogr.CreateGeometryFromWkt('POINT ({} {})'.format(x, y)))
+        layer.CreateFeature(feature)
+    dataset = None
+
+
+class SyncEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        QgsProject.instance().clear()
+        self.temp_dir = tempfile.mkdtemp()
+        self.remote_path = os.path.join(self.temp_dir, 'remote.gpkg')
+        self.offline_path = os.path.join(self.temp_dir, 'data.gpkg')
+
+    def tearDown(self):
+        QgsProject.instance().clear()
+        shutil.rmtree(self.temp_dir)
+
+    def add_offline_layer(self, **properties):
+        layer = QgsVectorLayer(self.offline_path + '|layername=points', 'points', 'ogr')
+        self.assertTrue(layer.isValid())
+        layer.setCustomProperty('isOfflineEditable', True)
+        layer.setCustomProperty('remoteSource', self.remote_path + '|layername=points')
+        layer.setCustomProperty('remoteProvider', 'ogr')
+        for key, value in properties.items():
+            layer.setCustomProperty(key, value)
+        QgsProject.instance().addMapLayer(layer)
+        return layer
+
+    def write_log(self, layer, added_attribute, added_fids, attribute_updates=(), geometry_updates=()):
+        """
+        Write the log tables as QgsOfflineEditing creates them, the remote feature 1 is the offline feature 1
+
+        :param attribute_updates: A list of (fid, field name, value)
+        :param geometry_updates: A list of (fid, wkt)
+        """
+        fields = layer.fields()
+        connection = sqlite3.connect(self.offline_path)
+        connection.executescript("""
+            CREATE TABLE log_indices (name TEXT, last_index INTEGER);
+            CREATE TABLE log_layer_ids (id INTEGER, qgis_id TEXT);
+            CREATE TABLE log_fids (layer_id INTEGER, offline_fid INTEGER, remote_fid INTEGER);
+            CREATE TABLE log_added_attrs (layer_id INTEGER, commit_no INTEGER, name TEXT, type INTEGER,
+                                          length INTEGER, precision INTEGER, comment TEXT);
+            CREATE TABLE log_added_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_removed_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_feature_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, attr INTEGER, value TEXT);
+            CREATE TABLE log_geometry_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, geom_wkt TEXT);
+        """)
+        connection.execute('INSERT INTO log_layer_ids VALUES (1, ?)', (layer.id(),))
+        connection.execute('INSERT INTO log_fids VALUES (1, 1, 1)')
+        connection.execute("INSERT INTO log_added_attrs VALUES (1, 1, ?, ?, 0, 0, '')",
+                           (added_attribute, int(fields.field(added_attribute).type())))
+        connection.executemany('INSERT INTO log_added_features VALUES (1, ?)', [(fid,) for fid in added_fids])
+        # the offline attribute indexes may differ from the remote ones
+        connection.executemany('INSERT INTO log_feature_updates VALUES (1, 2, ?, ?, ?)', [
+            (fid, fields.indexOf(name), value) for fid, name, value in attribute_updates])
+        connection.executemany('INSERT INTO log_geometry_updates VALUES (1, 3, ?, ?)', geometry_updates)
+        connection.commit()
+        connection.close()
+
+    def remote_features(self):
+        remote = QgsVectorLayer(self.remote_path + '|layername=points', 'remote', 'ogr')
+        self.assertIn('comment', remote.fields().names())
+        return {feature['name']: feature for feature in remote.getFeatures(QgsFeatureRequest())}
+
+    def assertLogIsEmpty(self):
+        # nothing is left for QgsOfflineEditing to replay by position or in the offline CRS
+        with OfflineLog(self.offline_path) as offline_log:
+            self.assertTrue(offline_log.changes(1).is_empty())
+            self.assertEqual(offline_log.added_attributes(1), [])
+
+    def test_pruned_layer(self):
+        create_points(self.remote_path, [('name', ogr.OFTString), ('notes', ogr.OFTString), ('category', ogr.OFTInteger)],
+                      [(1, {'name': 'a', 'notes': 'keep', 'category': 5}, 0, 0)])
+        # "notes" has been pruned from the offline copy and "comment" has been added in QField
+        create_points(self.offline_path, [('name', ogr.OFTString), ('category', ogr.OFTInteger), ('comment', ogr.OFTString)],
+                      [(1, {'name': 'a', 'category': 5}, 0, 0),
+                       (2, {'name': 'b', 'category': 6, 'comment': 'new'}, 1, 1)])
+        layer = self.add_offline_layer(**{'QFieldSync/prune_fields': True})
+        self.write_log(layer, 'comment', [2], [(1, 'category', '7'), (1, 'comment', 'edited')])
+
+        statistics = SyncEngine(QgsProject.instance()).synchronize()
+        self.assertEqual([(s.inserted, s.updated, s.deleted) for s in statistics], [(1, 1, 0)])
+
+        features = self.remote_features()
+        self.assertEqual(sorted(features), ['a', 'b'])
+        self.assertEqual((features['a']['notes'], features['a']['category'], features['a']['comment']),
+                         ('keep', 7, 'edited'))
+        self.assertEqual((features['b']['category'], features['b']['comment']), (6, 'new'))
+        self.assertLogIsEmpty()
+
+    def test_reprojected_layer(self):
+        remote_crs = QgsCoordinateReferenceSystem('EPSG:4326')
+        offline_crs = QgsCoordinateReferenceSystem('EPSG:3857')
+        to_offline = QgsCoordinateTransform(remote_crs, offline_crs, QgsProject.instance())
+
+        def offline_point(x, y):
+            point = to_offline.transform(x, y)
+            return point.x(), point.y()
+
+        create_points(self.remote_path, [('name', ogr.OFTString)], [(1, {'name': 'a'}, 7, 46)])
+        # reprojected while packaged and "comment" has been added in QField
+        moved_x, moved_y = offline_point(8, 47)
+        create_points(self.offline_path, [('name', ogr.OFTString), ('comment', ogr.OFTString)],
+                      [(1, {'name': 'a'}, *offline_point(7, 46)),
+                       (2, {'name': 'b', 'comment': 'new'}, *offline_point(9, 45))], epsg=3857)
+        layer = self.add_offline_layer()
+        self.write_log(layer, 'comment', [2], [(1, 'comment', 'edited')],
+                       [(1, 'Point ({} {})'.format(moved_x, moved_y))])
+
+        SyncEngine(QgsProject.instance()).synchronize()
+
+        features = self.remote_features()
+        self.assertEqual(features['a']['comment'], 'edited')
+        self.assertEqual(features['b']['comment'], 'new')
+        # written in the CRS of the remote layer
+        for name, expected in (('a', (8, 47)), ('b', (9, 45))):
+            point = features[name].geometry().asPoint()
+            self.assertAlmostEqual(point.x(), expected[0], places=6)
+            self.assertAlmostEqual(point.y(), expected[1], places=6)
+        self.assertLogIsEmpty()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from qfieldsync.core.package_manifest import PackageManifest
+from qfieldsync.core.sync_preview import SyncPreview
+from qgis.testing import start_app, unittest
+
+start_app()
+
+
+PROJECT_XML = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+<qgis projectname="" version="3.16.0">
+  <projectlayers>
+    <maplayer type="vector">
+      <id>points_offline</id>
+      <layername>Points</layername>
+    </maplayer>
+    <maplayer type="vector">
+      <id>lines_offline</id>
+      <layername>Lines</layername>
+    </maplayer>
+  </projectlayers>
+  <properties>
+    <qfieldsync>
+      <originalProjectPath type="QString">{original_project_path}</originalProjectPath>
+    </qfieldsync>
+  </properties>
+</qgis>
+"""
+
+
+class SyncPreviewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.qfield_folder = os.path.join(self.temp_dir, 'qfield')
+        self.original_folder = os.path.join(self.temp_dir, 'original')
+        os.makedirs(os.path.join(self.qfield_folder, 'DCIM'))
+        os.makedirs(os.path.join(self.original_folder, 'DCIM'))
+
+        with open(os.path.join(self.qfield_folder, 'project_qfield.qgs'), 'w') as f:
+            f.write(PROJECT_XML.format(original_project_path=os.path.join(self.original_folder, 'project.qgs')))
+
+        for folder, file_name, content in [
+                (self.qfield_folder, 'new.jpg', b'new'),
+                (self.qfield_folder, 'changed.jpg', b'changed'),
+                (self.qfield_folder, 'same.jpg', b'same'),
+                (self.original_folder, 'changed.jpg', b'old'),
+                (self.original_folder, 'same.jpg', b'same')]:
+            with open(os.path.join(folder, 'DCIM', file_name), 'wb') as f:
+                f.write(content)
+
+        connection = sqlite3.connect(os.path.join(self.qfield_folder, 'data.gpkg'))
+        connection.executescript("""
+            CREATE TABLE log_indices (name TEXT, last_index INTEGER);
+            CREATE TABLE log_layer_ids (id INTEGER, qgis_id TEXT);
+            CREATE TABLE log_fids (layer_id INTEGER, offline_fid INTEGER, remote_fid INTEGER);
+            CREATE TABLE log_added_attrs (layer_id INTEGER, commit_no INTEGER, name TEXT, type INTEGER,
+                                          length INTEGER, precision INTEGER, comment TEXT);
+            CREATE TABLE log_added_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_removed_features (layer_id INTEGER, fid INTEGER);
+            CREATE TABLE log_feature_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, attr INTEGER, value TEXT);
+            CREATE TABLE log_geometry_updates (layer_id INTEGER, commit_no INTEGER, fid INTEGER, geom_wkt TEXT);
+
+            INSERT INTO log_layer_ids VALUES (1, 'points_offline'), (2, 'lines_offline');
+            INSERT INTO log_added_features VALUES (1, 10), (1, 11), (1, 12);
+            INSERT INTO log_removed_features VALUES (1, 11), (1, 3);
+            INSERT INTO log_feature_updates VALUES
+                (1, 1, 1, 1, 'a'), (1, 2, 1, 2, 'b'), (1, 2, 2, 1, 'c'), (1, 3, 10, 1, 'd'), (1, 3, 3, 1, 'e');
+            INSERT INTO log_geometry_updates VALUES (1, 4, 2, 'Point (0 0)'), (2, 1, 1, 'LineString (0 0, 1 1)');
+            INSERT INTO log_added_attrs VALUES (2, 2, 'comment', 10, 0, 0, '');
+        """)
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_scan(self):
+        preview = SyncPreview(self.qfield_folder).scan()
+
+        self.assertEqual([diff.name for diff in preview.layers], ['Lines', 'Points'])
+        lines, points = preview.layers
+        self.assertEqual((points.added, points.edited, points.deleted, points.log_entries), (2, 2, 1, 11))
+        self.assertEqual((lines.added, lines.edited, lines.deleted, lines.added_attributes), (0, 1, 0, 1))
+
+        self.assertEqual(preview.new_pictures, ['new.jpg'])
+        self.assertEqual(preview.changed_pictures, ['changed.jpg'])
+        self.assertEqual(preview.picture_bytes, len(b'new') + len(b'changed'))
+        self.assertTrue(preview.has_changes)
+        self.assertIn('Points: 2 added, 2 edited, 1 deleted', preview.report())
+
+        # nothing has been changed
+        preview = SyncPreview(self.qfield_folder).scan()
+        self.assertEqual(preview.layers[1].added, 2)
+
+    def test_scan_with_manifest(self):
+        manifest = PackageManifest(self.qfield_folder)
+        manifest.add_directory()
+        manifest.write()
+
+        with open(os.path.join(self.qfield_folder, 'DCIM', 'new.jpg'), 'ab') as f:
+            f.write(b' edited')
+        files = sorted(os.listdir(self.qfield_folder))
+
+        preview = SyncPreview(self.qfield_folder).scan()
+        self.assertEqual(preview.verification.changed, ['DCIM/new.jpg'])
+        self.assertEqual(preview.verification.hashed_count, 0)
+        # the preview is read only
+        self.assertEqual(sorted(os.listdir(self.qfield_folder)), files)
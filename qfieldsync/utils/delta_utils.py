@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import shutil
+
+
+# Size of the blocks files are compared in
+DELTA_BLOCK_SIZE = 64 * 1024
+
+
+def compute_delta(source_path, target_path, block_size=DELTA_BLOCK_SIZE):
+    """
+    Compute how to turn the target file into the source file, reusing the blocks the target already has.
+
+    The files are compared block by block at the same offsets, the common case of a database whose
+    pages have been modified in place or which has grown or shrunk at its end. Blocks which moved,
+    because data has been inserted or removed, are not searched for: they could not be reused
+    without rewriting the file.
+
+    :return: A list of ('copy', offset, length) and ('data', offset, length) instructions, the 'data'
+             ranges have to be written from the source into the target at the same offset
+    """
+    instructions = list()
+    with open(source_path, 'rb') as source, open(target_path, 'rb') as target:
+        offset = 0
+        while True:
+            source_block = source.read(block_size)
+            if not source_block:
+                break
+            target_block = target.read(block_size)
+            kind = 'copy' if source_block == target_block else 'data'
+            _append(instructions, kind, offset, len(source_block))
+            offset += len(source_block)
+    return instructions
+
+
+def _append(instructions, kind, offset, length):
+    if length <= 0:
+        return
+    if instructions:
+        last_kind, last_offset, last_length = instructions[-1]
+        if last_kind == kind and last_offset + last_length == offset:
+            instructions[-1] = (kind, last_offset, last_length + length)
+            return
+    instructions.append((kind, offset, length))
+
+
+def apply_delta(source_path, target_path, instructions):
+    """
+    Turn the target file into the source file, writing only the changed ranges into it.
+
+    :return: The number of bytes written
+    """
+    written = 0
+    with open(source_path, 'rb') as source, open(target_path, 'r+b') as target:
+        for kind, offset, length in instructions:
+            if kind == 'data':
+                source.seek(offset)
+                target.seek(offset)
+                written += _copy_range(source, target, length)
+        target.truncate(os.path.getsize(source_path))
+    return written
+
+
+def delta_copy(source_path, target_path, block_size=DELTA_BLOCK_SIZE):
+    """
+    Copy a file over an older version of it, writing only the blocks which changed.
+
+    If no block can be reused in place, the file is copied as a whole.
+
+    :return: The number of bytes which did not have to be written
+    """
+    source_size = os.path.getsize(source_path)
+    if not os.path.isfile(target_path) or source_size < block_size:
+        shutil.copyfile(source_path, target_path)
+        return 0
+
+    instructions = compute_delta(source_path, target_path, block_size)
+    if not any(kind == 'copy' for kind, _, _ in instructions):
+        shutil.copyfile(source_path, target_path)
+        return 0
+
+    written = apply_delta(source_path, target_path, instructions)
+    shutil.copystat(source_path, target_path)
+    return source_size - written
+
+
+def _copy_range(source, target, length):
+    copied = 0
+    while length > 0:
+        chunk = source.read(min(length, 1024 * 1024))
+        if not chunk:
+            break
+        target.write(chunk)
+        copied += len(chunk)
+        length -= len(chunk)
+    return copied
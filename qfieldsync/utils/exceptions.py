@@ -56,3 +56,13 @@ class NoProjectFoundError(QFieldSyncError):
 
         # Call the base class constructor with the parameters it needs
         super(NoProjectFoundError, self).__init__(message, exception, long_message, tag)
+
+
+class ModifiedFilesError(QFieldSyncError):
+
+    def __init__(self, message, files, exception=None, long_message=None, tag="QFieldSync"):
+        """
+        :param files: the paths of the modified files
+        """
+        super(ModifiedFilesError, self).__init__(message, exception, long_message, tag)
+        self.files = files
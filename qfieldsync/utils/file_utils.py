@@ -33,6 +33,56 @@ from qfieldsync.utils.exceptions import NoProjectFoundError, QFieldSyncError
 
 from qgis.PyQt.QtCore import QCoreApplication
 
+class DirectoryIndex(object):
+    """
+    Caches the listing of directories.
+
+    Looking up files next to each other then takes a single `os.scandir` per directory
+    instead of a `stat` call per candidate file.
+    """
+
+    def __init__(self):
+        self._listings = dict()
+
+    def listing(self, directory):
+        """
+        Return a dict of the lower case file names in a directory to the actual file names
+        """
+        key = os.path.normcase(os.path.abspath(directory))
+        if key not in self._listings:
+            files = dict()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            files[entry.name.lower()] = entry.name
+            except OSError:
+                pass
+            self._listings[key] = files
+
+        return self._listings[key]
+
+    def find_files(self, directory, basename, extensions):
+        """
+        Return the names of the files in a directory named after basename and one of the extensions.
+
+        Extensions are matched case insensitively.
+        """
+        listing = self.listing(directory)
+        names = list()
+        for extension in extensions:
+            name = listing.get((basename + extension).lower())
+            if name is not None:
+                names.append(name)
+        return names
+
+    def invalidate(self, directory=None):
+        if directory is None:
+            self._listings.clear()
+        else:
+            self._listings.pop(os.path.normcase(os.path.abspath(directory)), None)
+
+
 def fileparts(fn, extension_dot=True):
     path = os.path.dirname(fn)
     basename = os.path.basename(fn)
@@ -90,19 +140,41 @@ def open_folder(path):
         subprocess.Popen(["xdg-open", path])
 
 
-def import_file_checksum(folder):
+def import_file_checksum(folder, progress_callback=None):
     md5sum = None
     path = os.path.join(folder, "data.gpkg")
     if not os.path.exists(path):
         path = os.path.join(folder, "data.sqlite")
     if os.path.exists(path):
-        with open(path, 'rb') as f:
-            file_data = f.read()
-            md5sum = hashlib.md5(file_data).hexdigest()
+        md5sum = file_checksum(path, progress_callback)
 
     return md5sum
 
 
+# Size of the blocks files are hashed in
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+
+def file_checksum(path, progress_callback=None, algorithm='md5'):
+    """
+    Return the checksum of a file, read block by block.
+
+    :param progress_callback: called with (bytes read, file size) after every block
+    :param algorithm: the name of the hashlib algorithm
+    """
+    checksum = hashlib.new(algorithm)
+    size = os.path.getsize(path)
+    read = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHECKSUM_BLOCK_SIZE), b''):
+            checksum.update(block)
+            read += len(block)
+            if progress_callback:
+                progress_callback(read, size)
+
+    return checksum.hexdigest()
+
+
 def slugify(text: str) -> str:
     # https://stackoverflow.com/q/5574042/1548052
     slug = unicodedata.normalize('NFKD', text)
@@ -112,7 +184,10 @@ def slugify(text: str) -> str:
     return slug
 
 
-def copy_images(source_folder, destination_folder):
+def copy_images(source_folder, destination_folder, journal=None):
+    """
+    Copy the content of a folder, files recorded in the PackageJournal `journal` are skipped.
+    """
     if os.path.isdir(source_folder):
         if not os.path.isdir(destination_folder):
             os.mkdir(destination_folder)
@@ -126,6 +201,10 @@ def copy_images(source_folder, destination_folder):
         for name in files:
             file_path = os.path.join(root, name)
             destination_file_path = os.path.join(destination_folder, os.path.relpath(file_path, source_folder))
+            if journal is not None and journal.is_file_done(file_path, destination_file_path):
+                continue
             # copy the file no matter if it exists or not
-            shutil.copyfile(os.path.join(root, name), destination_file_path)
+            shutil.copyfile(file_path, destination_file_path)
+            if journal is not None:
+                journal.file_done(file_path, destination_file_path)
 
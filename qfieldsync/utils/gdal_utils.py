@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+
+from contextlib import contextmanager
+
+from osgeo import gdal, ogr
+
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+
+# Upper bound (in MB) of the GDAL block cache, applied before rasters are clipped.
+# GDAL reads and writes rasters block by block, so this keeps memory usage bounded
+# no matter how large the source file is.
+CLIP_CACHE_MAX_MB = 256
+
+# Size (in pixels) of the tiles written to clipped rasters
+CLIP_TILE_SIZE = 512
+
+# Number of features written per transaction when vector layers are reprojected
+VECTOR_TRANSACTION_SIZE = 20000
+
+
+@contextmanager
+def gdal_config(**options):
+    """
+    Temporarily set GDAL configuration options for the calling thread.
+
+    Rasters are clipped on several threads at once, options set for the whole process would be
+    restored by one thread while another one still relies on them.
+    """
+    previous = {key: gdal.GetThreadLocalConfigOption(key, None) for key in options}
+    try:
+        for key, value in options.items():
+            gdal.SetThreadLocalConfigOption(key, str(value))
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+
+
+def limit_block_cache():
+    """
+    Bound the GDAL block cache to CLIP_CACHE_MAX_MB.
+
+    GDAL_CACHEMAX is only read when the block cache is first used, which within QGIS has always
+    happened already, so the cache size is set directly. The cache is shared by the whole process,
+    it is only ever lowered.
+    """
+    cache_max = CLIP_CACHE_MAX_MB * 1024 ** 2
+    if gdal.GetCacheMax() > cache_max:
+        gdal.SetCacheMax(cache_max)
+
+
+def raster_creation_options():
+    return [
+        'TILED=YES',
+        'BLOCKXSIZE={}'.format(CLIP_TILE_SIZE),
+        'BLOCKYSIZE={}'.format(CLIP_TILE_SIZE),
+        'BIGTIFF=IF_SAFER',
+    ]
+
+
+def clip_raster(source_path, target_path, extent):
+    """
+    Write the part of a raster within an extent to a tiled GeoTIFF.
+
+    :param source_path: The path to the source raster
+    :param target_path: The path of the GeoTIFF to create
+    :param extent:      The clipping extent (xmin, ymin, xmax, ymax) in the raster CRS
+    :return: True if anything has been written, False if the raster does not intersect the extent
+    """
+    limit_block_cache()
+    source = open_raster(source_path)
+
+    window = clip_window(source, extent)
+    if window is None:
+        return False
+
+    options = gdal.TranslateOptions(
+        format='GTiff',
+        projWin=window,
+        creationOptions=raster_creation_options()
+    )
+    result = gdal.Translate(target_path, source, options=options)
+    if result is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not clip raster {}').format(source_path))
+
+    # Closing the datasets flushes the remaining blocks to disk
+    result = None
+    source = None
+
+    return True
+
+
+def optimize_raster(source_path, target_path, extent=None, target_srs=None):
+    """
+    Rewrite a raster as a tiled and compressed GeoTIFF with internal overviews (cloud optimized GeoTIFF).
+
+    The COG driver is used if available (GDAL >= 3.1), otherwise a tiled GeoTIFF is written and
+    overviews are added afterwards.
+
+    :param source_path: The path to the source raster
+    :param target_path: The path of the GeoTIFF to create
+    :param extent:      If set, the clipping extent (xmin, ymin, xmax, ymax) in the raster CRS
+    :param target_srs:  If set, the CRS (authority id or WKT) the raster is warped to, on all CPUs
+    :return: A tuple with the source and the target size in bytes or None if the raster does not intersect the extent
+    """
+    limit_block_cache()
+    with gdal_config(COMPRESS_OVERVIEW='DEFLATE'):
+        source = open_raster(source_path)
+
+        window = None
+        if extent is not None:
+            window = clip_window(source, extent)
+            if window is None:
+                return None
+
+        if target_srs:
+            if window is not None:
+                # clip in the source CRS first, the warped raster is only computed for the window
+                source = gdal.Translate('', source, options=gdal.TranslateOptions(format='VRT', projWin=window))
+                window = None
+            source = gdal.Warp('', source, options=gdal.WarpOptions(
+                format='VRT',
+                dstSRS=target_srs,
+                resampleAlg='bilinear',
+                multithread=True,
+                warpOptions=['NUM_THREADS=ALL_CPUS']
+            ))
+            if source is None:
+                raise QFieldSyncError(
+                    QCoreApplication.translate('QFieldGdalUtils', 'Could not reproject raster {}').format(source_path))
+
+        use_cog_driver = gdal.GetDriverByName('COG') is not None
+        if use_cog_driver:
+            creation_options = [
+                'COMPRESS=DEFLATE',
+                'PREDICTOR=YES',
+                'BLOCKSIZE={}'.format(CLIP_TILE_SIZE),
+                'OVERVIEWS=AUTO',
+                'BIGTIFF=IF_SAFER',
+            ]
+        else:
+            creation_options = raster_creation_options() + ['COMPRESS=DEFLATE', 'PREDICTOR=2']
+
+        options = gdal.TranslateOptions(
+            format='COG' if use_cog_driver else 'GTiff',
+            projWin=window,
+            creationOptions=creation_options
+        )
+        result = gdal.Translate(target_path, source, options=options)
+        if result is None:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldGdalUtils', 'Could not optimize raster {}').format(source_path))
+
+        if not use_cog_driver:
+            result.BuildOverviews('AVERAGE', overview_levels(result))
+
+        result = None
+        source = None
+
+    return os.path.getsize(source_path), os.path.getsize(target_path)
+
+
+def open_raster(path):
+    dataset = gdal.Open(path)
+    if dataset is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not open raster {}').format(path))
+    return dataset
+
+
+def clip_window(dataset, extent):
+    """
+    Return the projection window (ulx, uly, lrx, lry) of a raster dataset within an extent
+
+    :param dataset: The raster dataset
+    :param extent:  The extent (xmin, ymin, xmax, ymax) in the raster CRS
+    :return: The window or None if the raster does not intersect the extent
+    """
+    xmin, ymin, xmax, ymax = extent
+    source_xmin, source_ymin, source_xmax, source_ymax = raster_extent(dataset)
+    if xmin >= source_xmax or xmax <= source_xmin or ymin >= source_ymax or ymax <= source_ymin:
+        return None
+
+    return [max(xmin, source_xmin), min(ymax, source_ymax), min(xmax, source_xmax), max(ymin, source_ymin)]
+
+
+def overview_levels(dataset):
+    """
+    Return the overview factors required until the raster fits into a single tile
+    """
+    levels = []
+    factor = 2
+    while max(dataset.RasterXSize, dataset.RasterYSize) / factor >= CLIP_TILE_SIZE:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def clip_vector(source_path, target_path, extent, layer_name=None, target_srs=None, field_names=None):
+    """
+    Stream the features of a vector layer which intersect an extent into a new file.
+
+    Features are read and written one by one through OGR, the source is never loaded as a whole.
+
+    :param source_path: The path to the source dataset
+    :param target_path: The path of the dataset to write, its driver is chosen after the file extension
+    :param extent:      The spatial filter (xmin, ymin, xmax, ymax) in the layer CRS, None to copy all the features
+    :param layer_name:  The layer to copy for multi layer datasets, the first layer otherwise
+    :param target_srs:  If set, the CRS (authority id or WKT) the features are transformed to
+    :param field_names: If set, only these fields are written, the other fields are not even read
+    """
+    source = gdal.OpenEx(source_path, gdal.OF_VECTOR)
+    if source is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not open vector dataset {}').format(source_path))
+
+    if not layer_name:
+        layer_name = source.GetLayer(0).GetName()
+
+    options = gdal.VectorTranslateOptions(
+        format=vector_driver_name(target_path) or 'GPKG',
+        layers=[layer_name],
+        layerName=layer_name,
+        spatFilter=list(extent) if extent is not None else None,
+        dstSRS=target_srs,
+        selectFields=field_names,
+        accessMode='overwrite',
+        options=['-preserve_fid']
+    )
+    result = gdal.VectorTranslate(target_path, source, options=options)
+    if result is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not clip layer {layer} of {path}').format(
+                layer=layer_name, path=source_path))
+
+    result = None
+    source = None
+
+
+def reproject_table(path, layer_name, target_layer_name, target_srs):
+    """
+    Write a layer of a dataset, transformed to another CRS, as a new layer of the same dataset.
+
+    The features keep their ids. The transformation is done by OGR in transactions of
+    VECTOR_TRANSACTION_SIZE features, without going through Python feature by feature.
+
+    :param path:              The path to the dataset, e.g. a GeoPackage
+    :param layer_name:        The layer to reproject
+    :param target_layer_name: The name of the new layer, replaced if it exists
+    :param target_srs:        The CRS (authority id or WKT) of the new layer
+    """
+    dataset = gdal.OpenEx(path, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    if dataset is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not open vector dataset {}').format(path))
+
+    options = gdal.VectorTranslateOptions(
+        layers=[layer_name],
+        layerName=target_layer_name,
+        dstSRS=target_srs,
+        accessMode='overwrite',
+        options=['-preserve_fid', '-gt', str(VECTOR_TRANSACTION_SIZE)]
+    )
+    # translating a dataset into itself writes into the already opened dataset
+    result = gdal.VectorTranslate(dataset, dataset, options=options)
+    if result is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not reproject layer {layer} of {path}').format(
+                layer=layer_name, path=path))
+
+    result = None
+    dataset = None
+
+
+def delete_vector_layers(path, layer_names):
+    """
+    Remove layers from a vector dataset.
+    """
+    dataset = gdal.OpenEx(path, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    if dataset is None:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGdalUtils', 'Could not open vector dataset {}').format(path))
+
+    for layer_name in layer_names:
+        for index in range(dataset.GetLayerCount()):
+            if dataset.GetLayer(index).GetName() == layer_name:
+                dataset.DeleteLayer(index)
+                break
+
+    dataset = None
+
+
+def raster_extent(dataset):
+    """
+    Return the extent (xmin, ymin, xmax, ymax) of a raster dataset
+    """
+    x_origin, x_size, _, y_origin, _, y_size = dataset.GetGeoTransform()
+    x_end = x_origin + x_size * dataset.RasterXSize
+    y_end = y_origin + y_size * dataset.RasterYSize
+    return min(x_origin, x_end), min(y_origin, y_end), max(x_origin, x_end), max(y_origin, y_end)
+
+
+def vector_driver_name(path):
+    """
+    Return the name of the OGR driver able to create a file with the extension of path, None if there is none.
+    """
+    _, ext = os.path.splitext(path)
+    ext = ext[1:].lower()
+
+    for i in range(ogr.GetDriverCount()):
+        driver = ogr.GetDriver(i)
+        extensions = (driver.GetMetadataItem(gdal.DMD_EXTENSIONS) or '').split()
+        if ext in extensions and driver.GetMetadataItem(gdal.DCAP_CREATE) == 'YES':
+            return driver.GetName()
+
+    return None
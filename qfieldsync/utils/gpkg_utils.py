@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import sqlite3
+
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+
+# Metadata tables with one row per table, as (table, column holding the table name)
+TABLE_METADATA = [
+    ('gpkg_contents', 'table_name'),
+    ('gpkg_geometry_columns', 'table_name'),
+    ('gpkg_extensions', 'table_name'),
+    ('gpkg_data_columns', 'table_name'),
+    ('gpkg_metadata_reference', 'table_name'),
+    ('gpkg_ogr_contents', 'table_name'),
+    ('layer_styles', 'f_table_name'),
+]
+
+# Metadata tables which are copied as a whole when the GeoPackage is created
+SHARED_METADATA = [
+    'gpkg_spatial_ref_sys',
+    'gpkg_data_column_constraints',
+    'gpkg_metadata',
+]
+
+
+def quote(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def extract_tables(source_path, target_path, table_names):
+    """
+    Copy tables of a GeoPackage with their spatial indexes and metadata into another GeoPackage.
+
+    The rows are copied in bulk with plain SQLite, no feature goes through OGR. The target
+    GeoPackage is created if it does not exist, tables which already exist in it are skipped.
+
+    :param source_path: The path to the source GeoPackage
+    :param target_path: The path to the GeoPackage to write
+    :param table_names: The names of the tables to copy
+    :return: The names of the copied tables
+    """
+    create = not os.path.isfile(target_path)
+
+    try:
+        connection = sqlite3.connect(target_path, isolation_level=None)
+    except sqlite3.Error as err:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGpkgUtils', 'Could not create GeoPackage {path}: {error}').format(
+                path=target_path, error=err))
+
+    try:
+        connection.execute('ATTACH DATABASE ? AS source', (source_path,))
+        connection.execute('BEGIN')
+
+        if create:
+            _create_metadata_tables(connection)
+
+        copied = list()
+        for table_name in table_names:
+            table_name = _source_table_name(connection, table_name)
+            if table_name is None or _table_exists(connection, 'main', table_name):
+                continue
+            _copy_table(connection, table_name)
+            copied.append(table_name)
+
+        connection.execute('COMMIT')
+        connection.execute('DETACH DATABASE source')
+    except sqlite3.Error as err:
+        raise QFieldSyncError(
+            QCoreApplication.translate('QFieldGpkgUtils', 'Could not extract tables from {path}: {error}').format(
+                path=source_path, error=err))
+    finally:
+        connection.close()
+
+    return copied
+
+
+def _create_metadata_tables(connection):
+    for pragma in ('application_id', 'user_version'):
+        value = connection.execute('PRAGMA source.{}'.format(pragma)).fetchone()[0]
+        connection.execute('PRAGMA main.{}={}'.format(pragma, int(value)))
+
+    for table_name, _ in TABLE_METADATA:
+        _create_table(connection, table_name)
+
+    for table_name in SHARED_METADATA:
+        if _create_table(connection, table_name):
+            connection.execute('INSERT INTO main.{table} SELECT * FROM source.{table}'.format(table=quote(table_name)))
+
+    # extensions which apply to the whole GeoPackage
+    if _table_exists(connection, 'main', 'gpkg_extensions'):
+        connection.execute('INSERT INTO main.gpkg_extensions SELECT * FROM source.gpkg_extensions WHERE table_name IS NULL')
+
+    _create_triggers(connection, [table for table, _ in TABLE_METADATA] + SHARED_METADATA)
+
+
+def _copy_table(connection, table_name):
+    _create_table(connection, table_name)
+    connection.execute('INSERT INTO main.{table} SELECT * FROM source.{table}'.format(table=quote(table_name)))
+
+    for metadata_table, column in TABLE_METADATA:
+        if _table_exists(connection, 'main', metadata_table):
+            connection.execute(
+                'INSERT INTO main.{table} SELECT * FROM source.{table} WHERE lower({column}) = lower(?)'.format(
+                    table=quote(metadata_table), column=quote(column)),
+                (table_name,))
+
+    if _table_exists(connection, 'main', 'gpkg_geometry_columns'):
+        geometry_columns = connection.execute(
+            'SELECT column_name FROM main.gpkg_geometry_columns WHERE table_name = ?', (table_name,)).fetchall()
+        for geometry_column, in geometry_columns:
+            rtree_name = 'rtree_{}_{}'.format(table_name, geometry_column)
+            if _create_table(connection, rtree_name):
+                connection.execute('INSERT INTO main.{table} SELECT * FROM source.{table}'.format(table=quote(rtree_name)))
+
+    rows = connection.execute(
+        "SELECT sql FROM source.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table_name,)).fetchall()
+    for sql, in rows:
+        connection.execute(sql)
+
+    # triggers last, the spatial index triggers rely on functions plain SQLite does not provide
+    _create_triggers(connection, [table_name])
+
+
+def _create_table(connection, table_name):
+    """
+    Create a table of the source database in the main database, return False if the source has no such table
+    """
+    row = connection.execute(
+        "SELECT sql FROM source.sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+    if row is None:
+        return False
+    connection.execute(row[0])
+    return True
+
+
+def _create_triggers(connection, table_names):
+    for table_name in table_names:
+        rows = connection.execute(
+            "SELECT sql FROM source.sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND sql IS NOT NULL",
+            (table_name,)).fetchall()
+        for sql, in rows:
+            connection.execute(sql)
+
+
+def _table_exists(connection, schema, table_name):
+    return connection.execute(
+        "SELECT 1 FROM {}.sqlite_master WHERE type = 'table' AND name = ?".format(schema),
+        (table_name,)).fetchone() is not None
+
+
+def _source_table_name(connection, table_name):
+    row = connection.execute(
+        "SELECT name FROM source.sqlite_master WHERE type = 'table' AND lower(name) = lower(?)",
+        (table_name,)).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import platform
+import time
+import tracemalloc
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import QgsMessageLog, Qgis
+
+
+def process_rss():
+    """
+    Return the resident set size of the process in bytes, or None if it cannot be determined.
+    """
+    if platform.system() == 'Linux':
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return None
+
+    if platform.system() == 'Windows':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t),
+            ]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # only the peak is available, in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PhaseRecord(object):
+    """
+    The memory use at the end of a phase.
+    """
+
+    def __init__(self, phase, seconds, current, peak, rss, top_allocations):
+        self.phase = phase
+        self.seconds = seconds
+        # bytes allocated by Python, now and at the peak of the phase
+        self.current = current
+        self.peak = peak
+        self.rss = rss
+        # the lines which allocated the most memory during the phase
+        self.top_allocations = top_allocations
+
+
+class MemoryProfiler(object):
+    """
+    Records the memory use at the phase boundaries of a long running operation.
+
+    Python allocations are traced with tracemalloc, the process RSS covers the memory allocated by
+    QGIS, GDAL and the other libraries as well. Once stopped, a report with the memory use of every
+    phase and its top allocations is written to the log folder.
+
+    A disabled profiler does nothing, so it can be used unconditionally.
+    """
+
+    # The number of allocations reported per phase
+    TOP_COUNT = 15
+    # The number of frames stored per allocation
+    TRACEBACK_FRAMES = 1
+
+    def __init__(self, name, log_folder=None, enabled=True):
+        """
+        :param name: The name of the profiled operation, used in the report file name
+        :param log_folder: if set, the folder the report is written to
+        :param enabled: if False, nothing is recorded
+        """
+        self.name = name
+        self.log_folder = log_folder
+        self.enabled = enabled
+        self.records = list()
+        self._started_tracing = False
+        self._snapshot = None
+        self._phase_start = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        if not self.enabled:
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MemoryProfiler.TRACEBACK_FRAMES)
+            self._started_tracing = True
+        self.records = list()
+        self._snapshot = self._take_snapshot()
+        self._phase_start = time.monotonic()
+        self._reset_peak()
+
+    def mark(self, phase):
+        """
+        Record the memory use at the end of a phase.
+
+        :param phase: The name of the phase which just ended
+        """
+        if not self.enabled or self._snapshot is None:
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._take_snapshot()
+        top_allocations = [str(stat) for stat in snapshot.compare_to(self._snapshot, 'lineno')[:MemoryProfiler.TOP_COUNT]
+                           if stat.size_diff > 0]
+        now = time.monotonic()
+        self.records.append(PhaseRecord(phase, now - self._phase_start, current, peak, process_rss(), top_allocations))
+
+        self._snapshot = snapshot
+        self._phase_start = now
+        self._reset_peak()
+
+    @property
+    def peak(self):
+        """
+        The highest Python memory use of all recorded phases, in bytes
+        """
+        return max((record.peak for record in self.records), default=0)
+
+    def stop(self):
+        """
+        Stop tracing and write the report.
+
+        :return: The path to the report, or None if none has been written
+        """
+        if not self.enabled or self._snapshot is None:
+            return None
+
+        self._snapshot = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        if not self.log_folder or not self.records:
+            return None
+
+        os.makedirs(self.log_folder, exist_ok=True)
+        path = os.path.join(self.log_folder, '{}_{}_memory.txt'.format(self.name, time.strftime('%Y%m%d_%H%M%S')))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report())
+
+        QgsMessageLog.logMessage(
+            QCoreApplication.translate('QFieldSync', 'Memory profile of {name} written to {path}').format(
+                name=self.name, path=path),
+            'QFieldSync', Qgis.Info)
+        return path
+
+    def report(self):
+        lines = ['Memory profile of {}'.format(self.name), '']
+        for record in self.records:
+            lines.append('{phase}: {seconds:.1f}s, Python {current:.1f} MB (peak {peak:.1f} MB), RSS {rss}'.format(
+                phase=record.phase, seconds=record.seconds, current=record.current / 1024 ** 2,
+                peak=record.peak / 1024 ** 2,
+                rss='{:.1f} MB'.format(record.rss / 1024 ** 2) if record.rss is not None else 'unknown'))
+
+        for record in self.records:
+            if record.top_allocations:
+                lines += ['', 'Top allocations during {}:'.format(record.phase)]
+                lines += ['  ' + allocation for allocation in record.top_allocations]
+
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    @staticmethod
+    def _reset_peak():
+        # only available from Python 3.9 on, before the peak covers the whole run
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
@@ -19,10 +19,15 @@
  ***************************************************************************/
 """
 
+import os
+import zipfile
+
+from xml.etree import ElementTree
+
 from qgis.core import QgsProject
 
 from qfieldsync.utils.file_utils import fileparts, get_project_in_folder
-from qfieldsync.core.project import ProjectConfiguration
+from qfieldsync.core.project import ProjectConfiguration, ProjectProperties
 
 
 def get_project_title(proj):
@@ -41,8 +46,111 @@ def open_project(fn):
 
 
 def import_checksums_of_project(folder):
+    """
+    Return the checksums of the files already imported into the original project of the QField project in folder.
+
+    The project files are only parsed, none of them is opened. Safe to call outside of the main thread.
+    """
     qgs_file = get_project_in_folder(folder)
-    open_project(qgs_file)
-    original_project_path = ProjectConfiguration(QgsProject.instance()).original_project_path
-    open_project(original_project_path)
-    return ProjectConfiguration(QgsProject.instance()).imported_files_checksums
+    original_project_path = read_project_entries(qgs_file).get(ProjectProperties.ORIGINAL_PROJECT_PATH)
+    if not original_project_path:
+        return []
+    return read_imported_files_checksums(original_project_path) or []
+
+
+def read_imported_files_checksums(project_path):
+    """
+    Read the checksums of the files already imported into a project from its file, without loading the project.
+
+    Safe to call outside of the main thread.
+
+    :return: The list of checksums or None if the project is not a .qgs or .qgz file which can be parsed, e.g. a
+             project stored in PostgreSQL. Such projects are read with `load_imported_files_checksums()`.
+    """
+    if not os.path.isfile(project_path):
+        return None
+    try:
+        root = _read_project_root(project_path)
+    except (ElementTree.ParseError, zipfile.BadZipFile):
+        return None
+    if root is None:
+        return None
+    return _read_scope_entries(root, ProjectConfiguration.SCOPE).get(ProjectProperties.IMPORTED_FILES_CHECKSUMS, [])
+
+
+def load_imported_files_checksums(project_path):
+    """
+    Read the checksums of the files already imported into a project by loading it through QGIS, without its layers.
+
+    Must be called on the main thread, the current project is left alone.
+
+    :return: The list of checksums or None if the project could not be loaded
+    """
+    project = QgsProject()
+    if not project.read(project_path, QgsProject.FlagDontResolveLayers):
+        return None
+    return ProjectConfiguration(project).imported_files_checksums or []
+
+
+def read_project_entries(project_file, scope=ProjectConfiguration.SCOPE):
+    """
+    Read the entries of a scope from a .qgs or .qgz file, without loading the project.
+
+    :param project_file: The path to the project file
+    :param scope: The scope of the entries
+    :return: A dict of the entry keys (e.g. '/originalProjectPath') to their values, lists for string lists
+    """
+    root = _read_project_root(project_file)
+    if root is None:
+        return {}
+    return _read_scope_entries(root, scope)
+
+
+def read_project_layers(project_file):
+    """
+    Read the layers of a .qgs or .qgz file, without loading the project.
+
+    :param project_file: The path to the project file
+    :return: A dict of layer ids to layer names
+    """
+    root = _read_project_root(project_file)
+    if root is None:
+        return {}
+
+    layers = {}
+    for layer_element in root.findall('projectlayers/maplayer'):
+        layer_id = layer_element.findtext('id')
+        if layer_id:
+            layers[layer_id] = layer_element.findtext('layername') or layer_id
+    return layers
+
+
+def _read_project_root(project_file):
+    if os.path.splitext(project_file)[1].lower() == '.qgz':
+        with zipfile.ZipFile(project_file) as archive:
+            qgs_names = [name for name in archive.namelist() if name.lower().endswith('.qgs')]
+            if not qgs_names:
+                return None
+            with archive.open(qgs_names[0]) as f:
+                return ElementTree.parse(f).getroot()
+    return ElementTree.parse(project_file).getroot()
+
+
+def _read_scope_entries(root, scope):
+    entries = {}
+    scope_element = root.find('properties/{}'.format(scope))
+    if scope_element is not None:
+        _read_project_entries(scope_element, '', entries)
+    return entries
+
+
+def _read_project_entries(element, prefix, entries):
+    for child in element:
+        key = '{}/{}'.format(prefix, child.tag)
+        entry_type = child.get('type')
+        if entry_type is None:
+            _read_project_entries(child, key, entries)
+        elif entry_type == 'QStringList':
+            entries[key] = [value.text or '' for value in child.findall('value')]
+        else:
+            entries[key] = child.text or ''
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QFieldSync
+                              -------------------
+        begin                : 2020
+        copyright            : (C) 2020 by OPENGIS.ch
+        email                : info@opengis.ch
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from functools import partial
+
+from qgis.PyQt.QtCore import QObject, QEventLoop, pyqtSignal, QCoreApplication
+from qgis.core import QgsApplication, QgsTask
+
+from qfieldsync.utils.exceptions import QFieldSyncError
+
+
+class TaskGroup(QObject):
+    """
+    Runs tasks in parallel in the background, as subtasks of a single QgsTask.
+
+    The tasks are started with `start()` and waited for with `wait()`. While waiting, the
+    event loop keeps running, so QGIS stays responsive. Work which has to happen on the main
+    thread can be done between `start()` and `wait()`, while the tasks are running.
+
+    Tasks reading the project must not see it change while they run, `cancel()` stops them
+    when it does.
+    """
+
+    # The overall progress of the tasks, between 0 and 100
+    progress_changed = pyqtSignal(float)
+
+    def __init__(self, description, parent=None):
+        super(TaskGroup, self).__init__(parent)
+        self.description = description
+        self._tasks = list()
+        # read when the task is added, the task manager deletes finished tasks
+        self._descriptions = list()
+        self._pending = list()
+        self._canceled = False
+        self._results = dict()
+        self._failures = list()
+        self._loop = None
+
+    def add_task(self, task):
+        """
+        Add a task to run, must be called before `start()`.
+
+        :return: A key to look up the result of the task in the list returned by `wait()`
+        """
+        self._tasks.append(task)
+        self._descriptions.append(task.description())
+        return len(self._tasks) - 1
+
+    def add_function(self, description, function, *args, **kwargs):
+        """
+        Add a function to run in a task, it is called with the task as first argument followed by args and kwargs.
+
+        :return: A key to look up the return value of the function in the list returned by `wait()`
+        """
+        return self.add_task(QgsTask.fromFunction(description, function, *args, **kwargs))
+
+    def start(self):
+        parent = QgsTask.fromFunction(self.description, lambda task: True)
+        for key, task in enumerate(self._tasks):
+            task.taskCompleted.connect(partial(self._finished, key, task, True))
+            task.taskTerminated.connect(partial(self._finished, key, task, False))
+            parent.addSubTask(task)
+            self._pending.append(key)
+
+        # the progress of the parent task includes its subtasks
+        parent.progressChanged.connect(self.progress_changed)
+        QgsApplication.taskManager().addTask(parent)
+
+    def wait(self):
+        """
+        Wait until all tasks have finished.
+
+        :return: A list with the return values of the tasks, in the order they have been added
+        :raises: The exception of the first failed task
+        """
+        if self._pending:
+            self._loop = QEventLoop()
+            self._loop.exec_()
+            self._loop = None
+
+        if self._canceled:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', '"{}" has been canceled').format(self.description))
+        for description, exception in self._failures:
+            if exception is not None:
+                raise exception
+        if self._failures:
+            raise QFieldSyncError(
+                QCoreApplication.translate('QFieldSync', 'Task "{}" failed').format(self._failures[0][0]))
+
+        return [self._results.get(key) for key in range(len(self._tasks))]
+
+    def run(self):
+        """
+        Start the tasks and wait until they have finished
+        """
+        self.start()
+        return self.wait()
+
+    def cancel(self, *_):
+        """
+        Ask the running tasks to stop, `wait()` raises a QFieldSyncError once they have.
+
+        Functions run by the tasks have to check `task.isCanceled()`. Accepts and ignores any
+        argument, to be connected to signals directly.
+        """
+        if not self._pending or self._canceled:
+            return
+
+        self._canceled = True
+        for key in self._pending:
+            self._tasks[key].cancel()
+
+    def _finished(self, key, task, succeeded):
+        # the tasks are deleted by the task manager once finished, everything is read now
+        if succeeded:
+            self._results[key] = getattr(task, 'returned_values', None)
+        else:
+            self._failures.append((self._descriptions[key], getattr(task, 'exception', None)))
+
+        self._pending.remove(key)
+        if not self._pending and self._loop is not None:
+            self._loop.quit()